@@ -0,0 +1,59 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from oslo_config import cfg
+from oslo_log import log
+
+from zaqar import bootstrap
+from zaqar.common import cli
+from zaqar.conf import pooling_catalog
+
+LOG = log.getLogger(__name__)
+
+_CLI_OPTIONS = (
+    cfg.StrOpt('queue', required=True,
+               help='Name of the queue to migrate.'),
+    cfg.StrOpt('project',
+               help='Project to which the queue belongs.'),
+    cfg.StrOpt('pool', required=True,
+               help='Name of the pool to migrate the queue to.'),
+)
+
+
+# NOTE: Migrating a queue that is already migrating resumes its migration.
+# API workers resume the migrations when started, unless the management
+# store can't list them, e.g. with Redis.
+@cli.runnable
+def run():
+    # Use the global CONF instance
+    conf = cfg.CONF
+    conf.register_cli_opts(_CLI_OPTIONS)
+    conf(project='zaqar', prog='zaqar-migrate-queue')
+
+    server = bootstrap.Bootstrap(conf)
+    if not conf.pooling:
+        raise RuntimeError('Queues can only be migrated between pools when '
+                           'pooling is enabled.')
+
+    catalog_conf = conf[pooling_catalog.GROUP_NAME]
+
+    def progress(moved, remaining):
+        print('{} messages moved, {} left'.format(moved, remaining))
+
+    LOG.debug('Migrating queue %s to pool %s', conf.queue, conf.pool)
+    server.storage.migration_controller.run(
+        conf.queue, conf.pool, project=conf.project,
+        batch_size=catalog_conf.migration_batch_size,
+        interval=catalog_conf.migration_interval,
+        progress=progress)
+    print('Queue {} migrated to pool {}'.format(conf.queue, conf.pool))
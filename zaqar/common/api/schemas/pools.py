@@ -71,3 +71,19 @@ create = {
     'required': ['uri', 'weight'],
     'additionalProperties': False
 }
+
+migrate = {
+    'type': 'object', 'properties': {
+        'queue': {
+            'type': 'string',
+            'minLength': 1,
+            'maxLength': 64
+        },
+        'project': {
+            'type': ['string', 'null'],
+            'maxLength': 256
+        }
+    },
+    'required': ['queue'],
+    'additionalProperties': False
+}
@@ -34,14 +34,19 @@ def _config_options():
     yield TRUSTEE_CONF_GROUP, trustee_opts
 
 
-def get_trusted_token(trust_id):
-    """Return a Keystone token using the given trust_id."""
+def get_trusted_access(trust_id):
+    """Return the Keystone access info of a token using the given trust_id."""
     auth_plugin = loading.load_auth_from_conf_options(
         cfg.CONF, TRUSTEE_CONF_GROUP, trust_id=trust_id)
 
     trust_session = loading.load_session_from_conf_options(
         cfg.CONF, TRUSTEE_CONF_GROUP, auth=auth_plugin)
-    return trust_session.auth.get_access(trust_session).auth_token
+    return trust_session.auth.get_access(trust_session)
+
+
+def get_trusted_token(trust_id):
+    """Return a Keystone token using the given trust_id."""
+    return get_trusted_access(trust_id).auth_token
 
 
 def _get_admin_session(conf_group):
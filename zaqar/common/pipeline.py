@@ -27,9 +27,16 @@ that is not None.
 
 At least one of the stages has to implement the calling method. If none of
 them do, an AttributeError exception will be raised.
+
+Stages may also register post-commit hooks by implementing `after_<method>`.
+Once the pipeline has been consumed without errors, every hook is called with
+the result followed by the arguments of the original call. Hooks run in stage
+order, their return values are ignored and their errors are logged rather than
+raised, since the call they follow has already completed.
 """
 
 import contextlib
+import time
 
 from oslo_log import log as logging
 
@@ -40,21 +47,55 @@ LOG = logging.getLogger(__name__)
 
 
 class Pipeline:
+    """Chains stages together and dispatches calls through them.
+
+    :param pipeline: Ordered stages to consume.
+    :param timer: Optional callable invoked after every stage call
+        as ``timer(stage, method, elapsed)``, where `elapsed` is the
+        time spent in the stage, in seconds.
+    """
 
-    def __init__(self, pipeline=None):
+    def __init__(self, pipeline=None, timer=None):
         self._pipeline = pipeline and list(pipeline) or []
+        self._timer = timer
+
+    @property
+    def stages(self):
+        """The stages of the pipeline, in order."""
+        return tuple(self._pipeline)
 
     @decorators.memoized_getattr
     def __getattr__(self, name):
         with self.consumer_for(name) as consumer:
             return consumer
 
+    def _targets_for(self, method):
+        """Returns the (stage, callable) pairs implementing `method`."""
+        targets = []
+
+        for stage in self._pipeline:
+            try:
+                targets.append((stage, getattr(stage, method)))
+            except AttributeError:
+                msgtmpl = _("Stage %(stage)s does not "
+                            "implement %(method)s")
+                LOG.debug(msgtmpl, {'stage': str(stage), 'method': method})
+
+        return targets
+
+    def _hooks_for(self, method):
+        """Returns the post-commit hooks registered for `method`."""
+        name = 'after_' + method
+        return [getattr(stage, name) for stage in self._pipeline
+                if hasattr(stage, name)]
+
     @contextlib.contextmanager
     def consumer_for(self, method):
         """Creates a closure for `method`
 
         This method creates a closure to consume the pipeline
-        for `method`.
+        for `method`. The stages implementing `method` are
+        looked up once, when the closure is created.
 
         :params method: The method name to call on each stage
         :type method: `str`
@@ -62,14 +103,18 @@ class Pipeline:
         :returns: A callable to consume the pipeline.
         """
 
+        targets = self._targets_for(method)
+        hooks = self._hooks_for(method)
+        timer = self._timer
+
         def consumer(*args, **kwargs):
             """Consumes the pipeline for `method`
 
-            This function walks through the pipeline and calls
-            `method` for each of the items in the pipeline. A
-            warning will be logged for each stage not implementing
-            `method` and an Attribute error will be raised if
-            none of the stages do.
+            This function walks through the stages implementing
+            `method` and calls each of them in order, then runs
+            the post-commit hooks registered for `method`. An
+            AttributeError will be raised if none of the stages
+            implement `method`.
 
             :param args: Positional arguments to pass to the call.
             :param kwargs: Keyword arguments to pass to the call.
@@ -80,35 +125,35 @@ class Pipeline:
             # the requested method exists in at least
             # one of the stages, otherwise AttributeError
             # will be raised.
-            target = None
-            result = None
-
-            for stage in self._pipeline:
-                try:
-                    target = getattr(stage, method)
-                except AttributeError:
-                    sstage = str(stage)
-                    msgtmpl = _("Stage %(stage)s does not "
-                                "implement %(method)s")
-                    LOG.debug(msgtmpl, {'stage': sstage, 'method': method})
-                    continue
-
-                tmp = target(*args, **kwargs)
+            if not targets:
+                msg = _('Method %s not found in any of '
+                        'the registered stages') % method
+                LOG.error(msg)
+                raise AttributeError(msg)
 
-                # NOTE(flaper87): preserve the last, not None, result
-                if tmp is not None:
-                    result = tmp
+            for stage, target in targets:
+                if timer is None:
+                    result = target(*args, **kwargs)
+                else:
+                    started = time.monotonic()
+                    try:
+                        result = target(*args, **kwargs)
+                    finally:
+                        timer(stage, method, time.monotonic() - started)
 
                 # NOTE(flaper87): Will keep going forward
                 # through the stageline unless the call returns
                 # something.
                 if result is not None:
-                    return result
+                    break
 
-            if target is None:
-                msg = _('Method %s not found in any of '
-                        'the registered stages') % method
-                LOG.error(msg)
-                raise AttributeError(msg)
+            for hook in hooks:
+                try:
+                    hook(result, *args, **kwargs)
+                except Exception:
+                    LOG.exception('Post-commit hook %(hook)s failed',
+                                  {'hook': hook})
+
+            return result
 
         yield consumer
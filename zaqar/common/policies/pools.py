@@ -72,6 +72,43 @@ rules = [
                 'method': 'PATCH'
             }
         ]
+    ),
+    policy.DocumentedRuleDefault(
+        name=POOLS % 'migrate',
+        check_str=base.ROLE_ADMIN,
+        description='Migrate a queue to a pool.',
+        operations=[
+            {
+                'path': '/v2/pools/{pool_name}/migrations',
+                'method': 'POST'
+            }
+        ]
+    ),
+    policy.DocumentedRuleDefault(
+        name=POOLS % 'get_migration',
+        check_str=base.ROLE_ADMIN,
+        description='Shows the progress of the migration of a queue.',
+        operations=[
+            {
+                'path': '/v2/pools/{pool_name}/migrations',
+                'method': 'GET'
+            }
+        ]
+    ),
+    policy.DocumentedRuleDefault(
+        name=POOLS % 'get_stats',
+        check_str=base.ROLE_ADMIN,
+        description='Shows the queues and messages held by pools.',
+        operations=[
+            {
+                'path': '/v2/pools/{pool_name}/stats',
+                'method': 'GET'
+            },
+            {
+                'path': '/v2/pools?stats=true',
+                'method': 'GET'
+            }
+        ]
     )
 ]
 
@@ -56,3 +56,104 @@ def weighted(objs, key='weight', generator=random.randint):
         if lower <= selector < upper:
             return obj
         lower = upper
+
+
+def static_weighted(objs, headroom=None, key='weight',
+                    generator=random.randint, load=None):
+    """Perform a weighted select given a list of objects.
+
+    This is the `weighted` selection, with the signature expected from
+    the pool selectors: the observed headroom and load of each object are
+    ignored.
+
+    :param objs: a list of objects containing at least the field `key`
+    :type objs: [dict]
+    :param headroom: ignored
+    :param key: the field in each obj that corresponds to weight
+    :type key: str
+    :param generator: a number generator taking two ints
+    :type generator: function(int, int) -> int
+    :param load: ignored
+    :return: an object
+    :rtype: dict
+    """
+    return weighted(objs, key=key, generator=generator)
+
+
+def health_weighted(objs, headroom, key='weight', generator=random.randint,
+                    scale=100, load=None):
+    """Perform a weighted select, scaling weights by the observed headroom.
+
+    Each weight is multiplied by the headroom of its object, a factor
+    between 0 and 1 telling how much of its capacity is left, e.g.
+    derived from the observed success rate and latency of a pool. Objects
+    with a positive weight always keep a minimal share, so that they keep
+    getting enough traffic to notice their recovery.
+
+    :param objs: a list of objects containing at least the field `key`
+    :type objs: [dict]
+    :param headroom: a function returning the headroom of an object
+    :type headroom: function(dict) -> float
+    :param key: the field in each obj that corresponds to weight
+    :type key: str
+    :param generator: a number generator taking two ints
+    :type generator: function(int, int) -> int
+    :param scale: precision of the scaled weights
+    :type scale: int
+    :param load: ignored
+    :return: an object
+    :rtype: dict
+    """
+    scaled = []
+    for o in objs:
+        if o[key] <= 0:
+            continue
+        factor = min(max(headroom(o), 0.0), 1.0)
+        scaled.append({'obj': o,
+                       'weight': max(int(o[key] * scale * factor), 1)})
+
+    selected = weighted(scaled, generator=generator)
+    return selected and selected['obj']
+
+
+def least_loaded(objs, headroom, key='weight', generator=random.randint,
+                 load=None):
+    """Select the object with the lowest load relative to its capacity.
+
+    The capacity of an object is its weight scaled by its headroom, so
+    that the load is spread in proportion to the weights among healthy
+    objects. Ties are broken at random. Without a `load` function this
+    falls back to a weighted select scaled by the headroom.
+
+    :param objs: a list of objects containing at least the field `key`
+    :type objs: [dict]
+    :param headroom: a function returning the headroom of an object
+    :type headroom: function(dict) -> float
+    :param key: the field in each obj that corresponds to weight
+    :type key: str
+    :param generator: a number generator taking two ints
+    :type generator: function(int, int) -> int
+    :param load: a function returning the load of an object, e.g. the
+        share of the queues and messages it holds
+    :type load: function(dict) -> float
+    :return: an object
+    :rtype: dict
+    """
+    if load is None:
+        return health_weighted(objs, headroom, key=key, generator=generator)
+
+    best = []
+    best_score = None
+    for o in objs:
+        if o[key] <= 0:
+            continue
+        factor = min(max(headroom(o), 0.01), 1.0)
+        score = load(o) / (o[key] * factor)
+        if best_score is None or score < best_score:
+            best, best_score = [o], score
+        elif score == best_score:
+            best.append(o)
+
+    if not best:
+        return None
+    return best[generator(0, len(best) - 1)]
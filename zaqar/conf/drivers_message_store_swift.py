@@ -62,6 +62,36 @@ interface = cfg.StrOpt(
          "discovery.")
 
 
+connection_pool_size = cfg.IntOpt(
+    "connection_pool_size", default=10, min=1,
+    help="Maximum number of idle Swift connections kept open for reuse. "
+         "Concurrent requests beyond this size still get a connection, "
+         "but it is closed once the request completes.")
+
+
+connection_idle_timeout = cfg.IntOpt(
+    "connection_idle_timeout", default=60, min=0,
+    help="Number of seconds an idle pooled Swift connection is kept "
+         "before being closed. Set to 0 to keep idle connections "
+         "indefinitely.")
+
+
+message_fetch_workers = cfg.IntOpt(
+    "message_fetch_workers", default=10, min=1,
+    help="Maximum number of message objects fetched concurrently from "
+         "Swift when listing or claiming messages.")
+
+
+message_container_shards = cfg.IntOpt(
+    "message_container_shards", default=1, min=1,
+    help="Number of containers the messages of each queue are spread "
+         "across, based on a hash of the message ID. Use more than one "
+         "container for queues receiving more updates than a single "
+         "container server can handle. This must not be changed once "
+         "queues hold messages, as existing messages would no longer be "
+         "found.")
+
+
 GROUP_NAME = 'drivers:message_store:swift'
 ALL_OPTS = [
     auth_url,
@@ -72,7 +102,11 @@ ALL_OPTS = [
     user_domain_id,
     user_domain_name,
     region_name,
-    interface
+    interface,
+    connection_pool_size,
+    connection_idle_timeout,
+    message_fetch_workers,
+    message_container_shards,
 ]
 
 
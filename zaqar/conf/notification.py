@@ -54,11 +54,75 @@ smtp_command = cfg.StrOpt(
         '"command_name arg1 arg2".'))
 
 
+smtp_pool_size = cfg.IntOpt(
+    'smtp_pool_size', default=4, min=1,
+    help='The max amount of connections to the email system kept open at '
+         'once. Connections are reused between emails. Only used when '
+         'smtp_mode is set to self_local.')
+
+
+mailto_digest_window = cfg.FloatOpt(
+    'mailto_digest_window', default=0, min=0,
+    help='Time, in seconds, notifications for the same email recipient '
+         'are held for, so that they are sent together as a single email. '
+         'Confirmation emails are always sent on their own. Set to 0 to '
+         'send an email per notification.')
+
+
 max_notifier_workers = cfg.IntOpt(
     'max_notifier_workers', default=10,
     help='The max amount of the notification workers.')
 
 
+max_notifier_workers_per_host = cfg.IntOpt(
+    'max_notifier_workers_per_host', default=4, min=0,
+    help='The max amount of the notification workers delivering to the '
+         'same subscriber host at once. Further notifications for the host '
+         'wait for one of them to finish, so a slow subscriber can\'t hold '
+         'every worker. Set to 0 for no limit.')
+
+
+webhook_timeout = cfg.FloatOpt(
+    'webhook_timeout', default=10, min=0,
+    help='Time, in seconds, to wait for a webhook subscriber to answer a '
+         'notification before giving up on the attempt. Set to 0 to wait '
+         'forever.')
+
+
+subscriber_failure_threshold = cfg.IntOpt(
+    'subscriber_failure_threshold', default=0, min=0,
+    help='Number of notifications to a subscriber failing in a row, once '
+         'all their retries have failed, before notifications for it are '
+         'dropped. A single notification is then let through every '
+         'subscriber_open_interval seconds, and the subscriber gets all of '
+         'them again once one succeeds. Failures are counted by each API '
+         'worker on its own, for the notifications it dispatches. Set to '
+         '0, the default, to never drop notifications.')
+
+
+subscriber_open_interval = cfg.IntOpt(
+    'subscriber_open_interval', default=60, min=1,
+    help='Time, in seconds, notifications for a failing subscriber are '
+         'dropped for before one is let through to probe it.')
+
+
+max_notifier_backlog = cfg.IntOpt(
+    'max_notifier_backlog', default=0, min=0,
+    help='The max amount of posted message batches waiting to be '
+         'dispatched to their subscribers. Notifications of batches '
+         'posted while the backlog is full are dropped. Set to 0 for an '
+         'unbounded backlog.')
+
+
+subscriber_cache_ttl = cfg.IntOpt(
+    'subscriber_cache_ttl', default=60, min=0,
+    help='Time, in seconds, the subscribers of a queue and its retry policy '
+         'are cached for by the notifier. Subscription changes are seen '
+         'right away, while changes to the queue retry policy may take up '
+         'to this long to be applied. Set to 0 to look them up for every '
+         'posted batch.')
+
+
 require_confirmation = cfg.BoolOpt(
     'require_confirmation', default=False,
     help='Whether the http/https/email subscription need to be confirmed '
@@ -115,7 +179,15 @@ ALL_OPTS = [
     smtp_user_name,
     smtp_user_password,
     smtp_command,
+    smtp_pool_size,
+    mailto_digest_window,
     max_notifier_workers,
+    max_notifier_workers_per_host,
+    webhook_timeout,
+    subscriber_failure_threshold,
+    subscriber_open_interval,
+    max_notifier_backlog,
+    subscriber_cache_ttl,
     require_confirmation,
     external_confirmation_url,
     subscription_confirmation_email_template,
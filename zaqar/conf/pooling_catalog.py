@@ -19,9 +19,138 @@ enable_virtual_pool = cfg.BoolOpt(
          'virtual pool.')
 
 
+catalogue_snapshot = cfg.BoolOpt(
+    'catalogue_snapshot', default=True,
+    help='If enabled, each API worker keeps the queue to pool mappings it '
+         'looks up in memory, and keeps them up to date by polling the '
+         'catalogue for changes. Otherwise mappings are cached for a few '
+         'seconds using the configured cache backend. The snapshot is '
+         'only used if the management store keeps track of the catalogue '
+         'changes.')
+
+
+catalogue_refresh_interval = cfg.FloatOpt(
+    'catalogue_refresh_interval', default=1.0, min=0,
+    help='Number of seconds between two polls of the catalogue changes. '
+         'This bounds the delay before a queue registered or removed by '
+         'another worker is seen.')
+
+
+catalogue_snapshot_size = cfg.IntOpt(
+    'catalogue_snapshot_size', default=100000, min=1,
+    help='Maximum number of queue to pool mappings kept in memory by each '
+         'API worker. The oldest mappings are dropped first.')
+
+
+unmapped_queue_cache_ttl = cfg.FloatOpt(
+    'unmapped_queue_cache_ttl', default=2.0, min=0,
+    help='Number of seconds during which each API worker remembers that a '
+         'queue is not in the catalogue, so that requests to unknown or '
+         'misspelled queues do not query the catalogue every time. A queue '
+         'registered meanwhile is found right away by the worker that '
+         'registered it, and by the others once the catalogue snapshot is '
+         'refreshed or the entry expires. Set to 0 to disable.')
+
+
+pool_selector = cfg.StrOpt(
+    'pool_selector', default='weighted',
+    help='Algorithm choosing the pool a new queue is placed on, among the '
+         'pools of its flavor whose circuit is closed. Selectors are '
+         'loaded from the "zaqar.pooling.selectors" namespace. The '
+         'builtin ones are "weighted", which only uses the pool weights, '
+         '"health_weighted", which scales them by the headroom observed '
+         'for each pool, and "least_loaded", which picks the pool holding '
+         'the fewest queues and messages relative to its weight.')
+
+
+pool_occupancy_interval = cfg.FloatOpt(
+    'pool_occupancy_interval', default=60.0, min=1,
+    help='Number of seconds between two samples of the number of queues '
+         'and messages held by each pool, taken in the background by each '
+         'API worker when the "least_loaded" selector is used.')
+
+
+pool_stats_cache_ttl = cfg.FloatOpt(
+    'pool_stats_cache_ttl', default=60.0, min=0,
+    help='Number of seconds during which the stats of a pool, reported by '
+         'the pool stats API, are cached. 0 reads them from the storage '
+         'of the pool on every request.')
+
+
+pool_failure_threshold = cfg.IntOpt(
+    'pool_failure_threshold', default=5, min=1,
+    help='Number of consecutive failed storage calls or probes after which '
+         'a pool is considered down. No new queue is placed on a pool '
+         'that is down.')
+
+
+pool_circuit_reset_timeout = cfg.FloatOpt(
+    'pool_circuit_reset_timeout', default=30.0, min=0,
+    help='Number of seconds a pool that is down is excluded from placement '
+         'before it is probed again.')
+
+
+pool_probe_interval = cfg.FloatOpt(
+    'pool_probe_interval', default=10.0, min=0,
+    help='Number of seconds between two rounds of liveness probes of the '
+         'pools, made in the background by each API worker once it places '
+         'queues. Only the pools the worker has an open storage driver for '
+         'are probed. 0 disables the probes, pools health is then only '
+         'derived from the traffic routed to them.')
+
+
+pool_latency_target = cfg.FloatOpt(
+    'pool_latency_target', default=0.1, min=0.001,
+    help='Storage call latency, in seconds, above which the headroom of a '
+         'pool is considered reduced, in proportion of its observed '
+         'average latency.')
+
+
+migration_batch_size = cfg.IntOpt(
+    'migration_batch_size', default=10, min=1,
+    help='Number of messages moved at once when migrating a queue to '
+         'another pool.')
+
+
+migration_interval = cfg.FloatOpt(
+    'migration_interval', default=1.0, min=0,
+    help='Number of seconds to wait before trying again to move the '
+         'messages of a migrating queue, when the messages left in its '
+         'old pool are all claimed or delayed.')
+
+
+pool_drivers_size = cfg.IntOpt(
+    'pool_drivers_size', default=100, min=1,
+    help='Maximum number of pool storage drivers, and of their connections, '
+         'kept open by each API worker. The least recently used drivers '
+         'are closed first.')
+
+
+pool_drivers_idle_timeout = cfg.FloatOpt(
+    'pool_drivers_idle_timeout', default=600.0, min=0,
+    help='Number of seconds after which the storage driver of a pool that '
+         'wasn\'t used is closed. 0 keeps the drivers open until there are '
+         'too many of them.')
+
+
 GROUP_NAME = 'pooling:catalog'
 ALL_OPTS = [
-    enable_virtual_pool
+    enable_virtual_pool,
+    catalogue_snapshot,
+    catalogue_refresh_interval,
+    catalogue_snapshot_size,
+    unmapped_queue_cache_ttl,
+    pool_selector,
+    pool_occupancy_interval,
+    pool_stats_cache_ttl,
+    pool_failure_threshold,
+    pool_circuit_reset_timeout,
+    pool_probe_interval,
+    pool_latency_target,
+    migration_batch_size,
+    migration_interval,
+    pool_drivers_size,
+    pool_drivers_idle_timeout,
 ]
 
 
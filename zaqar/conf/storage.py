@@ -51,13 +51,22 @@ topic_pipeline = cfg.ListOpt(
            'controller methods.'))
 
 
+stage_latency_threshold = cfg.FloatOpt(
+    'stage_latency_threshold', default=0, min=0,
+    help=_('Time, in seconds, a pipeline stage may spend serving a single '
+           'call before a warning naming the stage and the method is '
+           'logged. No warning is logged when set to 0. The time spent in '
+           'each stage is reported by the health API regardless.'))
+
+
 GROUP_NAME = 'storage'
 ALL_OPTS = [
     queue_pipeline,
     message_pipeline,
     claim_pipeline,
     subscription_pipeline,
-    topic_pipeline
+    topic_pipeline,
+    stage_latency_threshold
 ]
 
 
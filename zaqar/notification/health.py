@@ -0,0 +1,283 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Delivery health of the subscriptions.
+
+The notifier keeps track of the outcome of the deliveries to every
+subscription, and stops delivering to subscribers failing over and over:
+
+* While the circuit of a subscription is closed, every notification is
+  delivered.
+* Once `failure_threshold` notifications in a row have failed, all
+  their retries included, the circuit opens and notifications are
+  dropped.
+* After `open_interval` seconds, the circuit is half-open: a single
+  delivery is let through as a probe. The circuit closes again if it
+  succeeds, and stays open for another `open_interval` otherwise.
+
+Circuits are kept in the memory of each notifier, hence of each API
+worker: a subscriber failing in a worker keeps getting the notifications
+dispatched by the others, until their own circuits open. The health of
+the subscriptions is published to the cache, so the API can report it
+to their owners. It is the health last published by any worker.
+"""
+
+import collections
+import datetime
+import threading
+import time
+
+import msgpack
+from oslo_cache import core
+from oslo_log import log as logging
+
+from zaqar.storage import utils
+
+LOG = logging.getLogger(__name__)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half-open'
+
+# NOTE: Weight of the latest delivery in the rolling latency.
+_LATENCY_WEIGHT = 0.2
+
+# NOTE: The health of a subscription is published whenever its circuit
+# changes, and at least this often, in seconds, otherwise.
+_PUBLISH_INTERVAL = 10
+
+# NOTE: Time, in seconds, the published health of a subscription is
+# reported for after its last delivery.
+_HEALTH_TTL = 24 * 3600
+
+# NOTE: Max number of subscriptions a notifier keeps the health of. The
+# least recently delivered to are forgotten first, their circuit being
+# closed again should they get notifications afterwards.
+_MAX_SUBSCRIPTIONS = 100000
+
+
+def _iso(timestamp):
+    if timestamp is None:
+        return None
+
+    return datetime.datetime.fromtimestamp(
+        timestamp, tz=datetime.UTC).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+class _Health:
+
+    __slots__ = ('state', 'failures', 'opened', 'probed', 'last_success',
+                 'last_failure', 'latency', 'dropped', 'published', 'seen')
+
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.opened = None
+        self.probed = None
+        self.last_success = None
+        self.last_failure = None
+        self.latency = None
+        self.dropped = 0
+        self.published = None
+        self.seen = None
+
+    def to_basic(self):
+        return {
+            'state': self.state,
+            'consecutive_failures': self.failures,
+            'last_success': _iso(self.last_success),
+            'last_failure': _iso(self.last_failure),
+            'latency': self.latency,
+            'dropped': self.dropped,
+        }
+
+
+class Tracker:
+    """Delivery health of a single subscription.
+
+    :param health: `SubscriberHealth` the subscription belongs to.
+    :param subscription_id: ID of the subscription.
+    """
+
+    __slots__ = ('_health', '_subscription_id')
+
+    def __init__(self, health, subscription_id):
+        self._health = health
+        self._subscription_id = subscription_id
+
+    def allow(self):
+        """Returns whether a delivery to the subscription may be made."""
+        return self._health.allow(self._subscription_id)
+
+    def record(self, success, latency=None):
+        """Records the outcome of a delivery to the subscription."""
+        self._health.record(self._subscription_id, success, latency)
+
+
+class SubscriberHealth:
+    """Tracks the deliveries to subscriptions, and breaks their circuit.
+
+    :param cache: Cache the health of the subscriptions is published
+        to, or None not to publish it.
+    :param failure_threshold: Deliveries failing in a row before the
+        circuit of a subscription opens, 0 to never open it.
+    :param open_interval: Time, in seconds, the circuit of a
+        subscription stays open before a delivery is let through.
+    :param max_subscriptions: Max number of subscriptions the health is
+        kept of.
+
+    Subscriptions no notification was delivered to, or dropped for, in
+    the last `_HEALTH_TTL` seconds are forgotten.
+    """
+
+    def __init__(self, cache=None, failure_threshold=0, open_interval=60,
+                 max_subscriptions=_MAX_SUBSCRIPTIONS):
+        self._cache = cache
+        self._failure_threshold = failure_threshold
+        self._open_interval = open_interval
+        self._max_subscriptions = max_subscriptions
+        # NOTE: Ordered from the least recently seen subscription.
+        self._subscriptions = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def tracker(self, subscription_id):
+        """Returns the `Tracker` of a subscription."""
+        return Tracker(self, subscription_id)
+
+    def allow(self, subscription_id):
+        """Returns whether a delivery to a subscription may be made.
+
+        Deliveries are dropped while the circuit of the subscription is
+        open. Once it has been open for `open_interval` seconds, a
+        single delivery is allowed, the following ones being dropped
+        until its outcome is recorded.
+        """
+        with self._lock:
+            health = self._subscriptions.get(subscription_id)
+            if health is None or health.state == CLOSED:
+                return True
+
+            now = time.time()
+            self._seen(subscription_id, health, now)
+            if (health.state == OPEN and
+                    now - health.opened >= self._open_interval):
+                health.state = HALF_OPEN
+                health.probed = None
+
+            # NOTE: Let another probe through if the outcome of the
+            # previous one never got recorded.
+            if health.state == HALF_OPEN and (
+                    health.probed is None or
+                    now - health.probed >= self._open_interval):
+                health.probed = now
+                return True
+
+            health.dropped += 1
+
+        LOG.debug('Dropped a notification for the unhealthy subscription '
+                  '%s', subscription_id)
+        return False
+
+    def record(self, subscription_id, success, latency=None):
+        """Records the outcome of a delivery to a subscription.
+
+        :param subscription_id: ID of the subscription.
+        :param success: Whether the delivery succeeded.
+        :param latency: Time, in seconds, the delivery took.
+        """
+        now = time.time()
+        with self._lock:
+            health = self._subscriptions.get(subscription_id)
+            if health is None:
+                health = self._subscriptions[subscription_id] = _Health()
+            self._seen(subscription_id, health, now)
+            state = health.state
+
+            if latency is not None:
+                health.latency = (latency if health.latency is None else
+                                  (1 - _LATENCY_WEIGHT) * health.latency +
+                                  _LATENCY_WEIGHT * latency)
+
+            if success:
+                health.state = CLOSED
+                health.failures = 0
+                health.last_success = now
+            else:
+                health.failures += 1
+                health.last_failure = now
+                if health.state == HALF_OPEN or (
+                        self._failure_threshold and
+                        health.failures >= self._failure_threshold):
+                    health.state = OPEN
+                    health.opened = now
+            health.probed = None
+
+            changed = state != health.state
+            if not changed and health.published is not None and (
+                    now - health.published < _PUBLISH_INTERVAL):
+                return
+            health.published = now
+            basic = health.to_basic()
+
+        if changed:
+            LOG.info('The circuit of subscription %(id)s is now %(state)s',
+                     {'id': subscription_id, 'state': basic['state']})
+        self._publish(subscription_id, basic)
+
+    def get(self, subscription_id):
+        """Returns the health of a subscription, None if unknown."""
+        with self._lock:
+            health = self._subscriptions.get(subscription_id)
+            return health and health.to_basic()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._subscriptions)
+
+    def _seen(self, subscription_id, health, now):
+        # NOTE: Called with the lock held.
+        health.seen = now
+        self._subscriptions.move_to_end(subscription_id)
+
+        while self._subscriptions:
+            oldest = next(iter(self._subscriptions.values()))
+            if (len(self._subscriptions) <= self._max_subscriptions and
+                    now - oldest.seen < _HEALTH_TTL):
+                break
+            self._subscriptions.popitem(last=False)
+
+    def _publish(self, subscription_id, basic):
+        if self._cache is None:
+            return
+
+        try:
+            self._cache.set(utils.subscription_health_cache_key(
+                subscription_id), msgpack.packb(basic, use_bin_type=True))
+        except Exception:
+            LOG.exception('Failed to publish the health of subscription %s',
+                          subscription_id)
+
+
+def get_published(cache, subscription_id):
+    """Returns the health of a subscription published to the cache.
+
+    :param cache: Cache the health of the subscriptions is published to.
+    :param subscription_id: ID of the subscription.
+    :returns: The health of the subscription, or None if it isn't known.
+    :rtype: dict
+    """
+    packed = cache.get(utils.subscription_health_cache_key(subscription_id),
+                       expiration_time=_HEALTH_TTL)
+    if packed is core.NO_VALUE:
+        return None
+
+    return msgpack.unpackb(packed)
@@ -13,16 +13,27 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
 import enum
+import functools
+import threading
+import time
+
 from stevedore import driver
 
 import futurist
+from futurist import rejection
+import msgpack
+from oslo_cache import core
 from oslo_log import log as logging
+from oslo_serialization import jsonutils
 from urllib import parse as urllib_parse
 
 from zaqar.common import auth
 from zaqar.common import urls
+from zaqar.notification import health
 from zaqar.storage import pooling
+from zaqar.storage import utils
 
 LOG = logging.getLogger(__name__)
 
@@ -35,6 +46,189 @@ class MessageType(enum.IntEnum):
     Notification = 3
 
 
+class TaskRegistry:
+    """Notification task plugins, loaded once per subscriber scheme.
+
+    A single instance of each is shared by every subscriber using its
+    scheme, so tasks must be safe to call from several workers at once.
+    """
+
+    def __init__(self, namespace='zaqar.notification.tasks'):
+        self._namespace = namespace
+        self._tasks = {}
+        self._lock = threading.Lock()
+
+    def get(self, scheme):
+        """Returns the task delivering to subscribers of `scheme`.
+
+        :raises RuntimeError: if no task is registered for `scheme`
+        """
+        try:
+            return self._tasks[scheme]
+        except KeyError:
+            pass
+
+        with self._lock:
+            task = self._tasks.get(scheme)
+            if task is None:
+                mgr = driver.DriverManager(self._namespace, scheme,
+                                           invoke_on_load=True)
+                task = self._tasks[scheme] = mgr.driver
+            return task
+
+    def loaded(self):
+        """Returns the tasks loaded so far, by scheme."""
+        with self._lock:
+            return dict(self._tasks)
+
+    def reload(self):
+        """Forgets the loaded tasks, so they are loaded again when used."""
+        with self._lock:
+            self._tasks = {}
+
+
+registry = TaskRegistry()
+
+
+class LocalChannels:
+    """Subscribers served by this very process, notified from memory.
+
+    A transport serving subscribers itself, e.g. the websocket one,
+    registers the prefix of their subscriber URLs along with a channel.
+    Notifications for these subscribers are handed over to the channel,
+    instead of being posted to their URL over loopback.
+
+    Channels implement `publish(subscriber_ids, serialized)`, given the
+    IDs following the prefix in the subscriber URLs, and the notifications
+    serialized in JSON.
+    """
+
+    def __init__(self):
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def register(self, prefix, channel):
+        """Hands notifications for URLs starting with `prefix` to `channel`."""
+        with self._lock:
+            channels = dict(self._channels)
+            channels[prefix] = channel
+            self._channels = channels
+
+    def unregister(self, prefix):
+        """Posts notifications for URLs starting with `prefix` again."""
+        with self._lock:
+            channels = dict(self._channels)
+            channels.pop(prefix, None)
+            self._channels = channels
+
+    def lookup(self, subscriber):
+        """Returns the channel of a subscriber URL, and its ID there.
+
+        :returns: The channel and the ID of the subscriber, or
+            (None, None) if the subscriber isn't served by this process.
+        """
+        for prefix, channel in self._channels.items():
+            if subscriber.startswith(prefix):
+                return channel, subscriber[len(prefix):]
+        return None, None
+
+
+channels = LocalChannels()
+
+
+class Deliveries:
+    """Runs deliveries on an executor, a few at once per subscriber host.
+
+    Deliveries to a host already served by `limit` workers wait for one
+    of them to finish, instead of taking the remaining workers, so a
+    slow subscriber can't hold up the notifications of every other one.
+    The throughput and latency of the deliveries are kept as well, see
+    `stats`.
+
+    :param executor: Executor running the deliveries.
+    :param limit: Max deliveries running at once per host, 0 for
+        no limit. Deliveries without a host, e.g. emails, aren't limited.
+    """
+
+    def __init__(self, executor, limit=0):
+        self._executor = executor
+        self._limit = limit
+        self._lock = threading.Lock()
+        self._running = collections.Counter()
+        self._pending = collections.defaultdict(collections.deque)
+        self._started = time.monotonic()
+        self._delivered = 0
+        self._failed = 0
+        self._latency = 0.0
+        self._max_latency = 0.0
+
+    def submit(self, host, fn, *args, **kwargs):
+        """Runs `fn` with the given arguments to deliver to `host`."""
+        with self._lock:
+            if (self._limit and host and
+                    self._running[host] >= self._limit):
+                self._pending[host].append((fn, args, kwargs))
+                return
+            self._running[host] += 1
+
+        self._start(host, fn, args, kwargs)
+
+    def _start(self, host, fn, args, kwargs):
+        future = self._executor.submit(self._deliver, fn, *args, **kwargs)
+        future.add_done_callback(functools.partial(self._done, host))
+
+    def _deliver(self, fn, *args, **kwargs):
+        started = time.monotonic()
+        failed = False
+        try:
+            fn(*args, **kwargs)
+        except Exception:
+            LOG.exception('Notification delivery failed')
+            failed = True
+        elapsed = time.monotonic() - started
+
+        with self._lock:
+            self._delivered += 1
+            self._failed += failed
+            self._latency += elapsed
+            self._max_latency = max(self._max_latency, elapsed)
+
+    def _done(self, host, future):
+        with self._lock:
+            pending = self._pending.get(host)
+            if not pending:
+                self._pending.pop(host, None)
+                self._running[host] -= 1
+                if not self._running[host]:
+                    del self._running[host]
+                return
+            fn, args, kwargs = pending.popleft()
+
+        self._start(host, fn, args, kwargs)
+
+    def stats(self):
+        """Returns the throughput and latency of the deliveries.
+
+        :returns: The amount of deliveries done, failed, running and
+            pending, the deliveries done per second since the start,
+            and their average and maximum duration, in seconds.
+        :rtype: dict
+        """
+        with self._lock:
+            delivered = self._delivered
+            return {
+                'delivered': delivered,
+                'failed': self._failed,
+                'running': sum(self._running.values()),
+                'pending': sum(len(p) for p in self._pending.values()),
+                'throughput': delivered / (time.monotonic() - self._started),
+                'latency': {
+                    'avg': delivered and self._latency / delivered,
+                    'max': self._max_latency,
+                },
+            }
+
+
 class NotifierDriver:
     """Notifier which is responsible for sending messages to subscribers.
 
@@ -44,44 +238,131 @@ class NotifierDriver:
         self.subscription_controller = kwargs.get('subscription_controller')
         max_workers = kwargs.get('max_notifier_workers', 10)
         self.executor = futurist.ThreadPoolExecutor(max_workers=max_workers)
+        self.deliveries = Deliveries(
+            self.executor, kwargs.get('max_notifier_workers_per_host', 0))
+        max_backlog = kwargs.get('max_notifier_backlog', 0)
+        reject = max_backlog and rejection.reject_when_reached(max_backlog)
+        self.dispatcher = futurist.ThreadPoolExecutor(
+            max_workers=max_workers, check_and_reject=reject or None)
         self.require_confirmation = kwargs.get('require_confirmation', False)
         self.queue_controller = kwargs.get('queue_controller')
+        self.cache = kwargs.get('cache')
+        self.subscriber_cache_ttl = kwargs.get('subscriber_cache_ttl', 0)
+        self.mailto_digest_window = kwargs.get('mailto_digest_window', 0)
+        self.health = health.SubscriberHealth(
+            self.cache, kwargs.get('subscriber_failure_threshold', 0),
+            kwargs.get('subscriber_open_interval', 60))
+
+    def close(self):
+        """Stops the dispatcher, then the deliveries it handed over."""
+        self.dispatcher.shutdown()
+        self.executor.shutdown()
+
+    def after_post(self, message_ids, queue_name, messages, client_uuid,
+                   project=None):
+        """Notify the subscribers once messages have been stored.
+
+        This is a post-commit hook of the message pipeline. The
+        subscribers are looked up and notified by the dispatcher, so
+        producers never wait on it. Notifications are dropped, and a
+        warning logged, when the dispatcher backlog is full.
+        """
+        if not message_ids:
+            return
 
-    def post(self, queue_name, messages, client_uuid, project=None):
+        try:
+            self.dispatcher.submit(self.notify, queue_name, messages,
+                                   client_uuid, project=project)
+        except futurist.RejectedSubmission:
+            LOG.warning('Notification backlog is full, messages %(ids)s '
+                        'posted to queue %(queue)s will not be notified.',
+                        {'ids': message_ids, 'queue': queue_name})
+
+    def notify(self, queue_name, messages, client_uuid, project=None):
         """Send messages to the subscribers."""
         if self.subscription_controller:
             if not isinstance(self.subscription_controller,
                               pooling.SubscriptionController):
-                marker = None
-                queue_metadata = self.queue_controller.get(queue_name,
-                                                           project)
-                retry_policy = queue_metadata.get('_retry_policy', {})
-                while True:
-                    subscribers = self.subscription_controller.list(
-                        queue_name, project, marker=marker)
-                    for sub in next(subscribers):
-                        LOG.debug("Notifying subscriber %r", (sub,))
-                        s_type = urllib_parse.urlparse(
-                            sub['subscriber']).scheme
-                        # If the subscriber doesn't contain 'confirmed', it
-                        # means that this kind of subscriber was created before
-                        # the confirm feature be introduced into Zaqar. We
-                        # should allow them be subscribed.
-                        if (self.require_confirmation and
-                                not sub.get('confirmed', True)):
-                            LOG.info('The subscriber %s is not '
-                                     'confirmed.', sub['subscriber'])
-                            continue
-                        for msg in messages:
-                            msg['Message_Type'] = MessageType.Notification.name
-                        self._execute(s_type, sub, messages,
-                                      retry_policy=retry_policy)
-                    marker = next(subscribers)
-                    if not marker:
-                        break
+                retry_policy, subscribers = self._subscribers(queue_name,
+                                                              project)
+                if not subscribers:
+                    return
+
+                # NOTE: Every subscriber gets the same notifications, so
+                # serialize them once for the whole batch.
+                for msg in messages:
+                    msg['Message_Type'] = MessageType.Notification.name
+                    msg['queue_name'] = queue_name
+                serialized = [jsonutils.dumps(msg) for msg in messages]
+
+                local = collections.defaultdict(list)
+                for s_type, sub in subscribers:
+                    if 'id' in sub and not self.health.allow(sub['id']):
+                        continue
+                    channel, subscriber_id = channels.lookup(
+                        sub['subscriber'])
+                    if channel is not None:
+                        local[channel].append(subscriber_id)
+                        continue
+                    LOG.debug("Notifying subscriber %r", (sub,))
+                    self._execute(s_type, sub, messages,
+                                  retry_policy=retry_policy,
+                                  serialized=serialized)
+
+                for channel, subscriber_ids in local.items():
+                    try:
+                        channel.publish(subscriber_ids, serialized)
+                    except Exception:
+                        LOG.exception('Failed to notify local subscribers '
+                                      '%s', subscriber_ids)
         else:
             LOG.error('Failed to get subscription controller.')
 
+    def _subscribers(self, queue_name, project=None):
+        """Returns the retry policy and the subscribers of a queue.
+
+        The result is cached for `subscriber_cache_ttl` seconds, and
+        forgotten whenever a subscription of the queue changes.
+        """
+        if self.cache is None or not self.subscriber_cache_ttl:
+            return self._load_subscribers(queue_name, project)
+
+        key = utils.subscribers_cache_key(queue_name, project)
+        packed = self.cache.get(key, expiration_time=self.subscriber_cache_ttl)
+        if packed is not core.NO_VALUE:
+            return msgpack.unpackb(packed)
+
+        snapshot = self._load_subscribers(queue_name, project)
+        self.cache.set(key, msgpack.packb(snapshot, use_bin_type=True))
+        return snapshot
+
+    def _load_subscribers(self, queue_name, project=None):
+        queue_metadata = self.queue_controller.get(queue_name, project)
+        retry_policy = queue_metadata.get('_retry_policy', {})
+
+        subscribers = []
+        marker = None
+        while True:
+            pages = self.subscription_controller.list(
+                queue_name, project, marker=marker)
+            for sub in next(pages):
+                # If the subscriber doesn't contain 'confirmed', it
+                # means that this kind of subscriber was created before
+                # the confirm feature be introduced into Zaqar. We
+                # should allow them be subscribed.
+                if (self.require_confirmation and
+                        not sub.get('confirmed', True)):
+                    LOG.info('The subscriber %s is not '
+                             'confirmed.', sub['subscriber'])
+                    continue
+                s_type = urllib_parse.urlparse(sub['subscriber']).scheme
+                subscribers.append([s_type, sub])
+            marker = next(pages)
+            if not marker:
+                break
+
+        return [retry_policy, subscribers]
+
     def send_confirm_notification(self, queue, subscription, conf,
                                   project=None, expires=None,
                                   api_version=None, is_unsubscribed=False):
@@ -143,14 +424,32 @@ class NotifierDriver:
         self._execute(s_type, subscription, [messages], conf)
 
     def _execute(self, s_type, subscription, messages, conf=None,
-                 retry_policy=None):
+                 retry_policy=None, serialized=None):
         if self.subscription_controller:
             data_driver = self.subscription_controller.driver
             conf = data_driver.conf
         else:
             conf = conf
-        mgr = driver.DriverManager('zaqar.notification.tasks',
-                                   s_type,
-                                   invoke_on_load=True)
-        self.executor.submit(mgr.driver.execute, subscription, messages,
-                             conf=conf, queue_retry_policy=retry_policy)
+        task = registry.get(s_type)
+        host = urllib_parse.urlparse(subscription['subscriber']).netloc
+        self.deliveries.submit(host, task.execute, subscription, messages,
+                               conf=conf, queue_retry_policy=retry_policy,
+                               serialized=serialized, health=self.health,
+                               deliveries=self.deliveries,
+                               mailto_digest_window=self.mailto_digest_window)
+
+    def delivery_stats(self):
+        """Returns the throughput and latency of the notifications.
+
+        Tasks reporting stats of their own, e.g. the emails sent, have
+        them added under their scheme.
+        """
+        stats = self.deliveries.stats()
+        for scheme, task in registry.loaded().items():
+            if hasattr(task, 'stats'):
+                stats[scheme] = task.stats()
+        return stats
+
+    def subscription_health(self, subscription_id):
+        """Returns the delivery health of a subscription."""
+        return self.health.get(subscription_id)
@@ -0,0 +1,100 @@
+# Licensed under the Apache License, Version 2.0 (the "License"); you may
+# not use this file except in compliance with the License. You may obtain
+# a copy of the License at
+#
+#      http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+# WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+# License for the specific language governing permissions and limitations
+# under the License.
+
+"""Delayed work of the notification tasks.
+
+Webhook retries, batches waiting for more notifications and email
+digests are all run later rather than waited for. They share a single
+scheduler per process, see `get_scheduler`.
+"""
+
+import heapq
+import itertools
+import threading
+import time
+
+import futurist
+from oslo_log import log as logging
+
+LOG = logging.getLogger(__name__)
+
+
+class Scheduler:
+    """Runs functions once they are due.
+
+    Calls are kept in a heap ordered by the time they are due at. A
+    single thread waits for the earliest one and hands it over to the
+    executor, so no thread is held sleeping between two calls.
+
+    :param executor: Executor running the calls.
+    """
+
+    def __init__(self, executor):
+        self._executor = executor
+        self._heap = []
+        self._counter = itertools.count()
+        self._cond = threading.Condition()
+        self._thread = None
+
+    def __len__(self):
+        with self._cond:
+            return len(self._heap)
+
+    def schedule(self, delay, fn, *args):
+        """Calls `fn` with `args` in `delay` seconds."""
+        due = time.monotonic() + delay
+        with self._cond:
+            heapq.heappush(self._heap, (due, next(self._counter), fn, args))
+            self._cond.notify()
+
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='zaqar-notification-scheduler',
+                    daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while True:
+                    now = time.monotonic()
+                    if self._heap and self._heap[0][0] <= now:
+                        break
+                    self._cond.wait(self._heap[0][0] - now
+                                    if self._heap else None)
+                _, _, fn, args = heapq.heappop(self._heap)
+
+            try:
+                self._executor.submit(fn, *args)
+            except Exception:
+                LOG.exception('Failed to run a scheduled notification task')
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler(conf=None):
+    """Returns the scheduler shared by the notification tasks.
+
+    :param conf: Configuration the size of the executor is read from,
+        when the scheduler is first built.
+    """
+    global _scheduler
+
+    with _scheduler_lock:
+        if _scheduler is None:
+            max_workers = (conf.notification.max_notifier_workers
+                           if conf is not None else None)
+            executor = futurist.ThreadPoolExecutor(max_workers=max_workers)
+            _scheduler = Scheduler(executor)
+        return _scheduler
@@ -15,20 +15,114 @@
 
 from email.mime import text
 import smtplib
+import threading
 from urllib import parse as urllib_parse
 
 from oslo_concurrency import processutils
 from oslo_log import log as logging
 from oslo_serialization import jsonutils
+from oslo_utils import timeutils
 
 from zaqar.i18n import _
 from zaqar.notification.notifier import MessageType
+from zaqar.notification import scheduling
 
 LOG = logging.getLogger(__name__)
 
 
+class SMTPPool:
+    """Pool of connections logged in to an SMTP server.
+
+    Connections are kept open between emails, saving the handshake and
+    login of a new connection for each of them. A connection closed by
+    the server while idle is replaced on its next use.
+
+    :param host: Host of the SMTP server.
+    :param port: Port of the SMTP server.
+    :param user_name: User name to log in with.
+    :param password: Password to log in with.
+    :param size: Max amount of connections open at once.
+    """
+
+    def __init__(self, host, port, user_name, password, size=1):
+        self._host = host
+        self._port = port
+        self._user_name = user_name
+        self._password = password
+        self._slots = threading.BoundedSemaphore(size)
+        self._idle = []
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        sender = smtplib.SMTP_SSL(self._host, self._port)
+        sender.set_debuglevel(1)
+
+        try:
+            sender.ehlo(self._host)
+            sender.login(self._user_name, self._password)
+        except smtplib.SMTPException:
+            LOG.error("Failed to connect to the SMTP service")
+            sender.close()
+            raise
+        return sender
+
+    def sendmail(self, from_addr, to_addrs, msg):
+        """Sends an email over one of the connections of the pool."""
+        with self._slots:
+            with self._lock:
+                sender = self._idle.pop() if self._idle else None
+
+            if sender is not None:
+                try:
+                    return self._send(sender, from_addr, to_addrs, msg)
+                except smtplib.SMTPServerDisconnected:
+                    # NOTE: The server closed the connection while it was
+                    # idle, send the email over a new one.
+                    pass
+
+            self._send(self._connect(), from_addr, to_addrs, msg)
+
+    def _send(self, sender, from_addr, to_addrs, msg):
+        # NOTE: Only connections which are still open go back to the
+        # pool, the others are closed.
+        try:
+            sender.sendmail(from_addr, to_addrs, msg)
+        except (smtplib.SMTPRecipientsRefused,
+                smtplib.SMTPResponseException):
+            # NOTE: The server refused the email, the connection
+            # itself is still fine.
+            self._release(sender)
+            raise
+        except Exception:
+            sender.close()
+            raise
+        self._release(sender)
+
+    def _release(self, sender):
+        with self._lock:
+            self._idle.append(sender)
+
+    def close(self):
+        """Closes the idle connections."""
+        with self._lock:
+            idle, self._idle = self._idle, []
+
+        for sender in idle:
+            try:
+                sender.quit()
+            except smtplib.SMTPException:
+                sender.close()
+
+
 class MailtoTask:
 
+    def __init__(self):
+        self._pool = None
+        self._pending = {}
+        self._stats = {'sent': 0, 'failed': 0, 'digests': 0,
+                       'last_success': None, 'last_failure': None}
+        self._lock = threading.Lock()
+
     def _make_confirm_string(self, conf_n, message, queue_name):
         confirm_url = conf_n.external_confirmation_url
         if confirm_url is None:
@@ -65,9 +159,13 @@ class MailtoTask:
         subscriber = urllib_parse.urlparse(subscription['subscriber'])
         params = urllib_parse.parse_qs(subscriber.query)
         params = {k.lower(): v for k, v in params.items()}
-        conf_n = kwargs.get('conf').notification
+        conf = kwargs.get('conf')
+        conf_n = conf.notification
+        serialized = kwargs.get('serialized')
+        digest_window = kwargs.get('mailto_digest_window', 0)
+        digest = []
         try:
-            for message in messages:
+            for i, message in enumerate(messages):
                 # Send confirmation email to subscriber.
                 if (message.get('Message_Type') ==
                         MessageType.SubscriptionConfirmation.name):
@@ -88,37 +186,116 @@ class MailtoTask:
                     msg["from"] = content['sender']
                     msg["subject"] = content['topic']
                 else:
-                    # NOTE(Eva-i): Unfortunately this will add 'queue_name' key
-                    # to our original messages(dicts) which will be later
-                    # consumed in the storage controller. It seems safe though.
-                    message['queue_name'] = subscription['source']
-                    msg = text.MIMEText(jsonutils.dumps(message))
+                    if serialized is not None:
+                        body = serialized[i]
+                    else:
+                        # NOTE(Eva-i): Unfortunately this will add
+                        # 'queue_name' key to our original messages(dicts)
+                        # which will be later consumed in the storage
+                        # controller. It seems safe though.
+                        message['queue_name'] = subscription['source']
+                        body = jsonutils.dumps(message)
+                    if digest_window:
+                        digest.append(body)
+                        continue
+                    msg = text.MIMEText(body)
                     msg["to"] = subscriber.path
                     msg["from"] = subscription['options'].get('from', '')
                     subject_opt = subscription['options'].get('subject', '')
                     msg["subject"] = params.get('subject', subject_opt)
-                if conf_n.smtp_mode == 'third_part':
-                    cmd = conf_n.smtp_command.split(' ')
-                    processutils.execute(*cmd, process_input=msg.as_string())
-                elif conf_n.smtp_mode == 'self_local':
-                    sender = smtplib.SMTP_SSL(conf_n.smtp_host,
-                                              conf_n.smtp_port)
-                    sender.set_debuglevel(1)
-
-                    sender.ehlo(conf_n.smtp_host)
-                    try:
-                        sender.login(conf_n.smtp_user_name,
-                                     conf_n.smtp_user_password)
-                    except smtplib.SMTPException:
-                        LOG.error("Failed to connect to the SMTP service")
-                        continue
-                    sender.sendmail(msg['from'], msg['to'], msg.as_string())
-                LOG.debug("Send mail successfully: %s", msg.as_string())
+                try:
+                    self._send(conf_n, msg)
+                except smtplib.SMTPException as exc:
+                    LOG.error('Failed to send email because %s.', str(exc))
         except OSError as err:
             LOG.exception('Failed to create process for sendmail, '
                           'because %s.', str(err))
         except Exception as exc:
             LOG.exception('Failed to send email because %s.', str(exc))
 
+        if digest:
+            subject_opt = subscription['options'].get('subject', '')
+            self._add_to_digest(conf, (subscriber.path,
+                                       subscription['options'].get('from', ''),
+                                       params.get('subject', subject_opt)),
+                                digest, digest_window)
+
+    def _add_to_digest(self, conf, key, bodies, window):
+        """Holds notifications to coalesce them into a single email.
+
+        Notifications to the same recipient, with the same sender and
+        subject, are sent as a single email once `window` seconds have
+        passed since the first of them.
+        """
+        with self._lock:
+            pending = self._pending.get(key)
+            if pending is None:
+                pending = self._pending[key] = []
+                scheduling.get_scheduler(conf).schedule(window, self._flush,
+                                                        conf, key)
+            pending.extend(bodies)
+
+    def _flush(self, conf, key):
+        with self._lock:
+            bodies = self._pending.pop(key, None)
+
+        if not bodies:
+            return
+
+        msg = text.MIMEText('[' + ','.join(bodies) + ']')
+        msg['to'], msg['from'], msg['subject'] = key
+        try:
+            self._send(conf.notification, msg, digest=True)
+        except Exception as exc:
+            LOG.exception('Failed to send email because %s.', str(exc))
+
+    def _send(self, conf_n, msg, digest=False):
+        try:
+            if conf_n.smtp_mode == 'third_part':
+                cmd = conf_n.smtp_command.split(' ')
+                processutils.execute(*cmd, process_input=msg.as_string())
+            elif conf_n.smtp_mode == 'self_local':
+                self._get_pool(conf_n).sendmail(msg['from'], msg['to'],
+                                                msg.as_string())
+        except Exception:
+            self._record(False, digest)
+            raise
+        self._record(True, digest)
+        LOG.debug("Send mail successfully: %s", msg.as_string())
+
+    def _get_pool(self, conf_n):
+        """Returns the SMTP connections shared by the emails of this task."""
+        if self._pool is not None:
+            return self._pool
+
+        with self._lock:
+            if self._pool is None:
+                self._pool = SMTPPool(conf_n.smtp_host, conf_n.smtp_port,
+                                      conf_n.smtp_user_name,
+                                      conf_n.smtp_user_password,
+                                      conf_n.smtp_pool_size)
+            return self._pool
+
+    def _record(self, success, digest):
+        now = timeutils.utcnow().strftime('%Y-%m-%dT%H:%M:%SZ')
+        with self._lock:
+            if success:
+                self._stats['sent'] += 1
+                self._stats['digests'] += digest
+                self._stats['last_success'] = now
+            else:
+                self._stats['failed'] += 1
+                self._stats['last_failure'] = now
+
+    def stats(self):
+        """Returns the emails sent and failed by this task.
+
+        :returns: The amount of emails sent, digests among them, and
+            failed, with the time of the last success and failure.
+        :rtype: dict
+        """
+        with self._lock:
+            return dict(self._stats)
+
     def register(self, subscriber, options, ttl, project_id, request_data):
         pass
@@ -14,12 +14,99 @@
 
 import copy
 import datetime
+import threading
+import time
 
+from oslo_log import log as logging
 from oslo_utils import timeutils
 
 from zaqar.common import auth
 from zaqar.notification.tasks import webhook
 
+LOG = logging.getLogger(__name__)
+
+# NOTE: Time, in seconds, before their expiration cached tokens are
+# refreshed, so that a token doesn't expire on its way to the subscriber.
+_EXPIRY_MARGIN = 60
+
+# NOTE: Time, in seconds, between two sweeps of the expired tokens.
+_SWEEP_INTERVAL = 300
+
+
+class TokenCache:
+    """Cache of the tokens obtained with trusts.
+
+    Tokens are kept until shortly before they expire. Concurrent requests
+    for the token of the same trust wait for a single Keystone call.
+    Tokens which expired are dropped every `sweep_interval` seconds, so
+    that the trusts no longer notified aren't kept forever.
+    """
+
+    def __init__(self, expiry_margin=_EXPIRY_MARGIN,
+                 sweep_interval=_SWEEP_INTERVAL):
+        self._expiry_margin = expiry_margin
+        self._sweep_interval = sweep_interval
+        self._swept = time.monotonic()
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def get(self, trust_id):
+        """Returns a token for a trust, getting one from Keystone if needed.
+
+        :param trust_id: ID of the trust.
+        :returns: A token valid for at least the expiry margin.
+        :rtype: str
+        """
+        with self._lock:
+            now = time.monotonic()
+            if now - self._swept >= self._sweep_interval:
+                self._swept = now
+                self._sweep()
+
+            entry = self._entries.get(trust_id)
+            if entry is None:
+                entry = self._entries[trust_id] = [threading.Lock(), None]
+
+        access = entry[1]
+        if self._is_valid(access):
+            return access.auth_token
+
+        with entry[0]:
+            # NOTE: Another thread may have refreshed the token while this
+            # one was waiting for it.
+            access = entry[1]
+            if not self._is_valid(access):
+                LOG.debug('Getting a token for trust %s', trust_id)
+                access = entry[1] = auth.get_trusted_access(trust_id)
+
+        return access.auth_token
+
+    def invalidate(self, trust_id):
+        """Forgets the token of a trust."""
+        with self._lock:
+            self._entries.pop(trust_id, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def _sweep(self):
+        # NOTE: Called with the lock held. Entries being refreshed are
+        # left alone, their lock is waited for.
+        expired = [trust_id for trust_id, (lock, access)
+                   in self._entries.items()
+                   if access is not None and not lock.locked() and
+                   access.will_expire_soon(stale_duration=0)]
+        for trust_id in expired:
+            del self._entries[trust_id]
+
+    def _is_valid(self, access):
+        return access is not None and not access.will_expire_soon(
+            stale_duration=self._expiry_margin)
+
+
+tokens = TokenCache()
+
 
 class TrustTask(webhook.WebhookTask):
     """A webhook using trust authentication.
@@ -33,13 +120,19 @@ class TrustTask(webhook.WebhookTask):
         subscriber = subscription['subscriber']
 
         trust_id = subscription['options']['trust_id']
-        token = auth.get_trusted_token(trust_id)
+        token = tokens.get(trust_id)
 
         subscription['subscriber'] = subscriber[6:]
         headers = {'X-Auth-Token': token,
                    'Content-Type': 'application/json'}
         super().execute(subscription, messages, headers, **kwargs)
 
+    def _received(self, subscription, response):
+        # NOTE: The trust may have been revoked, or the token rejected
+        # for another reason, get a new one for the next notification.
+        if response.status_code == 401:
+            tokens.invalidate(subscription['options']['trust_id'])
+
     def register(self, subscriber, options, ttl, project_id, request_data):
         if 'trust_id' not in options:
             # We have a trust subscriber without a trust ID,
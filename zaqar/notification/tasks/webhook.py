@@ -14,13 +14,18 @@
 # limitations under the License.
 
 import math
+import threading
 import time
+from urllib import parse as urllib_parse
 
 from oslo_log import log as logging
 from oslo_serialization import jsonutils
 import requests
+from requests import adapters
 
 from zaqar.common import consts
+from zaqar.notification.notifier import MessageType
+from zaqar.notification import scheduling
 
 LOG = logging.getLogger(__name__)
 
@@ -51,6 +56,9 @@ def _Arithmetic_function(minimum_delay, maximum_delay, times):
     return [int(minimum_delay + (a - 1) * a * d / 2) for a in xarray]
 
 
+# NOTE: Number of subscriber hosts the connections are kept alive to.
+_POOLED_HOSTS = 100
+
 RETRY_BACKOFF_FUNCTION_MAP = {
     consts.RETRY_BACKOFF_LINEAR: _Linear_function,
     consts.RETRY_BACKOFF_ARITHMETIC: _Arithmetic_function,
@@ -59,98 +67,270 @@ RETRY_BACKOFF_FUNCTION_MAP = {
 }
 
 
+class _TimeoutAdapter(adapters.HTTPAdapter):
+    """HTTP adapter applying a default timeout to every request."""
+
+    def __init__(self, timeout, **kwargs):
+        self._timeout = timeout
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self._timeout
+        return super().send(request, **kwargs)
+
+
+def _retry_delays(retry_policy):
+    """Yields the delays, in seconds, before each retry of a delivery."""
+    for _ in range(retry_policy.get('retries_with_no_delay',
+                                    consts.RETRIES_WITH_NO_DELAY)):
+        yield 0
+
+    minimum_delay = retry_policy.get('minimum_delay', consts.MINIMUM_DELAY)
+    maximum_delay = retry_policy.get('maximum_delay', consts.MAXIMUM_DELAY)
+
+    for _ in range(retry_policy.get('minimum_delay_retries',
+                                    consts.MINIMUM_DELAY_RETRIES)):
+        yield minimum_delay
+
+    retry_function = retry_policy.get('retry_backoff_function',
+                                      consts.RETRY_BACKOFF_LINEAR)
+    backoff_function = RETRY_BACKOFF_FUNCTION_MAP[retry_function]
+    yield from backoff_function(minimum_delay, maximum_delay,
+                                consts.LINEAR_INTERVAL)
+
+    for _ in range(retry_policy.get('maximum_delay_retries',
+                                    consts.MAXIMUM_DELAY_RETRIES)):
+        yield maximum_delay
+
+
+def _host(subscriber):
+    return urllib_parse.urlparse(subscriber).netloc
+
+
 class WebhookTask:
 
-    def _post_request_success(self, subscriber, data, headers):
+    def __init__(self):
+        self._session = None
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def _get_session(self, conf=None):
+        """Returns the session shared by the deliveries of this task.
+
+        The session keeps the connections to subscribers alive, pooled
+        per host, and applies the `webhook_timeout` to every request.
+        """
+        if self._session is not None:
+            return self._session
+
+        with self._lock:
+            if self._session is None:
+                timeout = None
+                pool_size = adapters.DEFAULT_POOLSIZE
+                if conf is not None:
+                    conf_n = conf.notification
+                    timeout = conf_n.webhook_timeout or None
+                    if conf_n.max_notifier_workers_per_host:
+                        pool_size = conf_n.max_notifier_workers_per_host
+                adapter = _TimeoutAdapter(timeout,
+                                          pool_connections=_POOLED_HOSTS,
+                                          pool_maxsize=pool_size)
+                session = requests.Session()
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                self._session = session
+            return self._session
+
+    def _post_request_success(self, subscriber, data, headers,
+                              tracker=None):
         try:
-            resp = requests.post(subscriber, data=data, headers=headers)
+            started = time.monotonic()
+            resp = self._get_session().post(subscriber, data=data,
+                                            headers=headers)
             if resp:
+                if tracker is not None:
+                    tracker.record(True, time.monotonic() - started)
                 return True
         except Exception as e:
             LOG.exception('post request got exception in retry: %s.', str(e))
         return False
 
     def _retry_post(self, sub_retry_policy, queue_retry_policy, subscriber,
-                    data, headers):
+                    data, headers, conf=None, tracker=None, deliveries=None):
         retry_policy = None
         if sub_retry_policy.get('ignore_subscription_override') or \
            queue_retry_policy.get('ignore_subscription_override'):
             retry_policy = queue_retry_policy or {}
         else:
             retry_policy = sub_retry_policy or queue_retry_policy or {}
-        # Immediate Retry Phase
-        for retry_with_no_delay in range(
-                0, retry_policy.get('retries_with_no_delay',
-                                    consts.RETRIES_WITH_NO_DELAY)):
-            LOG.debug('Retry with no delay, count: %s', retry_with_no_delay)
-            if self._post_request_success(subscriber, data, headers):
-                return
-        # Pre-Backoff Phase
-        for minimum_delay_retry in range(
-                0, retry_policy.get('minimum_delay_retries',
-                                    consts.MINIMUM_DELAY_RETRIES)):
-            LOG.debug('Retry with minimum delay, count: %s',
-                      minimum_delay_retry)
-            time.sleep(retry_policy.get('minimum_delay', consts.MINIMUM_DELAY))
-            if self._post_request_success(subscriber, data, headers):
-                return
-        retry_function = retry_policy.get('retry_backoff_function',
-                                          consts.RETRY_BACKOFF_LINEAR)
-        backoff_function = RETRY_BACKOFF_FUNCTION_MAP[retry_function]
-        for i in backoff_function(retry_policy.get('minimum_delay',
-                                                   consts.MINIMUM_DELAY),
-                                  retry_policy.get('maximum_delay',
-                                                   consts.MAXIMUM_DELAY),
-                                  consts.LINEAR_INTERVAL):
-            LOG.debug('Retry with function:%s, sleep: %s seconds',
-                      retry_function, i)
-            time.sleep(i)
-            if self._post_request_success(subscriber, data, headers):
-                return
-        # Post-Backoff Phase
-        for maximum_delay_retries in range(
-                0, retry_policy.get('maximum_delay_retries',
-                                    consts.MAXIMUM_DELAY_RETRIES)):
-            LOG.debug('Retry with maximum delay, count: %s',
-                      maximum_delay_retries)
-            time.sleep(retry_policy.get('maximum_delay', consts.MAXIMUM_DELAY))
-            if self._post_request_success(subscriber, data, headers):
-                return
-        LOG.debug('Send request retries are all failed.')
+
+        # NOTE: Retries are scheduled rather than waited for, the
+        # immediate ones first, then the ones with the minimum delay,
+        # the ones following the backoff function and the ones with the
+        # maximum delay.
+        self._schedule_retry(scheduling.get_scheduler(conf),
+                             _retry_delays(retry_policy),
+                             subscriber, data, headers, tracker, deliveries)
+
+    def _schedule_retry(self, scheduler, delays, subscriber, data, headers,
+                        tracker=None, deliveries=None):
+        delay = next(delays, None)
+        if delay is None:
+            LOG.debug('Send request retries are all failed.')
+            # NOTE: A notification only counts as failed once all its
+            # retries have, a single one mustn't open the circuit.
+            if tracker is not None:
+                tracker.record(False)
+            return
+
+        LOG.debug('Retry %(subscriber)s in %(delay)s seconds',
+                  {'subscriber': subscriber, 'delay': delay})
+        args = (scheduler, delays, subscriber, data, headers, tracker,
+                deliveries)
+        if deliveries is None:
+            scheduler.schedule(delay, self._retry, *args)
+        else:
+            # NOTE: Once due, retries are handed over to the deliveries of
+            # the notifier, so that they count toward the limit of the
+            # subscriber host.
+            scheduler.schedule(delay, deliveries.submit, _host(subscriber),
+                               self._retry, *args)
+
+    def _retry(self, scheduler, delays, subscriber, data, headers,
+               tracker=None, deliveries=None):
+        if not self._post_request_success(subscriber, data, headers,
+                                          tracker):
+            self._schedule_retry(scheduler, delays, subscriber, data,
+                                 headers, tracker, deliveries)
 
     def execute(self, subscription, messages, headers=None, **kwargs):
         if headers is None:
             headers = {'Content-Type': 'application/json'}
         headers.update(subscription['options'].get('post_headers', {}))
-        try:
-            for msg in messages:
-                # NOTE(Eva-i): Unfortunately this will add 'queue_name' key to
-                # our original messages(dicts) which will be later consumed in
-                # the storage controller. It seems safe though.
+        self._get_session(kwargs.get('conf'))
+        serialized = kwargs.get('serialized')
+        batch_size = subscription['options'].get('batch_size', 1)
+
+        batch = []
+        for i, msg in enumerate(messages):
+            if serialized is not None:
+                # NOTE: The notifier already serialized the messages,
+                # once for all the subscribers.
+                dumped = serialized[i]
+            else:
+                # NOTE(Eva-i): Unfortunately this will add 'queue_name'
+                # key to our original messages(dicts) which will be
+                # later consumed in the storage controller. It seems
+                # safe though.
                 msg['queue_name'] = subscription['source']
-                if 'post_data' in subscription['options']:
-                    data = subscription['options']['post_data']
-                    data = data.replace('"$zaqar_message$"',
-                                        jsonutils.dumps(msg))
-                else:
-                    data = jsonutils.dumps(msg)
-                response = requests.post(subscription['subscriber'],
-                                         data=data,
-                                         headers=headers)
-                if response and (response.status_code not in range(200, 500)):
-                    LOG.info("Response is %s, begin to retry",
-                             response.status_code)
-                    self._retry_post(
-                        subscription['options'].get('_retry_policy', {}),
-                        kwargs.get('queue_retry_policy'),
-                        subscription['subscriber'],
-                        data, headers)
+                dumped = jsonutils.dumps(msg)
+
+            # NOTE: Only notifications are batched, confirmation
+            # requests are always sent on their own.
+            if (batch_size > 1 and msg.get('Message_Type') ==
+                    MessageType.Notification.name):
+                batch.append(dumped)
+            else:
+                self._send(subscription, self._render(subscription, dumped),
+                           headers, **kwargs)
+
+        if batch:
+            self._batch(subscription, batch, headers, **kwargs)
+
+    def _render(self, subscription, dumped, batch=False):
+        post_data = subscription['options'].get('post_data')
+        if post_data is None:
+            return dumped
+
+        if batch:
+            post_data = post_data.replace('"$zaqar_messages$"', dumped)
+        return post_data.replace('"$zaqar_message$"', dumped)
+
+    def _batch(self, subscription, batch, headers, **kwargs):
+        """Sends notifications, `batch_size` of them per request.
+
+        Notifications are held for up to `batch_linger_ms` milliseconds,
+        when set, waiting for more of them to fill the requests.
+        """
+        options = subscription['options']
+        batch_size = options['batch_size']
+        linger = options.get('batch_linger_ms', 0)
+
+        if linger:
+            key = subscription.get('id') or subscription['subscriber']
+            with self._lock:
+                pending = self._pending.get(key)
+                if pending is None:
+                    pending = self._pending[key] = {'batch': []}
+                    scheduler = scheduling.get_scheduler(kwargs.get('conf'))
+                    deliveries = kwargs.get('deliveries')
+                    if deliveries is None:
+                        scheduler.schedule(linger / 1000.0, self._flush, key)
+                    else:
+                        scheduler.schedule(linger / 1000.0, deliveries.submit,
+                                           _host(subscription['subscriber']),
+                                           self._flush, key)
+                pending['batch'].extend(batch)
+                pending.update(subscription=subscription, headers=headers,
+                               kwargs=kwargs)
+
+                batch = []
+                while len(pending['batch']) >= batch_size:
+                    batch.extend(pending['batch'][:batch_size])
+                    del pending['batch'][:batch_size]
+
+        for start in range(0, len(batch), batch_size):
+            dumped = '[' + ','.join(batch[start:start + batch_size]) + ']'
+            self._send(subscription,
+                       self._render(subscription, dumped, batch=True),
+                       headers, **kwargs)
+
+    def _flush(self, key):
+        with self._lock:
+            pending = self._pending.pop(key, None)
+
+        if pending and pending['batch']:
+            subscription = pending['subscription']
+            dumped = '[' + ','.join(pending['batch']) + ']'
+            self._send(subscription,
+                       self._render(subscription, dumped, batch=True),
+                       pending['headers'], **pending['kwargs'])
+
+    def _send(self, subscription, data, headers, **kwargs):
+        tracker = None
+        if kwargs.get('health') is not None and subscription.get('id'):
+            tracker = kwargs['health'].tracker(subscription['id'])
+
+        try:
+            started = time.monotonic()
+            response = self._get_session().post(subscription['subscriber'],
+                                                data=data,
+                                                headers=headers)
+            if response is not None:
+                self._received(subscription, response)
+            if response and (response.status_code not in range(200, 500)):
+                LOG.info("Response is %s, begin to retry",
+                         response.status_code)
+                self._retry_post(
+                    subscription['options'].get('_retry_policy', {}),
+                    kwargs.get('queue_retry_policy'),
+                    subscription['subscriber'],
+                    data, headers, conf=kwargs.get('conf'), tracker=tracker,
+                    deliveries=kwargs.get('deliveries'))
+            elif tracker is not None:
+                tracker.record(bool(response), time.monotonic() - started)
         except Exception as e:
             LOG.exception('webhook task got exception: %s.', str(e))
             self._retry_post(subscription['options'].get('_retry_policy', {}),
                              kwargs.get('queue_retry_policy'),
                              subscription['subscriber'],
-                             data, headers)
+                             data, headers, conf=kwargs.get('conf'),
+                             tracker=tracker,
+                             deliveries=kwargs.get('deliveries'))
+
+    def _received(self, subscription, response):
+        """Called with the response of the subscriber to a notification."""
 
     def register(self, subscriber, options, ttl, project_id, request_data):
         pass
@@ -223,6 +223,24 @@ class DataDriverBase(DriverBase, metaclass=abc.ABCMeta):
         """
         pass
 
+    def occupancy(self, detailed=False):
+        """Reports how much data the storage holds.
+
+        Only counters the backend keeps natively are reported, so that
+        this can be called periodically, e.g. to place queues on the
+        least loaded pool.
+
+        :param detailed: Whether to also count the claimed and delayed
+            messages, which may take a scan of the messages.
+        :type detailed: bool
+        :returns: {'messages': total number of messages, 'size': bytes
+            used}, plus {'claimed': ..., 'delayed': ...} if detailed.
+            Counters the backend doesn't keep are None.
+        :rtype: dict
+        :raises NotImplementedError: if the backend can't tell cheaply
+        """
+        raise NotImplementedError
+
     @decorators.lazy_property(write=False)
     def queue_controller(self):
         return self.control_driver.queue_controller
@@ -662,7 +680,6 @@ class Subscription(ControllerBase, metaclass=abc.ABCMeta):
         """
         raise NotImplementedError
 
-    @abc.abstractmethod
     def create(self, queue, subscriber, ttl, options, project=None):
         """Create a new subscription.
 
@@ -680,9 +697,14 @@ class Subscription(ControllerBase, metaclass=abc.ABCMeta):
         if it is failed.
         :rtype: boolean
         """
-        raise NotImplementedError
+        try:
+            return self._create(queue, subscriber, ttl, options,
+                                project=project)
+        finally:
+            self._forget_subscribers(queue, project)
+
+    _create = abc.abstractmethod(lambda x: None)
 
-    @abc.abstractmethod
     def update(self, queue, subscription_id, project=None, **kwargs):
         """Updates the weight, uris, and/or options of this subscription
 
@@ -696,8 +718,13 @@ class Subscription(ControllerBase, metaclass=abc.ABCMeta):
         :raises SubscriptionAlreadyExists: if attempt to update in a way to
             create duplicate subscription
         """
+        try:
+            return self._update(queue, subscription_id, project=project,
+                                **kwargs)
+        finally:
+            self._forget_subscribers(queue, project)
 
-        raise NotImplementedError
+    _update = abc.abstractmethod(lambda x: None)
 
     @abc.abstractmethod
     def exists(self, queue, subscription_id, project=None):
@@ -714,7 +741,6 @@ class Subscription(ControllerBase, metaclass=abc.ABCMeta):
         """
         raise NotImplementedError
 
-    @abc.abstractmethod
     def delete(self, queue, subscription_id, project=None):
         """Base method for deleting a subscription.
 
@@ -725,7 +751,13 @@ class Subscription(ControllerBase, metaclass=abc.ABCMeta):
         :param project: Project id
         :type project: str
         """
-        raise NotImplementedError
+        try:
+            return self._delete(queue, subscription_id, project=project)
+        finally:
+            self._forget_subscribers(queue, project)
+            self._forget_health(subscription_id)
+
+    _delete = abc.abstractmethod(lambda x: None)
 
     @abc.abstractmethod
     def get_with_subscriber(self, queue, subscriber, project=None):
@@ -742,7 +774,6 @@ class Subscription(ControllerBase, metaclass=abc.ABCMeta):
         """
         raise NotImplementedError
 
-    @abc.abstractmethod
     def confirm(self, queue, subscription_id, project=None, confirmed=True):
         """Base method for confirming a subscription.
 
@@ -756,7 +787,25 @@ class Subscription(ControllerBase, metaclass=abc.ABCMeta):
             a subscription.
         :type confirmed: boolean
         """
-        raise NotImplementedError
+        try:
+            return self._confirm(queue, subscription_id, project=project,
+                                 confirmed=confirmed)
+        finally:
+            self._forget_subscribers(queue, project)
+
+    _confirm = abc.abstractmethod(lambda x: None)
+
+    def _forget_subscribers(self, queue, project=None):
+        # NOTE: The notifier caches the subscribers of every queue,
+        # drop the entry so the next messages see the change right away.
+        self.driver.cache.delete(utils.subscribers_cache_key(queue, project))
+
+    def _forget_health(self, subscription_id):
+        # NOTE: Don't report the delivery health the notifiers published
+        # for a deleted subscription. Each notifier forgets it on its own
+        # once no notification is delivered to the subscription anymore.
+        self.driver.cache.delete(
+            utils.subscription_health_cache_key(subscription_id))
 
 
 class PoolsBase(ControllerBase, metaclass=abc.ABCMeta):
@@ -841,7 +890,10 @@ class PoolsBase(ControllerBase, metaclass=abc.ABCMeta):
         if not self._check_capabilities(uri, flavor=flavor_obj):
             raise errors.PoolCapabilitiesMismatch()
 
-        return self._create(name, weight, uri, flavor, options)
+        try:
+            return self._create(name, weight, uri, flavor, options)
+        finally:
+            self._forget_flavor(flavor)
 
     _create = abc.abstractmethod(lambda x: None)
 
@@ -894,8 +946,21 @@ class PoolsBase(ControllerBase, metaclass=abc.ABCMeta):
         :param name: The name of this pool
         :type name: str
         :rtype: None
+        :raises PoolInUseByMigration: if a queue is migrating to the pool
         """
-        return self._delete(name)
+        try:
+            migrations = self.driver.catalogue_controller.migrations(name)
+        except NotImplementedError:
+            migrations = ()
+        for entry in migrations:
+            raise errors.PoolInUseByMigration(name, entry['queue'],
+                                              entry['project'])
+
+        flavor = self._flavor_of(name)
+        try:
+            return self._delete(name)
+        finally:
+            self._forget_flavor(flavor)
 
     _delete = abc.abstractmethod(lambda x: None)
 
@@ -912,10 +977,27 @@ class PoolsBase(ControllerBase, metaclass=abc.ABCMeta):
         if uri and not self._check_capabilities(uri, name=name):
             raise errors.PoolCapabilitiesMismatch()
 
-        return self._update(name, **kwargs)
+        flavor = self._flavor_of(name)
+        try:
+            return self._update(name, **kwargs)
+        finally:
+            self._forget_flavor(flavor)
+            if 'flavor' in kwargs:
+                self._forget_flavor(kwargs['flavor'])
 
     _update = abc.abstractmethod(lambda x: None)
 
+    def _flavor_of(self, name):
+        try:
+            return self._get(name).get('flavor')
+        except errors.PoolDoesNotExist:
+            return None
+
+    def _forget_flavor(self, flavor):
+        # NOTE: The pooling catalog caches the pools of every flavor,
+        # drop the entry so new queues see the change right away.
+        self.driver.cache.delete(utils.flavor_pools_cache_key(flavor))
+
     def drop_all(self):
         """Deletes all pools from storage."""
         return self._drop_all()
@@ -951,7 +1033,7 @@ class CatalogueBase(ControllerBase, metaclass=abc.ABCMeta):
         :type project: str
         :param queue: The name of the queue to search for
         :type queue: str
-        :returns: {'pool': ...}
+        :returns: {'pool': ..., 'migrating_to': ...}
         :rtype: dict
         :raises QueueNotMapped: if queue is not mapped
         """
@@ -1000,6 +1082,8 @@ class CatalogueBase(ControllerBase, metaclass=abc.ABCMeta):
     def update(self, project, queue, pools=None):
         """Updates the pool identifier for this queue.
 
+        This also ends the migration of the queue, if any.
+
         :param project: Namespace to search
         :type project: str
         :param queue: The name of the queue
@@ -1017,6 +1101,117 @@ class CatalogueBase(ControllerBase, metaclass=abc.ABCMeta):
 
         raise NotImplementedError
 
+    def upsert(self, project, queue, pool, keep=()):
+        """Maps the queue to a pool unless it already lives in an eligible one.
+
+        This is a compare-and-set over the catalogue entry: the queue is
+        inserted, or remapped to `pool`, unless its current pool is one of
+        `keep`. Backends should override it to do so in a single round trip.
+
+        :param project: Namespace of the queue
+        :type project: str
+        :param queue: The name of the queue
+        :type queue: str
+        :param pool: The pool to map the queue to
+        :type pool: str
+        :param keep: Pools the queue may stay in if it's already mapped
+            to one of them.
+        :type keep: [str]
+        :returns: The pool the queue is mapped to
+        :rtype: str
+        """
+
+        try:
+            current = self.get(project, queue)['pool']
+        except errors.QueueNotMapped:
+            self.insert(project, queue, pool)
+            return pool
+
+        if current in keep:
+            return current
+
+        self.update(project, queue, pool)
+        return pool
+
+    def migrate(self, project, queue, pool=None):
+        """Marks the queue as migrating to another pool.
+
+        While the queue is migrating, `get` returns the pool it's migrating
+        to besides its current pool. The migration ends once the entry is
+        updated to that pool.
+
+        :param project: Namespace to search
+        :type project: str
+        :param queue: The name of the queue
+        :type queue: str
+        :param pool: The name of the pool the queue is migrating to, or
+            None to cancel the migration.
+        :type pool: str
+        :raises QueueNotMapped: if queue is not mapped
+        :raises NotImplementedError: if the backend doesn't support
+            migrations.
+        """
+
+        raise NotImplementedError
+
+    def count(self, pool):
+        """Counts the queues mapped to a pool.
+
+        :param pool: The name of the pool
+        :type pool: str
+        :returns: The number of queues mapped to the pool
+        :rtype: int
+        :raises NotImplementedError: if the backend can't count them
+            without scanning the whole catalogue.
+        """
+
+        raise NotImplementedError
+
+    def list_all(self, limit=None):
+        """Lists the entries of the catalogue, whatever their project.
+
+        :param limit: Maximum number of entries listed, or None
+        :type limit: int
+        :returns: [{'project': ..., 'queue': ..., 'pool': ...},]
+        :rtype: [dict]
+        :raises NotImplementedError: if the backend can't list them
+        """
+
+        raise NotImplementedError
+
+    def migrations(self, pool=None):
+        """Lists the entries of the queues migrating to another pool.
+
+        :param pool: Only list the queues migrating to this pool
+        :type pool: str
+        :returns: [{'project': ..., 'queue': ..., 'pool': ...,
+            'migrating_to': ...},]
+        :rtype: [dict]
+        :raises NotImplementedError: if the backend can't list them
+        """
+
+        raise NotImplementedError
+
+    def changes(self, since=None):
+        """Lists the entries changed since a given catalogue version.
+
+        Every insertion, update or deletion of an entry bumps the version
+        of the catalogue. This lets API workers keep a local copy of the
+        catalogue up to date without querying every entry.
+
+        :param since: A version returned by a previous call, or None
+        :type since: int
+        :returns: A tuple of the current version and the list of
+            (project, queue) entries changed since `since`. The list is
+            None if `since` is None, or if it is too old for the changes
+            to still be known.
+        :rtype: (int, [(str, str)])
+        :raises NotImplementedError: if the backend doesn't keep track
+            of the changes.
+        """
+
+        raise NotImplementedError
+
 
 class FlavorsBase(ControllerBase, metaclass=abc.ABCMeta):
     """A controller for managing flavors."""
@@ -1081,7 +1276,6 @@ class FlavorsBase(ControllerBase, metaclass=abc.ABCMeta):
 
         raise NotImplementedError
 
-    @abc.abstractmethod
     def delete(self, name, project=None):
         """Removes a flavor entry.
 
@@ -1091,8 +1285,12 @@ class FlavorsBase(ControllerBase, metaclass=abc.ABCMeta):
         :type project: str
         :rtype: None
         """
+        try:
+            return self._delete(name, project=project)
+        finally:
+            self.driver.cache.delete(utils.flavor_cache_key(name, project))
 
-        raise NotImplementedError
+    _delete = abc.abstractmethod(lambda x: None)
 
     @abc.abstractmethod
     def update(self, name, project=None, **kwargs):
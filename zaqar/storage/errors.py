@@ -180,6 +180,22 @@ class NoPoolFound(ExceptionBase):
         super().__init__()
 
 
+class QueueAlreadyInPool(NotPermitted):
+
+    msg_format = 'Queue {name} of project {project} already lives in {pool}'
+
+    def __init__(self, name, project, pool):
+        super().__init__(name=name, project=project, pool=pool)
+
+
+class QueueIsMigrating(NotPermitted):
+
+    msg_format = 'Queue {name} of project {project} is migrating to {pool}'
+
+    def __init__(self, name, project, pool):
+        super().__init__(name=name, project=project, pool=pool)
+
+
 class PoolInUseByFlavor(NotPermitted):
 
     msg_format = 'Pool {pid} is in use by flavor {fid}'
@@ -193,6 +209,15 @@ class PoolInUseByFlavor(NotPermitted):
         return self._flavor
 
 
+class PoolInUseByMigration(NotPermitted):
+
+    msg_format = ('Pool {pid} is the pool queue {queue} of project '
+                  '{project} is migrating to')
+
+    def __init__(self, pid, queue, project):
+        super().__init__(pid=pid, queue=queue, project=project)
+
+
 class SubscriptionDoesNotExist(DoesNotExist):
 
     msg_format = 'Subscription {subscription_id} does not exist'
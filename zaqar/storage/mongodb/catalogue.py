@@ -21,13 +21,17 @@ Serves to construct an association between a project + queue -> pool.
 
     {
         'p_q': project_queue :: str,
-        's': pool_identifier :: str
+        's': pool_identifier :: str,
+        'm': migrating_to_pool_identifier :: str (OPTIONAL)
     }
 """
 
+import pymongo
+
 from zaqar.storage import base
 from zaqar.storage import errors
 from zaqar.storage.mongodb import utils
+from zaqar.storage import utils as storage_utils
 
 
 PRIMARY_KEY = utils.PROJ_QUEUE_KEY
@@ -36,6 +40,27 @@ CATALOGUE_INDEX = [
     (PRIMARY_KEY, 1)
 ]
 
+# NOTE: Lets the queues mapped to a pool be counted without a scan.
+POOL_INDEX = [
+    ('s', 1)
+]
+
+# NOTE: Lets the queues migrating to a pool be listed without a scan.
+MIGRATION_INDEX = [
+    ('m', 1)
+]
+
+# NOTE: Changes are journaled as {'v': version, 'k': project_queue}. The
+# current version is the newest entry, so that bumping the version and
+# journaling the change is a single insert, made unique by this index.
+CHANGES_INDEX = [
+    ('v', 1)
+]
+
+# NOTE: Number of changes kept in the journal, workers that lag behind
+# further reload their whole copy of the catalogue.
+CHANGES_KEPT = 1000
+
 
 class CatalogueController(base.CatalogueBase):
 
@@ -44,12 +69,56 @@ class CatalogueController(base.CatalogueBase):
 
         self._col = self.driver.database.catalogue
         self._col.create_index(CATALOGUE_INDEX, unique=True)
+        self._col.create_index(POOL_INDEX)
+        self._col.create_index(MIGRATION_INDEX, sparse=True)
+        self._changes = self.driver.database.catalogue_changes
+        self._changes.create_index(CHANGES_INDEX, unique=True)
 
     @utils.raises_conn_error
     def _insert(self, project, queue, pool, upsert):
         key = utils.scope_queue_name(queue, project)
-        return self._col.update_one({PRIMARY_KEY: key},
-                                    {'$set': {'s': pool}}, upsert=upsert)
+        res = self._col.update_one({PRIMARY_KEY: key},
+                                   {'$set': {'s': pool},
+                                    '$unset': {'m': ''}}, upsert=upsert)
+        if res.matched_count or res.upserted_id is not None:
+            self._record_change(key)
+        return res
+
+    def _version(self):
+        doc = self._changes.find_one(projection={'_id': 0, 'v': 1},
+                                     sort=[('v', -1)])
+        return doc['v'] if doc else 0
+
+    def _record_change(self, key):
+        while True:
+            version = self._version() + 1
+            try:
+                self._changes.insert_one({'v': version, 'k': key})
+                break
+            except pymongo.errors.DuplicateKeyError:
+                # NOTE: Another change was journaled meanwhile, take the
+                # next version.
+                continue
+
+        if version % 100 == 0:
+            self._changes.delete_many({'v': {'$lte': version - CHANGES_KEPT}})
+
+    @utils.raises_conn_error
+    def changes(self, since=None):
+        version = self._version()
+
+        entries = []
+        if since is not None and since < version:
+            cursor = self._changes.find({'v': {'$gt': since}},
+                                        projection={'_id': 0},
+                                        sort=[('v', 1)])
+            entries = [
+                (entry['v'],) + tuple(
+                    utils.parse_scoped_project_queue(entry['k']))
+                for entry in cursor]
+
+        return version, storage_utils.catalogue_changes(since, version,
+                                                        entries)
 
     @utils.raises_conn_error
     def list(self, project):
@@ -60,6 +129,19 @@ class CatalogueController(base.CatalogueBase):
         return utils.HookedCursor(self._col.find(query, fields),
                                   _normalize, ntotal=ntotal)
 
+    @utils.raises_conn_error
+    def list_all(self, limit=None):
+        cursor = self._col.find({}, {'_id': 0})
+        if limit:
+            cursor = cursor.limit(limit)
+        return (_normalize(entry) for entry in cursor)
+
+    @utils.raises_conn_error
+    def migrations(self, pool=None):
+        query = {'m': {'$exists': True} if pool is None else pool}
+        return (_normalize(entry)
+                for entry in self._col.find(query, {'_id': 0}))
+
     @utils.raises_conn_error
     def get(self, project, queue):
         fields = {'_id': 0}
@@ -77,14 +159,39 @@ class CatalogueController(base.CatalogueBase):
         key = utils.scope_queue_name(queue, project)
         return self._col.find_one({PRIMARY_KEY: key}) is not None
 
+    @utils.raises_conn_error
+    def count(self, pool):
+        return self._col.count_documents({'s': pool})
+
     def insert(self, project, queue, pool):
         # NOTE(cpp-cabrera): _insert handles conn_error
         self._insert(project, queue, pool, upsert=True)
 
+    @utils.raises_conn_error
+    def upsert(self, project, queue, pool, keep=()):
+        key = utils.scope_queue_name(queue, project)
+        query = {PRIMARY_KEY: key}
+        if keep:
+            query['s'] = {'$nin': list(keep)}
+
+        try:
+            res = self._col.update_one(query,
+                                       {'$set': {'s': pool},
+                                        '$unset': {'m': ''}}, upsert=True)
+        except pymongo.errors.DuplicateKeyError:
+            # NOTE: The queue is already mapped to one of the pools to
+            # keep, the upsert tried to insert a second entry for it.
+            return self.get(project, queue)['pool']
+
+        if res.matched_count or res.upserted_id is not None:
+            self._record_change(key)
+        return pool
+
     @utils.raises_conn_error
     def delete(self, project, queue):
-        self._col.delete_one({
-            PRIMARY_KEY: utils.scope_queue_name(queue, project)})
+        key = utils.scope_queue_name(queue, project)
+        if self._col.delete_one({PRIMARY_KEY: key}).deleted_count:
+            self._record_change(key)
 
     def update(self, project, queue, pool=None):
         # NOTE(cpp-cabrera): _insert handles conn_error
@@ -93,10 +200,26 @@ class CatalogueController(base.CatalogueBase):
         if res.matched_count == 0:
             raise errors.QueueNotMapped(queue, project)
 
+    @utils.raises_conn_error
+    def migrate(self, project, queue, pool=None):
+        key = utils.scope_queue_name(queue, project)
+        if pool is None:
+            update = {'$unset': {'m': ''}}
+        else:
+            update = {'$set': {'m': pool}}
+
+        if not self._col.update_one({PRIMARY_KEY: key}, update).matched_count:
+            raise errors.QueueNotMapped(queue, project)
+        self._record_change(key)
+
     @utils.raises_conn_error
     def drop_all(self):
         self._col.drop()
         self._col.create_index(CATALOGUE_INDEX, unique=True)
+        self._col.create_index(POOL_INDEX)
+        self._col.create_index(MIGRATION_INDEX, sparse=True)
+        self._changes.drop()
+        self._changes.create_index(CHANGES_INDEX, unique=True)
 
 
 def _normalize(entry):
@@ -104,5 +227,6 @@ def _normalize(entry):
     return {
         'queue': queue,
         'project': project,
-        'pool': entry['s']
+        'pool': entry['s'],
+        'migrating_to': entry.get('m')
     }
@@ -17,6 +17,7 @@
 
 import ssl
 
+from oslo_utils import timeutils
 from osprofiler import profiler
 import pymongo
 import pymongo.errors
@@ -146,6 +147,27 @@ class DataDriver(storage.DataDriverBase):
         KPI['message_volume'] = message_volume
         return KPI
 
+    def occupancy(self, detailed=False):
+        occupancy = {'messages': 0, 'size': 0}
+        if detailed:
+            occupancy.update(claimed=0, delayed=0)
+            now = timeutils.utcnow_ts()
+
+        for db in self.message_databases:
+            # NOTE: The collection stats are read from its metadata, they
+            # don't take a scan of the messages.
+            coll_stats = db.command('collStats', 'messages')
+            occupancy['messages'] += coll_stats['count']
+            occupancy['size'] += coll_stats['size']
+
+            if detailed:
+                occupancy['claimed'] += db.messages.count_documents(
+                    {'c.e': {'$gt': now}})
+                occupancy['delayed'] += db.messages.count_documents(
+                    {'d': {'$gt': now}})
+
+        return occupancy
+
     @decorators.lazy_property(write=False)
     def message_databases(self):
         """List of message databases, ordered by partition number."""
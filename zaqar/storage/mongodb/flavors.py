@@ -127,7 +127,7 @@ class FlavorsController(base.FlavorsBase):
             raise errors.FlavorDoesNotExist(name)
 
     @utils.raises_conn_error
-    def delete(self, name, project=None):
+    def _delete(self, name, project=None):
         self._col.delete_one({'n': name, 'p': project})
 
     @utils.raises_conn_error
@@ -410,6 +410,7 @@ class MessageController(storage.Message):
         def denormalizer(msg):
             doc = _basic_message(msg, now)
             doc['claim'] = msg['c']
+            doc['client_uuid'] = _client_uuid(msg.get('u'))
 
             return doc
 
@@ -1052,6 +1053,14 @@ def _is_claimed(msg, now):
             msg['c']['e'] > now)
 
 
+def _client_uuid(value):
+    if isinstance(value, binary.Binary):
+        if value.subtype == binary.UUID_SUBTYPE:
+            return str(value.as_uuid())
+        return str(value.as_uuid(binary.UuidRepresentation.PYTHON_LEGACY))
+    return None if value is None else str(value)
+
+
 def _basic_message(msg, now):
     oid = msg['_id']
     age = now - utils.oid_ts(oid)
@@ -101,7 +101,7 @@ class SubscriptionController(base.Subscription):
         return _basic_subscription(res, now)
 
     @utils.raises_conn_error
-    def create(self, queue, subscriber, ttl, options, project=None):
+    def _create(self, queue, subscriber, ttl, options, project=None):
         source = queue
         now = timeutils.utcnow_ts()
         now_dt = datetime.datetime.fromtimestamp(
@@ -127,7 +127,7 @@ class SubscriptionController(base.Subscription):
                                           'p': project}) is not None
 
     @utils.raises_conn_error
-    def update(self, queue, subscription_id, project=None, **kwargs):
+    def _update(self, queue, subscription_id, project=None, **kwargs):
         names = ('subscriber', 'ttl', 'options')
         key_transform = lambda x: 'u' if x == 'subscriber' else x[0]
         fields = common_utils.fields(kwargs, names,
@@ -157,7 +157,7 @@ class SubscriptionController(base.Subscription):
             raise errors.SubscriptionDoesNotExist(subscription_id)
 
     @utils.raises_conn_error
-    def delete(self, queue, subscription_id, project=None):
+    def _delete(self, queue, subscription_id, project=None):
         self._collection.delete_one({'_id': utils.to_oid(subscription_id),
                                      'p': project,
                                      's': queue})
@@ -171,7 +171,7 @@ class SubscriptionController(base.Subscription):
         return _basic_subscription(res, now)
 
     @utils.raises_conn_error
-    def confirm(self, queue, subscription_id, project=None, confirmed=True):
+    def _confirm(self, queue, subscription_id, project=None, confirmed=True):
 
         res = self._collection.update_one(
             {'_id': utils.to_oid(subscription_id),
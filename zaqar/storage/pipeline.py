@@ -12,6 +12,8 @@
 # License for the specific language governing permissions and limitations under
 # the License.
 
+import threading
+
 from oslo_log import log as logging
 from osprofiler import profiler
 from stevedore import driver
@@ -93,6 +95,69 @@ def _get_builtin_entry_points(resource_name, storage, control_driver, conf):
     return builtin_entry_points
 
 
+class StageTimings:
+    """Keeps track of the time spent in the stages of the pipelines.
+
+    Instances are suitable for `Pipeline`'s `timer`. They count the calls
+    served by each stage and method, along with their total and longest
+    duration, and log a warning for calls slower than `threshold`.
+
+    :param threshold: Seconds a stage may spend serving a call before a
+        warning is logged, 0 to never log it.
+    """
+
+    def __init__(self, threshold=0):
+        self._threshold = threshold
+        self._timings = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, stage, method, elapsed):
+        name = stage.__class__.__name__
+        with self._lock:
+            timing = self._timings.get((name, method))
+            if timing is None:
+                timing = self._timings[(name, method)] = [0, 0.0, 0.0]
+            timing[0] += 1
+            timing[1] += elapsed
+            timing[2] = max(timing[2], elapsed)
+
+        if self._threshold and elapsed >= self._threshold:
+            LOG.warning('Stage %(stage)s took %(elapsed).3f seconds '
+                        'to serve %(method)s',
+                        {'stage': name, 'method': method,
+                         'elapsed': elapsed})
+
+    def stats(self):
+        """Reports the timings recorded so far.
+
+        :returns: {stage: {method: {'count': ..., 'total': ...,
+            'max': ...}}}, durations being in seconds.
+        """
+        with self._lock:
+            timings = [(key, tuple(timing))
+                       for key, timing in self._timings.items()]
+
+        stats = {}
+        for (name, method), (count, total, longest) in timings:
+            stats.setdefault(name, {})[method] = {
+                'count': count, 'total': total, 'max': longest}
+        return stats
+
+
+def _get_stage_timings(conf):
+    """Returns the stage timings for the configured latency threshold.
+
+    :param conf: Configuration instance.
+    :type conf: `cfg.ConfigOpts`
+
+    :returns: A `StageTimings` instance.
+    """
+    conf.register_opts(storage.ALL_OPTS,
+                       group=storage.GROUP_NAME)
+
+    return StageTimings(conf[storage.GROUP_NAME].stage_latency_threshold)
+
+
 class DataDriver(base.DataDriverBase):
     """Meta-driver for injecting pipelines in front of controllers.
 
@@ -106,19 +171,49 @@ class DataDriver(base.DataDriverBase):
         # be referenced.
         super().__init__(conf, None, control_driver)
         self._storage = storage
+        self._stage_timings = _get_stage_timings(self.conf)
 
     @property
     def capabilities(self):
         return self._storage.capabilities()
 
     def close(self):
+        # NOTE: Stages such as the notifier run threads of their own.
+        if hasattr(self, '_lazy_message_controller'):
+            for stage in self._lazy_message_controller.stages:
+                if hasattr(stage, 'close'):
+                    stage.close()
+
         self._storage.close()
 
     def is_alive(self):
         return self._storage.is_alive()
 
     def _health(self):
-        return self._storage._health()
+        health = self._storage._health() or {}
+
+        # NOTE: The notifier is a stage of the message pipeline, report
+        # its deliveries once the pipeline has been built.
+        if hasattr(self, '_lazy_message_controller'):
+            for stage in self._lazy_message_controller.stages:
+                if hasattr(stage, 'delivery_stats'):
+                    health['notifications'] = stage.delivery_stats()
+
+        health['stages'] = self._stage_timings.stats()
+        return health
+
+    def occupancy(self, detailed=False):
+        return self._storage.occupancy(detailed=detailed)
+
+    @property
+    def migration_controller(self):
+        # NOTE: Only pooled storage knows how to migrate queues.
+        return self._storage.migration_controller
+
+    @property
+    def pool_stats_controller(self):
+        # NOTE: Only pooled storage has pools to report about.
+        return self._storage.pool_stats_controller
 
     @decorators.lazy_property(write=False)
     def queue_controller(self):
@@ -126,7 +221,7 @@ class DataDriver(base.DataDriverBase):
                                            self.control_driver, self.conf)
         stages.extend(_get_storage_pipeline('queue', self.conf))
         stages.append(self._storage.queue_controller)
-        return common.Pipeline(stages)
+        return common.Pipeline(stages, timer=self._stage_timings)
 
     @decorators.lazy_property(write=False)
     def message_controller(self):
@@ -136,13 +231,26 @@ class DataDriver(base.DataDriverBase):
                   self._storage.subscription_controller,
                   'max_notifier_workers':
                   self.conf.notification.max_notifier_workers,
+                  'max_notifier_workers_per_host':
+                  self.conf.notification.max_notifier_workers_per_host,
+                  'max_notifier_backlog':
+                  self.conf.notification.max_notifier_backlog,
+                  'cache': self._storage.cache,
+                  'subscriber_cache_ttl':
+                  self.conf.notification.subscriber_cache_ttl,
+                  'mailto_digest_window':
+                  self.conf.notification.mailto_digest_window,
+                  'subscriber_failure_threshold':
+                  self.conf.notification.subscriber_failure_threshold,
+                  'subscriber_open_interval':
+                  self.conf.notification.subscriber_open_interval,
                   'require_confirmation':
                   self.conf.notification.require_confirmation,
                   'queue_controller':
                   self._storage.queue_controller}
         stages.extend(_get_storage_pipeline('message', self.conf, **kwargs))
         stages.append(self._storage.message_controller)
-        return common.Pipeline(stages)
+        return common.Pipeline(stages, timer=self._stage_timings)
 
     @decorators.lazy_property(write=False)
     def claim_controller(self):
@@ -150,7 +258,7 @@ class DataDriver(base.DataDriverBase):
                                            self.control_driver, self.conf)
         stages.extend(_get_storage_pipeline('claim', self.conf))
         stages.append(self._storage.claim_controller)
-        return common.Pipeline(stages)
+        return common.Pipeline(stages, timer=self._stage_timings)
 
     @decorators.lazy_property(write=False)
     def subscription_controller(self):
@@ -158,7 +266,7 @@ class DataDriver(base.DataDriverBase):
                                            self.control_driver, self.conf)
         stages.extend(_get_storage_pipeline('subscription', self.conf))
         stages.append(self._storage.subscription_controller)
-        return common.Pipeline(stages)
+        return common.Pipeline(stages, timer=self._stage_timings)
 
     @decorators.lazy_property(write=False)
     def topic_controller(self):
@@ -166,4 +274,4 @@ class DataDriver(base.DataDriverBase):
                                            self.control_driver, self.conf)
         stages.extend(_get_storage_pipeline('topic', self.conf))
         stages.append(self._storage.topic_controller)
-        return common.Pipeline(stages)
+        return common.Pipeline(stages, timer=self._stage_timings)
@@ -13,15 +13,21 @@
 # License for the specific language governing permissions and limitations under
 # the License.
 
-import heapq
+import collections
+from collections import abc
 import itertools
+import operator
+import threading
+import time
 
+import futurist
+from oslo_cache import core
 from oslo_log import log
 from osprofiler import profiler
+import stevedore
 
 from zaqar.common import decorators
 from zaqar.common import errors as cerrors
-from zaqar.common.storage import select
 from zaqar.conf import pooling_catalog
 from zaqar.i18n import _
 from zaqar import storage
@@ -35,6 +41,11 @@ LOG = log.getLogger(__name__)
 # NOTE(kgriffs): E.g.: 'zaqar-pooling:5083853/my-queue'
 _POOL_CACHE_PREFIX = 'pooling:'
 
+# NOTE: Marks queues that aren't in the catalogue.
+_UNMAPPED_CACHE_PREFIX = 'pooling.unmapped:'
+
+_POOL_STATS_CACHE_PREFIX = 'pooling.stats:'
+
 # TODO(kgriffs): If a queue is migrated, everyone's
 # caches need to have the relevant entry invalidated
 # before "unfreezing" the queue, rather than waiting
@@ -51,6 +62,24 @@ def _pool_cache_key(queue, project=None):
     return _POOL_CACHE_PREFIX + str(project) + '/' + queue
 
 
+def _unmapped_cache_key(queue, project=None):
+    return _UNMAPPED_CACHE_PREFIX + str(project) + '/' + queue
+
+
+def _pool_stats_cache_key(pool_id):
+    return _POOL_STATS_CACHE_PREFIX + pool_id
+
+
+def _catalogue_entry(entry):
+    return {'pool': entry['pool'],
+            'migrating_to': entry.get('migrating_to')}
+
+
+# NOTE: Prefixes the markers of the messages listed from the pool a queue
+# is migrating to, so that the next page is listed from the same pool.
+_MIGRATION_MARKER_PREFIX = 'migrating:'
+
+
 class DataDriver(storage.DataDriverBase):
     """Pooling meta-driver for routing requests to multiple backends.
 
@@ -82,11 +111,7 @@ class DataDriver(storage.DataDriverBase):
         return self.BASE_CAPABILITIES
 
     def close(self):
-        cursor = self._pool_catalog._pools_ctrl.list(limit=0)
-        # Messages of each pool
-        for pool in next(cursor):
-            driver = self._pool_catalog.get_driver(pool['name'])
-            driver.close()
+        self._pool_catalog.close()
 
     def is_alive(self):
         cursor = self._pool_catalog._pools_ctrl.list(limit=0)
@@ -99,6 +124,7 @@ class DataDriver(storage.DataDriverBase):
         # Leverage the is_alive to indicate if the backend storage is
         # reachable or not
         KPI['catalog_reachable'] = self.is_alive()
+        KPI['catalog_drivers'] = self._pool_catalog.drivers_stats()
 
         cursor = self._pool_catalog._pools_ctrl.list(limit=0)
         # Messages of each pool
@@ -155,6 +181,14 @@ class DataDriver(storage.DataDriverBase):
         else:
             return controller
 
+    @decorators.lazy_property(write=False)
+    def migration_controller(self):
+        return QueueMigrationController(self._pool_catalog)
+
+    @decorators.lazy_property(write=False)
+    def pool_stats_controller(self):
+        return PoolStatsController(self._pool_catalog)
+
 
 class QueueController(storage.Queue):
     """Routes operations to get the appropriate queue controller.
@@ -173,31 +207,17 @@ class QueueController(storage.Queue):
               limit=storage.DEFAULT_QUEUES_PER_PAGE, detailed=False,
               name=None):
 
-        def all_pages():
-            yield next(self._mgt_queue_ctrl.list(
-                project=project,
-                kfilter=kfilter,
-                marker=marker,
-                limit=limit,
-                detailed=detailed,
-                name=name))
-
-        # make a heap compared with 'name'
-        ls = heapq.merge(*[
-            utils.keyify('name', page)
-            for page in all_pages()
-        ])
-
-        marker_name = {}
-
-        # limit the iterator and strip out the comparison wrapper
-        def it():
-            for queue_cmp in itertools.islice(ls, limit):
-                marker_name['next'] = queue_cmp.obj['name']
-                yield queue_cmp.obj
-
-        yield it()
-        yield marker_name and marker_name['next']
+        # NOTE: In pooled deployments the queue records only live in the
+        # management store, the pools merely hold their messages, so the
+        # management store listing is already complete and ordered by name.
+        # Hand its cursor over as is instead of re-merging and re-slicing
+        # a single page.
+        return self._mgt_queue_ctrl.list(project=project,
+                                         kfilter=kfilter,
+                                         marker=marker,
+                                         limit=limit,
+                                         detailed=detailed,
+                                         name=name)
 
     def _get(self, name, project=None):
         try:
@@ -407,20 +427,20 @@ class SubscriptionController(storage.Subscription):
         if control:
             return control.get(queue, subscription_id, project=project)
 
-    def create(self, queue, subscriber, ttl, options, project=None):
+    def _create(self, queue, subscriber, ttl, options, project=None):
         control = self._get_controller(queue, project)
         if control:
             return control.create(queue, subscriber,
                                   ttl, options,
                                   project=project)
 
-    def update(self, queue, subscription_id, project=None, **kwargs):
+    def _update(self, queue, subscription_id, project=None, **kwargs):
         control = self._get_controller(queue, project)
         if control:
             return control.update(queue, subscription_id,
                                   project=project, **kwargs)
 
-    def delete(self, queue, subscription_id, project=None):
+    def _delete(self, queue, subscription_id, project=None):
         control = self._get_controller(queue, project)
         if control:
             return control.delete(queue, subscription_id,
@@ -432,7 +452,7 @@ class SubscriptionController(storage.Subscription):
             return control.exists(queue, subscription_id,
                                   project=project)
 
-    def confirm(self, queue, subscription_id, project=None, confirmed=None):
+    def _confirm(self, queue, subscription_id, project=None, confirmed=None):
         control = self._get_controller(queue, project)
         if control:
             return control.confirm(queue, subscription_id,
@@ -443,12 +463,1189 @@ class SubscriptionController(storage.Subscription):
         if control:
             return control.get_with_subscriber(queue, subscriber, project)
 
+    # NOTE: The controllers of the pools forget the subscribers of their
+    # queues, and the health of their subscriptions, themselves.
+    def _forget_subscribers(self, queue, project=None):
+        pass
+
+    def _forget_health(self, subscription_id):
+        pass
+
+
+class CatalogueSnapshot:
+    """In-process copy of the queue to pool mappings of the catalogue.
+
+    Mappings are loaded from the catalogue when first looked up, and kept
+    up to date by polling the catalogue changes at most once every
+    `refresh_interval` seconds. When the changes can't be known, e.g. when
+    this worker lagged too far behind, the whole snapshot is dropped.
+    Concurrent writers may journal their changes out of order though, so
+    a hole in the changes is only trusted once it outlives a poll.
+
+    :param catalogue_ctrl: The catalogue controller of the control driver
+    :param refresh_interval: Seconds between two polls of the changes
+    :param max_size: Maximum number of mappings kept in memory
+    :param unmapped_ttl: Seconds during which queues found not to be in
+        the catalogue are remembered as such, 0 to always look them up
+    :raises NotImplementedError: if the catalogue doesn't keep track of
+        its changes
+    """
+
+    def __init__(self, catalogue_ctrl, refresh_interval, max_size,
+                 unmapped_ttl=0):
+        self._catalogue_ctrl = catalogue_ctrl
+        self._refresh_interval = refresh_interval
+        self._max_size = max_size
+        self._unmapped_ttl = unmapped_ttl
+        self._entries = {}
+        # NOTE: Maps the queues that aren't in the catalogue to the time
+        # until which they're remembered as such.
+        self._unmapped = {}
+        # NOTE: Bumped whenever entries are invalidated, so that a mapping
+        # read from the catalogue before an invalidation isn't stored.
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._version, _ = catalogue_ctrl.changes()
+        self._next_refresh = time.monotonic() + refresh_interval
+        # NOTE: Whether the last poll found a hole in the changes.
+        self._hole = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def refresh(self, force=False):
+        """Polls the catalogue changes, if it's time to."""
+        now = time.monotonic()
+        if now < self._next_refresh and not force:
+            return
+
+        # NOTE: Don't make concurrent lookups wait for the poll, they can
+        # use the current snapshot until it completes.
+        if not self._lock.acquire(blocking=False):
+            return
+
+        try:
+            self._next_refresh = now + self._refresh_interval
+            try:
+                version, changed = self._catalogue_ctrl.changes(
+                    self._version)
+            except Exception:
+                LOG.exception('Failed to poll the catalogue changes, '
+                              'dropping the catalogue snapshot.')
+                version, changed = None, None
+
+            if changed is None and version is not None and not self._hole:
+                # NOTE: Poll the same changes again, the missing ones may
+                # just not be journaled yet.
+                self._hole = True
+                return
+            self._hole = False
+
+            if changed is None:
+                self._generation += 1
+                self._entries.clear()
+                self._unmapped.clear()
+            elif changed:
+                self._generation += 1
+                for project, queue in changed:
+                    self._entries.pop((project, queue), None)
+                    self._unmapped.pop((project, queue), None)
+            self._version = version
+        finally:
+            self._lock.release()
+
+    def warm(self):
+        """Loads mappings from the catalogue before they are looked up.
+
+        Loading stops when entries get invalidated meanwhile, the entries
+        left are then looked up when needed.
+        """
+        generation = self._generation
+        try:
+            for entry in self._catalogue_ctrl.list_all(limit=self._max_size):
+                if generation != self._generation:
+                    return
+                key = (entry['project'] or None, entry['queue'])
+                self._entries.setdefault(key, _catalogue_entry(entry))
+        except NotImplementedError:
+            pass
+        except Exception:
+            LOG.exception('Failed to load the catalogue snapshot.')
+
+    def entry(self, queue, project=None):
+        """Gets the catalogue entry of the given queue.
+
+        :returns: {'pool': ..., 'migrating_to': ...}
+        :raises QueueNotMapped: if queue is not mapped
+        """
+        self.refresh()
+        key = (project or None, queue)
+        try:
+            return self._entries[key]
+        except KeyError:
+            pass
+
+        now = time.monotonic()
+        if self._unmapped.get(key, 0) > now:
+            raise errors.QueueNotMapped(queue, project)
+
+        generation = self._generation
+        try:
+            entry = _catalogue_entry(self._catalogue_ctrl.get(project, queue))
+        except errors.QueueNotMapped:
+            if self._unmapped_ttl and generation == self._generation:
+                self._store(self._unmapped, key, now + self._unmapped_ttl)
+            raise
+
+        if generation == self._generation:
+            self._store(self._entries, key, entry)
+        return entry
+
+    def _store(self, entries, key, value):
+        if len(entries) >= self._max_size:
+            try:
+                del entries[next(iter(entries))]
+            except (KeyError, RuntimeError, StopIteration):
+                # NOTE: Another thread changed the entries meanwhile.
+                pass
+        entries[key] = value
+
+    def pool_id(self, queue, project=None):
+        """Gets the ID of the pool assigned to the given queue.
+
+        :raises QueueNotMapped: if queue is not mapped
+        """
+        return self.entry(queue, project)['pool']
+
+    def forget(self, queue, project=None):
+        """Drops the mapping of a queue changed by this worker."""
+        self._generation += 1
+        self._entries.pop((project or None, queue), None)
+        self._unmapped.pop((project or None, queue), None)
+
+
+class _PoolStats:
+
+    __slots__ = ('success_rate', 'latency', 'failures', 'opened_at')
+
+    def __init__(self):
+        self.success_rate = 1.0
+        self.latency = 0.0
+        self.failures = 0
+        self.opened_at = None
+
+
+class PoolHealth:
+    """Tracks the health of the pools from the traffic routed to them.
+
+    Each pool gets exponentially weighted moving averages of its success
+    rate and latency, fed by the storage calls routed to it and by the
+    `is_alive` probes made in the background. A pool failing
+    `failure_threshold` times in a row is considered down: its circuit is
+    opened, and no queue is placed on it for `reset_timeout` seconds. The
+    next call or probe then decides whether it's closed again.
+
+    :param failure_threshold: Consecutive failures opening the circuit
+    :param reset_timeout: Seconds before an open circuit is tried again
+    :param latency_target: Latency above which the headroom is reduced
+    """
+
+    # NOTE: Weight of the latest observation in the moving averages.
+    ALPHA = 0.2
+
+    def __init__(self, failure_threshold, reset_timeout, latency_target):
+        self._failure_threshold = failure_threshold
+        self._reset_timeout = reset_timeout
+        self._latency_target = latency_target
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, pool_id, latency, ok):
+        """Records the outcome of a call made to a pool.
+
+        :param pool_id: The name of the pool
+        :param latency: Duration of the call, in seconds
+        :param ok: Whether the call succeeded
+        """
+        with self._lock:
+            stats = self._stats.setdefault(pool_id, _PoolStats())
+            stats.success_rate += self.ALPHA * (ok - stats.success_rate)
+            if ok:
+                stats.latency += self.ALPHA * (latency - stats.latency)
+                stats.failures = 0
+                if stats.opened_at is not None:
+                    LOG.info('Pool %s recovered, closing its circuit.',
+                             pool_id)
+                    stats.opened_at = None
+                return
+
+            stats.failures += 1
+            if stats.failures >= self._failure_threshold:
+                if stats.opened_at is None:
+                    LOG.warning('Pool %(pool)s failed %(count)d times in a '
+                                'row, opening its circuit.',
+                                {'pool': pool_id, 'count': stats.failures})
+                # NOTE: Failing again after the reset timeout keeps the
+                # circuit open for another period.
+                stats.opened_at = time.monotonic()
+
+    def is_open(self, pool_id):
+        """Whether the pool is down and must be left out of placement."""
+        stats = self._stats.get(pool_id)
+        if stats is None or stats.opened_at is None:
+            return False
+        return time.monotonic() - stats.opened_at < self._reset_timeout
+
+    def headroom(self, pool_id):
+        """Estimates how much of its capacity a pool has left.
+
+        :returns: A factor between 0 and 1, derived from the observed
+            success rate and latency of the pool.
+        """
+        stats = self._stats.get(pool_id)
+        if stats is None:
+            return 1.0
+        headroom = stats.success_rate
+        if stats.latency > self._latency_target:
+            headroom *= self._latency_target / stats.latency
+        return headroom
+
+    def probe(self, pool_id, driver):
+        """Checks whether a pool is alive.
+
+        :param pool_id: The name of the pool
+        :param driver: The storage driver of the pool
+        """
+        now = time.monotonic()
+        try:
+            ok = bool(driver.is_alive())
+        except Exception:
+            LOG.exception('Failed to probe pool %s.', pool_id)
+            ok = False
+        self.record(pool_id, time.monotonic() - now, ok)
+
+
+class _Periodic:
+    """Calls `refresh` every `interval` seconds in a background thread."""
+
+    def __init__(self, interval, name):
+        self._interval = interval
+        self._stopped = threading.Event()
+        self._started = False
+        self._lock = threading.Lock()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name=name)
+
+    def start(self):
+        """Starts the background thread, unless it's already started."""
+        with self._lock:
+            if self._started:
+                return
+            self._started = True
+        self._thread.start()
+
+    def stop(self):
+        """Stops the background thread."""
+        self._stopped.set()
+
+    def _run(self):
+        while not self._stopped.is_set():
+            self.refresh()
+            self._stopped.wait(self._interval)
+
+    def refresh(self):
+        raise NotImplementedError
+
+
+class PoolProber(_Periodic):
+    """Probes the pools in the background, feeding their health.
+
+    Probing a pool that is down takes as long as its connection timeout,
+    so it's never done when placing a queue: a background thread probes
+    the pools every `interval` seconds instead.
+
+    :param probe: Function probing the pools
+    :param interval: Seconds between two rounds of probes
+    """
+
+    def __init__(self, probe, interval):
+        super().__init__(interval, 'zaqar-pool-probes')
+        self._probe = probe
+
+    def refresh(self):
+        """Probes the pools."""
+        try:
+            self._probe()
+        except Exception:
+            LOG.exception('Failed to probe the pools.')
+
+
+class PoolOccupancy(_Periodic):
+    """Keeps samples of the number of queues and messages of the pools.
+
+    Counting what every pool holds is too slow to be done when placing a
+    queue, so a background thread takes a sample every `interval` seconds.
+    In between, the queues placed by this worker are added to the samples,
+    so that a burst of new queues doesn't all land on the same pool.
+
+    :param sample: Function returning {pool: (queues, messages)}, with
+        None for the counts that aren't known
+    :param interval: Seconds between two samples
+    """
+
+    def __init__(self, sample, interval):
+        super().__init__(interval, 'zaqar-pool-occupancy')
+        self._sample = sample
+        self._counts = {}
+
+    def refresh(self):
+        """Takes a new sample."""
+        try:
+            counts = self._sample()
+        except Exception:
+            LOG.exception('Failed to sample the occupancy of the pools.')
+            return
+        self._counts = dict((pool_id, list(pool_counts))
+                            for pool_id, pool_counts in counts.items())
+
+    def placed(self, pool_id):
+        """Accounts for a queue placed on a pool since the last sample.
+
+        Pools added since the last sample are assumed to be empty until
+        the next one.
+        """
+        pool_counts = self._counts.setdefault(pool_id, [0, 0])
+        if pool_counts[0] is not None:
+            pool_counts[0] += 1
+
+    def load(self, pool_id):
+        """Returns the share of the queues and messages held by a pool.
+
+        Queues, or messages, are only accounted for if they were counted
+        in every pool.
+
+        :returns: The sum of the shares of the queues and of the messages
+            held by the pool, between 0 and 2. 0 for unknown pools.
+        """
+        counts = list(self._counts.values())
+        pool_counts = self._counts.get(pool_id)
+        if pool_counts is None:
+            return 0.0
+
+        load = 0.0
+        for i, count in enumerate(pool_counts):
+            column = [c[i] for c in counts]
+            if None in column:
+                continue
+            total = sum(column)
+            if total:
+                load += count / total
+        return load
+
+
+class _TrackedController:
+    """Reports the outcome of the calls made to a pool controller."""
+
+    def __init__(self, controller, pool_id, health):
+        self._controller = controller
+        self._pool_id = pool_id
+        self._health = health
+
+    def __getattr__(self, name):
+        method = getattr(self._controller, name)
+        if not callable(method):
+            return method
+
+        def call(*args, **kwargs):
+            start = time.monotonic()
+            try:
+                result = method(*args, **kwargs)
+            except Exception as ex:
+                self._record(start, ex)
+                raise
+
+            # NOTE: Iterators, e.g. listings, only reach the storage when
+            # they're consumed, so they're tracked one step at a time.
+            if isinstance(result, abc.Iterator):
+                return _TrackedIterator(result, self)
+            self._record(start)
+            return result
+
+        return call
+
+    def _record(self, start, error=None):
+        # NOTE: Errors other than connection ones mean the pool answered,
+        # the request was just invalid.
+        ok = (error is None or isinstance(error, StopIteration) or
+              (isinstance(error, errors.ExceptionBase) and
+               not isinstance(error, errors.ConnectionError)))
+        self._health.record(self._pool_id, time.monotonic() - start, ok)
+
+
+class _TrackedIterator:
+    """Reports the outcome of each step of an iterator of a pool."""
+
+    def __init__(self, iterator, controller):
+        self._iterator = iterator
+        self._controller = controller
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.monotonic()
+        try:
+            item = next(self._iterator)
+        except Exception as ex:
+            self._controller._record(start, ex)
+            raise
+        self._controller._record(start)
+        return item
+
+
+class _MigratingQueueController:
+    """Routes queue operations to both pools of a migrating queue."""
+
+    def __init__(self, source, destination):
+        self._source = source
+        self._destination = destination
+
+    def __getattr__(self, name):
+        return getattr(self._source, name)
+
+    def delete(self, name, project=None):
+        self._destination.delete(name, project=project)
+        return self._source.delete(name, project=project)
+
+    def stats(self, name, project=None):
+        source = self._source.stats(name, project=project)['messages']
+        destination = self._destination.stats(
+            name, project=project)['messages']
+
+        stats = {key: source[key] + destination[key]
+                 for key in ('claimed', 'free', 'total')}
+        edges = [entry for entry in (source, destination) if 'oldest' in entry]
+        if edges:
+            stats['oldest'] = max((entry['oldest'] for entry in edges),
+                                  key=lambda message: message['age'])
+            stats['newest'] = min((entry['newest'] for entry in edges),
+                                  key=lambda message: message['age'])
+        return {'messages': stats}
+
+
+class _MigratingMessageController:
+    """Routes message operations to both pools of a migrating queue.
+
+    New messages are posted to the pool the queue is migrating to, the
+    others are read from the pool the queue is migrating from first, since
+    it holds the oldest messages.
+    """
+
+    def __init__(self, source, destination):
+        self._source = source
+        self._destination = destination
+
+    def __getattr__(self, name):
+        return getattr(self._source, name)
+
+    def post(self, queue, messages, client_uuid, project=None):
+        return self._destination.post(queue, project=project,
+                                      messages=messages,
+                                      client_uuid=client_uuid)
+
+    def delete(self, queue, message_id, project=None, claim=None):
+        # NOTE: Claim IDs of a pool may be invalid for the other one, so
+        # only delete the message from the pool holding it.
+        try:
+            self._source.get(queue, message_id=message_id, project=project)
+        except errors.MessageDoesNotExist:
+            return self._destination.delete(queue, project=project,
+                                            message_id=message_id,
+                                            claim=claim)
+        return self._source.delete(queue, project=project,
+                                   message_id=message_id, claim=claim)
+
+    def bulk_delete(self, queue, message_ids, project=None, claim_ids=None):
+        found = {message['id'] for message in self._source.bulk_get(
+            queue, project=project, message_ids=message_ids)}
+        missing = [mid for mid in message_ids if mid not in found]
+        if missing:
+            self._destination.bulk_delete(queue, project=project,
+                                          message_ids=missing,
+                                          claim_ids=claim_ids)
+        if found:
+            self._source.bulk_delete(queue, project=project,
+                                     message_ids=[mid for mid in message_ids
+                                                  if mid in found],
+                                     claim_ids=claim_ids)
+
+    def pop(self, queue, limit, project=None):
+        messages = list(self._source.pop(queue, project=project,
+                                         limit=limit) or [])
+        if len(messages) < limit:
+            messages.extend(self._destination.pop(
+                queue, project=project, limit=limit - len(messages)) or [])
+        return messages
+
+    def bulk_get(self, queue, message_ids, project=None):
+        messages = list(self._source.bulk_get(queue, project=project,
+                                              message_ids=message_ids))
+        found = {message['id'] for message in messages}
+        missing = [mid for mid in message_ids if mid not in found]
+        if missing:
+            messages.extend(self._destination.bulk_get(
+                queue, project=project, message_ids=missing))
+        return iter(messages)
+
+    def list(self, queue, project=None, marker=None,
+             limit=storage.DEFAULT_MESSAGES_PER_PAGE,
+             echo=False, client_uuid=None, include_claimed=False,
+             include_delayed=False):
+        kwargs = {'project': project, 'echo': echo,
+                  'client_uuid': client_uuid,
+                  'include_claimed': include_claimed,
+                  'include_delayed': include_delayed}
+
+        messages = []
+        next_marker = None
+        if not (marker or '').startswith(_MIGRATION_MARKER_PREFIX):
+            cursor = self._source.list(queue, marker=marker, limit=limit,
+                                       **kwargs)
+            messages = list(next(cursor))
+            next_marker = next(cursor)
+            marker = None
+        else:
+            marker = marker[len(_MIGRATION_MARKER_PREFIX):]
+
+        if len(messages) < limit:
+            cursor = self._destination.list(queue, marker=marker,
+                                            limit=limit - len(messages),
+                                            **kwargs)
+            more = list(next(cursor))
+            if more:
+                messages.extend(more)
+                next_marker = _MIGRATION_MARKER_PREFIX + str(next(cursor))
+
+        yield iter(messages)
+        yield next_marker
+
+    def get(self, queue, message_id, project=None):
+        try:
+            return self._source.get(queue, message_id=message_id,
+                                    project=project)
+        except errors.MessageDoesNotExist:
+            return self._destination.get(queue, message_id=message_id,
+                                         project=project)
+
+    def first(self, queue, project=None, sort=1):
+        try:
+            return self._source.first(queue, project=project, sort=sort)
+        except errors.QueueIsEmpty:
+            return self._destination.first(queue, project=project,
+                                           sort=sort)
+
+
+class _MigratingClaimController:
+    """Routes claim operations to both pools of a migrating queue."""
+
+    def __init__(self, source, destination):
+        self._source = source
+        self._destination = destination
+
+    def __getattr__(self, name):
+        return getattr(self._source, name)
+
+    def create(self, queue, metadata, project=None,
+               limit=storage.DEFAULT_MESSAGES_PER_CLAIM):
+        # NOTE: A claim only spans a single pool, messages are claimed from
+        # the pool the queue is migrating to once the other one is empty.
+        claim_id, messages = self._source.create(queue, metadata=metadata,
+                                                 project=project,
+                                                 limit=limit)
+        messages = list(messages)
+        if messages:
+            return claim_id, messages
+        return self._destination.create(queue, metadata=metadata,
+                                        project=project, limit=limit)
+
+    def get(self, queue, claim_id, project=None):
+        try:
+            return self._source.get(queue, claim_id=claim_id,
+                                    project=project)
+        except errors.ClaimDoesNotExist:
+            return self._destination.get(queue, claim_id=claim_id,
+                                         project=project)
+
+    def update(self, queue, claim_id, metadata, project=None):
+        try:
+            return self._source.update(queue, claim_id=claim_id,
+                                       project=project, metadata=metadata)
+        except errors.ClaimDoesNotExist:
+            return self._destination.update(queue, claim_id=claim_id,
+                                            project=project,
+                                            metadata=metadata)
+
+    def delete(self, queue, claim_id, project=None):
+        try:
+            self._source.get(queue, claim_id=claim_id, project=project)
+        except errors.ClaimDoesNotExist:
+            return self._destination.delete(queue, claim_id=claim_id,
+                                            project=project)
+        return self._source.delete(queue, claim_id=claim_id,
+                                   project=project)
+
+
+_MIGRATING_CONTROLLERS = {
+    'queue_controller': _MigratingQueueController,
+    'message_controller': _MigratingMessageController,
+    'claim_controller': _MigratingClaimController,
+}
+
+
+class QueueMigrationController:
+    """Moves queues from one pool to another.
+
+    Migrating a queue goes through the following steps:
+
+    1. `start` creates the queue in the new pool, copies its
+       subscriptions there and marks the queue as migrating in the
+       catalogue. From then on, new messages are posted to the new pool,
+       the subscriptions are served from it and other operations span
+       both pools.
+    2. `move` is called until the old pool is empty. It claims messages
+       from the old pool, so that consumers don't get them meanwhile,
+       posts them to the new pool and deletes them from the old one.
+    3. `finish` copies the metadata of the queue to the new pool again
+       and flips its catalogue entry to the new pool, once the old pool
+       is empty.
+
+    Since migrations are recorded in the catalogue, they can be resumed
+    by running them again, see `list`.
+
+    Workers may route requests according to a stale catalogue for a short
+    while after `finish`, messages posted to the old pool in that window
+    are moved by calling `move` again.
+
+    :param pool_catalog: a catalog of available pools
+    :type pool_catalog: queues.pooling.base.Catalog
+    """
+
+    # NOTE: Long enough for a batch of messages to be moved, if the move
+    # fails half way, the messages are released when the claim expires.
+    CLAIM_TTL = 300
+
+    # NOTE: Metadata of the queue in the new pool listing the IDs of the
+    # messages copied there, but not deleted from the old pool yet.
+    COPIED_KEY = '_migration_copied'
+
+    def __init__(self, pool_catalog):
+        self._pool_catalog = pool_catalog
+        self._catalogue_ctrl = pool_catalog._catalogue_ctrl
+
+    def _storage(self, pool_id):
+        # NOTE: Bypass the storage pipeline of the pool, moved messages
+        # mustn't be notified to the subscribers again.
+        return self._pool_catalog.get_driver(pool_id)._storage
+
+    def get(self, queue, project=None):
+        """Reports the progress of the migration of a queue.
+
+        :returns: {'queue': ..., 'project': ..., 'pool': ...,
+            'migrating_to': ..., 'remaining': ...} where `remaining` is
+            the number of messages left in the old pool.
+        :raises QueueNotMapped: if queue is not mapped
+        """
+        entry = self._catalogue_ctrl.get(project, queue)
+        migration = {
+            'queue': queue,
+            'project': project,
+            'pool': entry['pool'],
+            'migrating_to': entry.get('migrating_to'),
+            'remaining': 0,
+        }
+        if migration['migrating_to'] is not None:
+            migration['remaining'] = self.remaining(queue, entry['pool'],
+                                                    project)
+        return migration
+
+    def list(self, pool=None):
+        """Lists the migrations in progress.
+
+        :param pool: Only list the queues migrating to this pool
+        :returns: [{'queue': ..., 'project': ..., 'pool': ...,
+            'migrating_to': ...},]
+        :raises NotImplementedError: if the catalogue can't list them
+        """
+        return self._catalogue_ctrl.migrations(pool)
+
+    def remaining(self, queue, pool, project=None):
+        """Counts the messages of a queue left in a pool.
+
+        The count comes from the queue stats, so it may include messages
+        which expired but weren't removed yet.
+        """
+        storage = self._storage(pool)
+        try:
+            stats = storage.queue_controller.stats(queue, project=project)
+        except errors.QueueDoesNotExist:
+            return 0
+        return stats['messages']['total']
+
+    def _drained(self, queue, pool, project):
+        # NOTE: Listed messages exclude the expired ones, unlike the
+        # stats of some stores.
+        controller = self._storage(pool).message_controller
+        try:
+            cursor = controller.list(queue, project=project, limit=1,
+                                     echo=True, include_claimed=True,
+                                     include_delayed=True)
+            return not list(next(cursor))
+        except errors.QueueDoesNotExist:
+            return True
+
+    def start(self, queue, pool, project=None):
+        """Starts migrating a queue to another pool.
+
+        Starting a migration that is already in progress is a no-op.
+
+        :param queue: Name of the queue
+        :param pool: Name of the pool to migrate the queue to
+        :param project: Project to which the queue belongs
+        :returns: The name of the pool the queue is migrating from
+        :raises QueueNotMapped: if queue is not mapped
+        :raises PoolDoesNotExist: if the pool doesn't exist
+        :raises QueueAlreadyInPool: if the queue already lives in the pool
+        :raises QueueIsMigrating: if the queue is migrating to another pool
+        """
+        entry = self._catalogue_ctrl.get(project, queue)
+        self._pool_catalog._pools_ctrl.get(pool)
+
+        if entry['pool'] == pool:
+            raise errors.QueueAlreadyInPool(queue, project, pool)
+        if entry.get('migrating_to') not in (None, pool):
+            raise errors.QueueIsMigrating(queue, project,
+                                          entry['migrating_to'])
+
+        # NOTE: Creating the queue is a no-op if it was created already,
+        # e.g. by a migration started by an earlier version.
+        self._copy_queue(queue, entry['pool'], pool, project)
+        if entry.get('migrating_to') == pool:
+            return entry['pool']
+
+        self._copy_subscriptions(queue, entry['pool'], pool, project)
+        self._catalogue_ctrl.migrate(project, queue, pool)
+        self._pool_catalog._forget(queue, project)
+        LOG.info('Started migrating queue %(queue)s of project %(project)s '
+                 'from pool %(source)s to pool %(pool)s.',
+                 {'queue': queue, 'project': project,
+                  'source': entry['pool'], 'pool': pool})
+        return entry['pool']
+
+    def _metadata(self, queue, pool, project):
+        controller = self._storage(pool).queue_controller
+        try:
+            return dict(controller.get_metadata(queue, project=project))
+        except errors.QueueDoesNotExist:
+            return {}
+
+    def _copy_queue(self, queue, source, destination, project):
+        controller = self._storage(destination).queue_controller
+        controller.create(queue, metadata=self._metadata(queue, source,
+                                                         project),
+                          project=project)
+
+    def _record_copied(self, queue, pool, project, copied=(), deleted=()):
+        metadata = self._metadata(queue, pool, project)
+        ids = set(metadata.get(self.COPIED_KEY, ()))
+        ids = ids.union(copied).difference(deleted)
+        if ids:
+            metadata[self.COPIED_KEY] = sorted(ids)
+        elif self.COPIED_KEY in metadata:
+            del metadata[self.COPIED_KEY]
+        else:
+            return
+        self._storage(pool).queue_controller.set_metadata(
+            queue, metadata, project=project)
+
+    def _subscriptions(self, queue, pool, project):
+        controller = self._storage(pool).subscription_controller
+        marker = None
+        while True:
+            cursor = controller.list(queue, project=project, marker=marker)
+            subscriptions = list(next(cursor))
+            if not subscriptions:
+                return
+            yield from subscriptions
+            marker = next(cursor)
+
+    def _copy_subscriptions(self, queue, source, destination, project):
+        controller = self._storage(destination).subscription_controller
+        for subscription in self._subscriptions(queue, source, project):
+            ttl = max(subscription['ttl'] - subscription['age'], 1)
+            subscription_id = controller.create(queue,
+                                                subscription['subscriber'],
+                                                ttl,
+                                                subscription['options'],
+                                                project=project)
+            if subscription_id and subscription.get('confirmed'):
+                controller.confirm(queue, subscription_id, project=project,
+                                   confirmed=True)
+
+    def move(self, queue, source, destination, project=None, limit=10):
+        """Moves a batch of messages from a pool to another.
+
+        Messages are posted again to the new pool, on behalf of the clients
+        that posted them, and in the order they were claimed. They get new
+        IDs and their claim counts start over. Since messages posted after
+        `start` go straight to the new pool, moved messages are queued
+        behind them.
+
+        Messages are only deleted from the old pool once posted to the new
+        one, and their IDs are recorded in between. If the move is
+        interrupted, the messages are claimed again once their claim
+        expires, and those already posted are only deleted. A move
+        interrupted between a post and its record still posts the
+        messages twice.
+
+        :param limit: Maximum number of messages to move
+        :returns: The number of messages moved
+        """
+        source_storage = self._storage(source)
+        metadata = {'ttl': self.CLAIM_TTL, 'grace': 0}
+        claim_id, messages = source_storage.claim_controller.create(
+            queue, metadata, project=project, limit=limit)
+        messages = list(messages)
+        if not messages:
+            return 0
+
+        copied = self._metadata(queue, destination,
+                                project).get(self.COPIED_KEY, ())
+        pending = [message for message in messages
+                   if message['id'] not in copied]
+
+        controller = self._storage(destination).message_controller
+        for client_uuid, batch in itertools.groupby(
+                pending, operator.itemgetter('client_uuid')):
+            batch = list(batch)
+            posted = [{'body': message['body'],
+                       'ttl': max(message['ttl'] - message['age'], 1)}
+                      for message in batch]
+            controller.post(queue, posted, client_uuid, project=project)
+            self._record_copied(queue, destination, project,
+                                copied=[message['id'] for message in batch])
+
+        ids = [message['id'] for message in messages]
+        source_storage.message_controller.bulk_delete(
+            queue, ids, project=project, claim_ids=[claim_id])
+        self._record_copied(queue, destination, project, deleted=ids)
+        return len(messages)
+
+    def finish(self, queue, project=None):
+        """Ends the migration of a queue, if the old pool is empty.
+
+        :returns: Whether the migration ended
+        :raises QueueNotMapped: if queue is not mapped
+        """
+        entry = self._catalogue_ctrl.get(project, queue)
+        source, destination = entry['pool'], entry.get('migrating_to')
+        if destination is None:
+            return True
+        if not self._drained(queue, source, project):
+            return False
+
+        # NOTE: The metadata set during the migration went to the old
+        # pool, this also drops the IDs of the messages moved.
+        self._storage(destination).queue_controller.set_metadata(
+            queue, self._metadata(queue, source, project), project=project)
+        self._catalogue_ctrl.update(project, queue, destination)
+        self._pool_catalog._forget(queue, project)
+
+        controller = self._storage(source).subscription_controller
+        for subscription in list(self._subscriptions(queue, source,
+                                                     project)):
+            controller.delete(queue, subscription['id'], project=project)
+
+        LOG.info('Migrated queue %(queue)s of project %(project)s from '
+                 'pool %(source)s to pool %(pool)s.',
+                 {'queue': queue, 'project': project, 'source': source,
+                  'pool': destination})
+        return True
+
+    def run(self, queue, pool, project=None, batch_size=10, interval=1.0,
+            progress=None):
+        """Migrates a queue to another pool, until done.
+
+        :param queue: Name of the queue
+        :param pool: Name of the pool to migrate the queue to
+        :param project: Project to which the queue belongs
+        :param batch_size: Number of messages moved at once
+        :param interval: Seconds to wait when no message can be moved,
+            e.g. when the messages left are claimed or delayed
+        :param progress: Optional function called with the number of
+            messages moved so far and the number left after each batch
+        """
+        source = self.start(queue, pool, project)
+        moved = 0
+        while True:
+            count = self.move(queue, source, pool, project, batch_size)
+            moved += count
+            if progress is not None:
+                progress(moved, self.remaining(queue, source, project))
+            if not count:
+                if self.finish(queue, project):
+                    break
+                time.sleep(interval)
+
+        # NOTE: Move the messages posted by workers that didn't notice the
+        # end of the migration yet.
+        conf = self._pool_catalog._catalog_conf
+        deadline = (time.monotonic() + _POOL_CACHE_TTL +
+                    conf.catalogue_refresh_interval)
+        while time.monotonic() < deadline:
+            if not self.move(queue, source, pool, project, batch_size):
+                time.sleep(interval)
+        while self.move(queue, source, pool, project, batch_size):
+            pass
+
+
+class PoolStatsController:
+    """Reports the queues and messages held by each pool.
+
+    The counters natively kept by the storage of each pool are read, in
+    parallel when several pools are asked for, and cached for
+    `pool_stats_cache_ttl` seconds.
+
+    :param pool_catalog: a catalog of available pools
+    :type pool_catalog: queues.pooling.base.Catalog
+    """
+
+    # NOTE: Maximum number of pools whose stats are read at once.
+    MAX_WORKERS = 10
+
+    def __init__(self, pool_catalog):
+        self._pool_catalog = pool_catalog
+        self._pools_ctrl = pool_catalog._pools_ctrl
+        self._cache = pool_catalog._cache
+        self._conf = pool_catalog._catalog_conf
+
+    @decorators.lazy_property(write=False)
+    def _executor(self):
+        return futurist.ThreadPoolExecutor(max_workers=self.MAX_WORKERS)
+
+    def _stats(self, pool_id):
+        ttl = self._conf.pool_stats_cache_ttl
+        key = _pool_stats_cache_key(pool_id)
+        if ttl:
+            stats = self._cache.get(key, expiration_time=ttl)
+            if stats is not core.NO_VALUE:
+                return stats
+
+        occupancy = self._pool_catalog.pool_occupancy(pool_id,
+                                                      detailed=True)
+        stats = {
+            'name': pool_id,
+            'queues': occupancy['queues'],
+            'messages': {
+                'total': occupancy['messages'],
+                'claimed': occupancy['claimed'],
+                'delayed': occupancy['delayed'],
+            },
+            'size': occupancy['size'],
+        }
+        if ttl:
+            self._cache.set(key, stats)
+        return stats
+
+    def get(self, pool):
+        """Returns the stats of a pool.
+
+        :returns: {'name': ..., 'queues': ..., 'messages': {'total': ...,
+            'claimed': ..., 'delayed': ...}, 'size': ...} where counts the
+            storage doesn't keep are None.
+        :raises PoolDoesNotExist: if not found
+        """
+        self._pools_ctrl.get(pool)
+        return self._stats(pool)
+
+    def list(self, pools):
+        """Returns the stats of several pools, read in parallel.
+
+        :param pools: The names of the pools
+        :type pools: [str]
+        :returns: The stats of the pools, in the same order. The counts
+            of the pools whose stats couldn't be read are None, and their
+            stats have an 'error' field.
+        :rtype: [dict]
+        """
+        futures = [self._executor.submit(self._stats, pool_id)
+                   for pool_id in pools]
+        stats = []
+        for pool_id, future in zip(pools, futures):
+            try:
+                stats.append(future.result())
+            except Exception:
+                LOG.exception('Failed to read the stats of pool %s.',
+                              pool_id)
+                stats.append({
+                    'name': pool_id,
+                    'queues': None,
+                    'messages': dict.fromkeys(['total', 'claimed',
+                                               'delayed']),
+                    'size': None,
+                    'error': _('Pool stats could not be read.'),
+                })
+        return stats
+
+
+class PoolDrivers:
+    """Bounded cache of the storage drivers of the pools.
+
+    Each driver holds its own connections to the storage of its pool. The
+    least recently used drivers, and those unused for `idle_timeout`
+    seconds, are evicted and closed. Concurrent requests for a driver that
+    isn't cached yet wait for a single thread to build it.
+
+    :param factory: Function building the driver of a pool, called with
+        the arguments given to `get`
+    :param max_size: Maximum number of drivers kept open
+    :param idle_timeout: Seconds after which an unused driver is evicted,
+        0 to only evict drivers when there are too many of them
+    """
+
+    # NOTE: Evicted drivers may still be used by in-flight requests, so
+    # they're only closed after this many seconds.
+    CLOSE_DELAY = 60
+
+    def __init__(self, factory, max_size, idle_timeout):
+        self._factory = factory
+        self._max_size = max_size
+        self._idle_timeout = idle_timeout
+        # NOTE: Maps pool IDs to [driver, last used], least recently used
+        # first.
+        self._drivers = collections.OrderedDict()
+        self._loading = {}
+        self._retired = collections.deque()
+        self._lock = threading.Lock()
+        self._created = 0
+        self._evicted = 0
+
+    def __len__(self):
+        return len(self._drivers)
+
+    def get(self, pool_id, *args):
+        """Gets the driver of a pool, building it if needed."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                entry = self._drivers.get(pool_id)
+                if entry is not None:
+                    entry[1] = now
+                    self._drivers.move_to_end(pool_id)
+                    self._evict(now)
+                    break
+                loading = self._loading.get(pool_id)
+                if loading is None:
+                    loading = self._loading[pool_id] = threading.Event()
+                    break
+            loading.wait()
+
+        if entry is not None:
+            if self._retired:
+                self._close_retired()
+            return entry[0]
+
+        driver = None
+        try:
+            driver = self._factory(pool_id, *args)
+        finally:
+            with self._lock:
+                del self._loading[pool_id]
+                if driver is not None:
+                    now = time.monotonic()
+                    self._drivers[pool_id] = [driver, now]
+                    self._created += 1
+                    self._evict(now)
+                loading.set()
+        self._close_retired()
+        return driver
+
+    def _evict(self, now):
+        # NOTE: Must be called with the lock held.
+        while self._drivers:
+            pool_id, (driver, last_used) = next(iter(self._drivers.items()))
+            idle = (self._idle_timeout and
+                    now - last_used >= self._idle_timeout)
+            if not idle and len(self._drivers) <= self._max_size:
+                break
+
+            del self._drivers[pool_id]
+            self._evicted += 1
+            self._retired.append((now + self.CLOSE_DELAY, pool_id, driver))
+            LOG.debug('Evicted the storage driver of pool %s.', pool_id)
+
+    def _close_retired(self, force=False):
+        now = time.monotonic()
+        while True:
+            with self._lock:
+                if not self._retired:
+                    return
+                close_at, pool_id, driver = self._retired[0]
+                if close_at > now and not force:
+                    return
+                self._retired.popleft()
+
+            try:
+                driver.close()
+            except Exception:
+                LOG.exception('Failed to close the storage driver of '
+                              'pool %s.', pool_id)
+
+    def peek(self, pool_id):
+        """Gets the driver of a pool if it's cached, without using it.
+
+        Unlike `get`, this neither builds the driver nor keeps it from
+        being evicted.
+        """
+        with self._lock:
+            entry = self._drivers.get(pool_id)
+            return entry and entry[0]
+
+    def discard(self, pool_id):
+        """Evicts the driver of a pool, e.g. after its settings changed."""
+        with self._lock:
+            entry = self._drivers.pop(pool_id, None)
+            if entry is not None:
+                self._evicted += 1
+                self._retired.append((time.monotonic() + self.CLOSE_DELAY,
+                                      pool_id, entry[0]))
+
+    def close(self):
+        """Closes all the drivers."""
+        with self._lock:
+            for pool_id, (driver, last_used) in self._drivers.items():
+                self._retired.append((0, pool_id, driver))
+            self._drivers.clear()
+        self._close_retired(force=True)
+
+    def stats(self):
+        """Reports the number of drivers built, evicted and still open.
+
+        Every open driver holds connections to the storage of its pool,
+        including the evicted drivers that aren't closed yet.
+        """
+        with self._lock:
+            return {
+                'open': len(self._drivers),
+                'closing': len(self._retired),
+                'created': self._created,
+                'evicted': self._evicted,
+            }
+
 
 class Catalog:
     """Represents the mapping between queues and pool drivers."""
 
     def __init__(self, conf, cache, control):
-        self._drivers = {}
         self._conf = conf
         self._cache = cache
         self.control = control
@@ -457,10 +1654,23 @@ class Catalog:
                                  group=pooling_catalog.GROUP_NAME)
         self._catalog_conf = self._conf[pooling_catalog.GROUP_NAME]
 
+        self._drivers = PoolDrivers(
+            self._init_driver,
+            self._catalog_conf.pool_drivers_size,
+            self._catalog_conf.pool_drivers_idle_timeout)
+
         self._pools_ctrl = control.pools_controller
         self._flavor_ctrl = control.flavors_controller
         self._catalogue_ctrl = control.catalogue_controller
 
+        self._health = PoolHealth(
+            self._catalog_conf.pool_failure_threshold,
+            self._catalog_conf.pool_circuit_reset_timeout,
+            self._catalog_conf.pool_latency_target)
+
+        # NOTE: (message store settings, pool conf) of the virtual pool.
+        self._virtual_pool = None
+
     # FIXME(cpp-cabrera): https://bugs.launchpad.net/zaqar/+bug/1252791
     def _init_driver(self, pool_id, pool_conf=None):
         """Given a pool name, returns a storage driver.
@@ -481,7 +1691,181 @@ class Catalog:
                                             control_driver=self.control)
         return pipeline.DataDriver(conf, storage, self.control)
 
+    @decorators.lazy_property(write=False)
+    def _selector(self):
+        mgr = stevedore.DriverManager('zaqar.pooling.selectors',
+                                      self._catalog_conf.pool_selector,
+                                      invoke_on_load=False)
+        return mgr.driver
+
+    def _select_pool(self, pools):
+        """Selects the pool a new queue is placed on.
+
+        Pools whose circuit is open are left out, unless all of them are.
+
+        :param pools: The candidate pools
+        :returns: The name of the selected pool, or None
+        """
+        if self._catalog_conf.pool_probe_interval:
+            # NOTE: Pools are only probed once queues get placed, and in
+            # the background, placement only reads their health.
+            self._prober.start()
+
+        healthy = [pool for pool in pools
+                   if not self._health.is_open(pool['name'])]
+
+        if pools and not healthy:
+            LOG.warning('All the candidate pools are down, placing the '
+                        'queue regardless of their health.')
+            healthy = pools
+
+        pool = self._selector(
+            healthy, lambda pool: self._health.headroom(pool['name']),
+            load=lambda pool: self._occupancy.load(pool['name']))
+        return pool['name'] if pool else None
+
+    @decorators.lazy_property(write=False)
+    def _prober(self):
+        return PoolProber(self._probe_pools,
+                          self._catalog_conf.pool_probe_interval)
+
+    def _probe_pools(self):
+        for pool in next(self._pools_ctrl.list(limit=0)):
+            # NOTE: Building drivers only to probe them would keep
+            # connections open to every pool, so only the pools this
+            # worker has a driver for are probed.
+            driver = self._drivers.peek(pool['name'])
+            if driver is not None:
+                self._health.probe(pool['name'], driver)
+
+    @decorators.lazy_property(write=False)
+    def _occupancy(self):
+        # NOTE: Only started once a selector asks for the load of a pool.
+        occupancy = PoolOccupancy(
+            self._sample_occupancy,
+            self._catalog_conf.pool_occupancy_interval)
+        occupancy.start()
+        return occupancy
+
+    def _sample_occupancy(self):
+        counts = {}
+        for pool in next(self._pools_ctrl.list(limit=0)):
+            pool_id = pool['name']
+            # NOTE: Building drivers only to sample them would keep
+            # connections open to every pool, so messages are only
+            # counted in the pools this worker has a driver for.
+            try:
+                occupancy = self._count(pool_id,
+                                        self._drivers.peek(pool_id))
+            except Exception:
+                LOG.exception('Failed to read the occupancy of pool %s.',
+                              pool_id)
+                occupancy = {'queues': None, 'messages': None}
+
+            counts[pool_id] = (occupancy['queues'], occupancy['messages'])
+        return counts
+
+    def pool_occupancy(self, pool_id, detailed=False):
+        """Counts the queues and messages held by a pool.
+
+        :param pool_id: The name of a pool.
+        :type pool_id: str
+        :param detailed: Whether to also count the claimed and delayed
+            messages, which may take a scan of the messages.
+        :type detailed: bool
+        :returns: {'queues': ..., 'messages': ..., 'size': ...}, plus
+            {'claimed': ..., 'delayed': ...} if detailed. Counts that
+            can't be read cheaply are None.
+        :rtype: dict
+        """
+        return self._count(pool_id, self.get_driver(pool_id), detailed)
+
+    def _count(self, pool_id, driver, detailed=False):
+        try:
+            queues = self._catalogue_ctrl.count(pool_id)
+        except NotImplementedError:
+            queues = None
+
+        occupancy = None
+        if driver is not None:
+            try:
+                occupancy = driver.occupancy(detailed=detailed)
+            except NotImplementedError:
+                pass
+
+        if occupancy is None:
+            keys = ['messages', 'size']
+            if detailed:
+                keys += ['claimed', 'delayed']
+            occupancy = dict.fromkeys(keys)
+
+        occupancy['queues'] = queues
+        return occupancy
+
+    @decorators.lazy_property(write=False)
+    def _snapshot(self):
+        if not self._catalog_conf.catalogue_snapshot:
+            return None
+        try:
+            snapshot = CatalogueSnapshot(
+                self._catalogue_ctrl,
+                self._catalog_conf.catalogue_refresh_interval,
+                self._catalog_conf.catalogue_snapshot_size,
+                self._catalog_conf.unmapped_queue_cache_ttl)
+        except NotImplementedError:
+            LOG.info('The management store does not keep track of the '
+                     'catalogue changes, falling back to caching the '
+                     'queue to pool mappings.')
+            return None
+
+        # NOTE: Lookups don't wait for the snapshot to be loaded, those
+        # made meanwhile query the catalogue.
+        threading.Thread(target=snapshot.warm, daemon=True,
+                         name='zaqar-catalogue-snapshot').start()
+        return snapshot
+
     @decorators.caches(_pool_cache_key, _POOL_CACHE_TTL)
+    def _cached_entry(self, queue, project=None):
+        return _catalogue_entry(self._catalogue_ctrl.get(project, queue))
+
+    @decorators.caches(utils.flavor_cache_key, _POOL_CACHE_TTL)
+    def _flavor(self, flavor, project=None):
+        return self._flavor_ctrl.get(flavor, project=project)['name']
+
+    @decorators.caches(utils.flavor_pools_cache_key, _POOL_CACHE_TTL)
+    def _flavor_pools(self, flavor=None):
+        flavor_obj = None if flavor is None else {'name': flavor}
+        pools = self._pools_ctrl.get_pools_by_flavor(flavor=flavor_obj)
+        return [{'name': pool['name'], 'weight': pool['weight'],
+                 'flavor': pool['flavor']} for pool in pools]
+
+    def _entry(self, queue, project=None):
+        """Get the catalogue entry of the given queue.
+
+        :param queue: name of the queue
+        :param project: project to which the queue belongs
+
+        :returns: {'pool': ..., 'migrating_to': ...}
+
+        :raises QueueNotMapped: if queue is not mapped
+        """
+        snapshot = self._snapshot
+        if snapshot is not None:
+            return snapshot.entry(queue, project)
+
+        ttl = self._catalog_conf.unmapped_queue_cache_ttl
+        if not ttl:
+            return self._cached_entry(queue, project)
+
+        key = _unmapped_cache_key(queue, project)
+        if self._cache.get(key, expiration_time=ttl) is not core.NO_VALUE:
+            raise errors.QueueNotMapped(queue, project)
+        try:
+            return self._cached_entry(queue, project)
+        except errors.QueueNotMapped:
+            self._cache.set(key, True)
+            raise
+
     def _pool_id(self, queue, project=None):
         """Get the ID for the pool assigned to the given queue.
 
@@ -492,7 +1876,15 @@ class Catalog:
 
         :raises QueueNotMapped: if queue is not mapped
         """
-        return self._catalogue_ctrl.get(project, queue)['pool']
+        return self._entry(queue, project)['pool']
+
+    def _forget(self, queue, project=None):
+        snapshot = self._snapshot
+        if snapshot is not None:
+            snapshot.forget(queue, project)
+        else:
+            self._cache.delete(_pool_cache_key(queue, project))
+            self._cache.delete(_unmapped_cache_key(queue, project))
 
     def register(self, queue, project=None, flavor=None):
         """Register a new queue in the pool catalog.
@@ -514,67 +1906,59 @@ class Catalog:
         :param flavor: Flavor for the queue (OPTIONAL)
         :type flavor: str
 
-        :raises NoPoolFound: if not found
-
-        """
-
-        # NOTE(gengchc): if exist, get queue's pool.flavor:
-        # if queue's pool.flavor is different, first delete it and add it.
-        #  Otherwise, if the flavor in the meteredata of the queue is
-        #  modified, the catalog will be inconsistent.
-        if self._catalogue_ctrl.exists(project, queue):
-            catalogue = self._catalogue_ctrl.get(project, queue)
-            oldpoolids = catalogue['pool']
-            oldpool = self._pools_ctrl.get(oldpoolids)
-            oldflavor = oldpool['flavor']
-            msgtmpl = _('register queue to pool: old flavor: %(oldflavor)s '
-                        ', new flavor: %(flavor)s')
-            LOG.info(msgtmpl,
-                     {'oldflavor': oldflavor, 'flavor': flavor})
-            if oldpool['flavor'] != flavor:
-                self._catalogue_ctrl.delete(project, queue)
-
-        if not self._catalogue_ctrl.exists(project, queue):
-            if flavor is not None:
-                flavor = self._flavor_ctrl.get(flavor, project=project)
-                pools = self._pools_ctrl.get_pools_by_flavor(
-                    flavor=flavor,
-                    detailed=True)
-                pool = select.weighted(pools)
-                pool = pool and pool['name'] or None
-                msgtmpl = _('register queue to pool: new flavor:%(flavor)s')
-                LOG.info(msgtmpl,
-                         {'flavor': flavor.get('name', None)})
-            else:
-                # NOTE(flaper87): Get pools assigned to the default
-                # group `None`. We should consider adding a `default_group`
-                # option in the future.
-                pools = self._pools_ctrl.get_pools_by_flavor(detailed=True)
-                pool = select.weighted(pools)
-                pool = pool and pool['name'] or None
-
-                if not pool:
-                    # NOTE(flaper87): We used to raise NoPoolFound in this
-                    # case but we've decided to support automatic pool
-                    # creation. Note that we're now returning and the queue
-                    # is not being registered in the catalogue. This is done
-                    # on purpose since no pool exists and the "dummy" pool
-                    # doesn't exist in the storage
-                    if self.lookup(queue, project) is not None:
-                        return
-                    raise errors.NoPoolFound()
-                    msgtmpl = _('register queue to pool: new flavor: None')
-                    LOG.info(msgtmpl)
-
-            msgtmpl = _('register queue: project:%(project)s'
-                        ' queue:%(queue)s pool:%(pool)s')
-            LOG.info(msgtmpl,
-                     {'project': project,
-                      'queue': queue,
-                      'pool': pool})
-            self._catalogue_ctrl.insert(project, queue, pool)
-
-    @_pool_id.purges
+        :raises NoPoolFound: if no flavor is given and no pool is
+            registered without a flavor
+
+        """
+
+        # NOTE: The pools of the flavor are cached, and invalidated by the
+        # pools and flavors controllers whenever they change. The queue is
+        # then mapped in a single round trip, which leaves it in its pool
+        # if it already lives in one of the flavor, and moves it otherwise
+        # since the flavor in the metadata of the queue was modified.
+        if flavor is not None:
+            flavor = self._flavor(flavor, project=project)
+
+        pools = self._flavor_pools(flavor)
+        pool = self._select_pool(pools)
+
+        if not pool and flavor is None:
+            # NOTE(flaper87): We used to raise NoPoolFound in this
+            # case but we've decided to support automatic pool
+            # creation. Note that we're now returning and the queue
+            # is not being registered in the catalogue. This is done
+            # on purpose since no pool exists and the "dummy" pool
+            # doesn't exist in the storage
+            if self.lookup(queue, project) is not None:
+                return
+            raise errors.NoPoolFound()
+
+        # NOTE: Queues of a flavor without pools are registered without a
+        # pool, as they always were.
+
+        try:
+            current = self._pool_id(queue, project)
+        except errors.QueueNotMapped:
+            current = None
+
+        keep = [p['name'] for p in pools if p['flavor'] == flavor]
+        pool = self._catalogue_ctrl.upsert(project, queue, pool, keep=keep)
+
+        # NOTE: Queues registered again, e.g. when their metadata is set,
+        # are usually kept where they are and don't add to the load.
+        if pool and pool != current and hasattr(self, '_lazy__occupancy'):
+            self._occupancy.placed(pool)
+
+        msgtmpl = _('register queue: project:%(project)s'
+                    ' queue:%(queue)s pool:%(pool)s flavor:%(flavor)s')
+        LOG.info(msgtmpl,
+                 {'project': project,
+                  'queue': queue,
+                  'pool': pool,
+                  'flavor': flavor})
+        self._forget(queue, project)
+
+    @_cached_entry.purges
     def deregister(self, queue, project=None):
         """Removes a queue from the pool catalog.
 
@@ -588,6 +1972,31 @@ class Catalog:
         :type project: str
         """
         self._catalogue_ctrl.delete(project, queue)
+        self._forget(queue, project)
+
+    def _get_pool_controller(self, name, pool_id):
+        # NOTE: Let the calls routed to the pool feed its health.
+        return _TrackedController(getattr(self.get_driver(pool_id), name),
+                                  pool_id, self._health)
+
+    def _get_controller(self, name, queue, project=None):
+        try:
+            entry = self._entry(queue, project)
+        except errors.QueueNotMapped as ex:
+            LOG.debug(ex)
+            target = self.get_default_pool(use_listing=False)
+            return target and getattr(target, name)
+
+        controller = self._get_pool_controller(name, entry['pool'])
+        if entry['migrating_to'] is None:
+            return controller
+
+        destination = self._get_pool_controller(name, entry['migrating_to'])
+        if name == 'subscription_controller':
+            # NOTE: Subscriptions are copied when the migration starts.
+            return destination
+        migrating = _MIGRATING_CONTROLLERS.get(name)
+        return migrating and migrating(controller, destination) or controller
 
     def get_queue_controller(self, queue, project=None):
         """Lookup the queue controller for the given queue and project.
@@ -600,8 +2009,7 @@ class Catalog:
             the pool containing (queue, project) or None if this doesn't exist.
         :rtype: Maybe QueueController
         """
-        target = self.lookup(queue, project)
-        return target and target.queue_controller
+        return self._get_controller('queue_controller', queue, project)
 
     def get_message_controller(self, queue, project=None):
         """Lookup the message controller for the given queue and project.
@@ -614,8 +2022,7 @@ class Catalog:
             the pool containing (queue, project) or None if this doesn't exist.
         :rtype: Maybe MessageController
         """
-        target = self.lookup(queue, project)
-        return target and target.message_controller
+        return self._get_controller('message_controller', queue, project)
 
     def get_claim_controller(self, queue, project=None):
         """Lookup the claim controller for the given queue and project.
@@ -628,8 +2035,7 @@ class Catalog:
             the pool containing (queue, project) or None if this doesn't exist.
         :rtype: Maybe ClaimController
         """
-        target = self.lookup(queue, project)
-        return target and target.claim_controller
+        return self._get_controller('claim_controller', queue, project)
 
     def get_subscription_controller(self, queue, project=None):
         """Lookup the subscription controller for the given queue and project.
@@ -643,8 +2049,7 @@ class Catalog:
             exist.
         :rtype: Maybe SubscriptionController
         """
-        target = self.lookup(queue, project)
-        return target and target.subscription_controller
+        return self._get_controller('subscription_controller', queue, project)
 
     def get_topic_controller(self, topic, project=None):
         """Lookup the topic controller for the given queue and project.
@@ -657,8 +2062,7 @@ class Catalog:
             the pool containing (queue, project) or None if this doesn't exist.
         :rtype: Maybe TopicController
         """
-        target = self.lookup(topic, project)
-        return target and target.topic_controller
+        return self._get_controller('topic_controller', topic, project)
 
     def get_default_pool(self, use_listing=True):
         if use_listing:
@@ -668,39 +2072,65 @@ class Catalog:
                 return self.get_driver(pools_list[0]['name'])
 
         if self._catalog_conf.enable_virtual_pool:
-            conf_section = ('drivers:message_store:%s' %
-                            self._conf.drivers.message_store)
-
-            try:
-                # NOTE(flaper87): Try to load the driver to check
-                # whether it can be used as the default store for
-                # the default pool.
-                utils.load_storage_driver(self._conf, self._cache,
-                                          control_driver=self.control)
-            except cerrors.InvalidDriver:
-                # NOTE(kgriffs): Return `None`, rather than letting the
-                # exception bubble up, so that the higher layer doesn't
-                # have to duplicate the try..except..log code all over
-                # the place.
+            pool_conf = self._virtual_pool_conf()
+            if pool_conf is None:
                 return None
 
-            if conf_section not in self._conf:
-                # NOTE(flaper87): If there's no config section for this storage
-                # skip the pool registration entirely since we won't know how
-                # to connect to it.
-                return None
-
-            # NOTE(flaper87): This assumes the storage driver type is the
-            # same as the management.
-            pool_conf = {'uri': self._conf[conf_section].uri,
-                         'options': {}}
-
             # NOTE(flaper87): This will be using the config
             # storage configuration as the default one if no
             # default storage has been registered in the pool
             # store.
             return self.get_driver(None, pool_conf)
 
+    def _virtual_pool_settings(self):
+        message_store = self._conf.drivers.message_store
+        conf_section = 'drivers:message_store:%s' % message_store
+        if conf_section not in self._conf:
+            return message_store, None
+        return message_store, self._conf[conf_section].uri
+
+    def _virtual_pool_conf(self):
+        """Returns the conf of the virtual pool, or None if it's unusable.
+
+        Loading the message store to check it can back the virtual pool is
+        costly, so the result is kept until the settings of the message
+        store change, e.g. when the configuration is reloaded.
+        """
+        settings = self._virtual_pool_settings()
+        virtual_pool = self._virtual_pool
+        if virtual_pool is not None and virtual_pool[0] == settings:
+            return virtual_pool[1]
+
+        if virtual_pool is not None:
+            self._drivers.discard(None)
+
+        try:
+            # NOTE(flaper87): Try to load the driver to check
+            # whether it can be used as the default store for
+            # the default pool.
+            utils.load_storage_driver(self._conf, self._cache,
+                                      control_driver=self.control)
+        except cerrors.InvalidDriver:
+            # NOTE(kgriffs): Return `None`, rather than letting the
+            # exception bubble up, so that the higher layer doesn't
+            # have to duplicate the try..except..log code all over
+            # the place.
+            pool_conf = None
+        else:
+            # NOTE: Loading the driver registers its options.
+            settings = self._virtual_pool_settings()
+            uri = settings[1]
+
+            # NOTE(flaper87): If there's no config section for this
+            # storage skip the pool registration entirely since we won't
+            # know how to connect to it. Otherwise, this assumes the
+            # storage driver type is the same as the management.
+            pool_conf = None if uri is None else {'uri': uri,
+                                                  'options': {}}
+
+        self._virtual_pool = (settings, pool_conf)
+        return pool_conf
+
     def lookup(self, queue, project=None):
         """Lookup a pool driver for the given queue and project.
 
@@ -732,13 +2162,20 @@ class Catalog:
         :rtype: zaqar.storage.base.DataDriver
         """
 
-        try:
-            return self._drivers[pool_id]
-        except KeyError:
-            # NOTE(cpp-cabrera): cache storage driver connection
-            self._drivers[pool_id] = self._init_driver(pool_id, pool_conf)
+        # NOTE(cpp-cabrera): cache storage driver connection
+        return self._drivers.get(pool_id, pool_conf)
+
+    def close(self):
+        """Closes the storage drivers of the pools."""
+        if hasattr(self, '_lazy__occupancy'):
+            self._occupancy.stop()
+        if hasattr(self, '_lazy__prober'):
+            self._prober.stop()
+        self._drivers.close()
 
-            return self._drivers[pool_id]
+    def drivers_stats(self):
+        """Reports the number of storage drivers of the pools."""
+        return self._drivers.stats()
 
 
 class TopicController(storage.Topic):
@@ -758,31 +2195,17 @@ class TopicController(storage.Topic):
               limit=storage.DEFAULT_TOPICS_PER_PAGE, detailed=False,
               name=None):
 
-        def all_pages():
-            yield next(self._mgt_topic_ctrl.list(
-                project=project,
-                kfilter=kfilter,
-                marker=marker,
-                limit=limit,
-                detailed=detailed,
-                name=name))
-
-        # make a heap compared with 'name'
-        ls = heapq.merge(*[
-            utils.keyify('name', page)
-            for page in all_pages()
-        ])
-
-        marker_name = {}
-
-        # limit the iterator and strip out the comparison wrapper
-        def it():
-            for topic_cmp in itertools.islice(ls, limit):
-                marker_name['next'] = topic_cmp.obj['name']
-                yield topic_cmp.obj
-
-        yield it()
-        yield marker_name and marker_name['next']
+        # NOTE: In pooled deployments the topic records only live in the
+        # management store, the pools merely hold their messages, so the
+        # management store listing is already complete and ordered by name.
+        # Hand its cursor over as is instead of re-merging and re-slicing
+        # a single page.
+        return self._mgt_topic_ctrl.list(project=project,
+                                         kfilter=kfilter,
+                                         marker=marker,
+                                         limit=limit,
+                                         detailed=detailed,
+                                         name=name)
 
     def _get(self, name, project=None):
         try:
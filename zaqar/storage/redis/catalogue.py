@@ -31,12 +31,20 @@ from zaqar.i18n import _
 from zaqar.storage import base
 from zaqar.storage import errors
 from zaqar.storage.redis import utils
+from zaqar.storage import utils as storage_utils
 
 LOG = logging.getLogger(__name__)
 
 CATALOGUE_SUFFIX = 'catalogue'
 COUNTING_BATCH_SIZE = 100
 
+CATALOGUE_VERSION_KEY = 'catalogue.version'
+CATALOGUE_CHANGES_KEY = 'catalogue.changes'
+
+# NOTE: Number of changes kept in the journal, workers that lag behind
+# further reload their whole copy of the catalogue.
+CHANGES_KEPT = 1000
+
 
 class CatalogueController(base.CatalogueBase):
     """Implements Catalogue resource operations using Redis.
@@ -66,6 +74,21 @@ class CatalogueController(base.CatalogueBase):
         +----------------------+---------+
         |  Pool                |  p_p     |
         +----------------------+---------+
+        |  Migrating to        |  p_m    |
+        +----------------------+---------+
+
+    * Changes journal (Redis sorted set):
+
+        Changed entries, scored by the catalogue version they led to. The
+        current version is kept in the catalogue.version key.
+
+        Key: catalogue.changes
+
+        +----------+------------------------------------------+
+        |  Score   |  Value                                   |
+        +==========+==========================================+
+        |  version |  <version>:<project_id>.<queue_name>     |
+        +----------+------------------------------------------+
     """
 
     def __init__(self, *args, **kwargs):
@@ -102,12 +125,40 @@ class CatalogueController(base.CatalogueBase):
                 LOG.exception(msgtmpl,
                               {'prj': project, 'queue': queue, 'pool': pool})
                 return False
+        self._record_change(project, queue)
         msgtmpl = _('CatalogueController:insert %(prj)s:%(queue)s'
                     ':%(pool)s, success')
         LOG.info(msgtmpl,
                  {'prj': project, 'queue': queue, 'pool': pool})
         return True
 
+    def _record_change(self, project, queue):
+        version = self._client.incr(CATALOGUE_VERSION_KEY)
+        member = '{}:{}'.format(version, utils.scope_queue_name(queue,
+                                                                project))
+        self._client.zadd(CATALOGUE_CHANGES_KEY, {member: version})
+
+        if version % 100 == 0:
+            self._client.zremrangebyscore(CATALOGUE_CHANGES_KEY, '-inf',
+                                          version - CHANGES_KEPT)
+
+    @utils.raises_conn_error
+    @utils.retries_on_connection_error
+    def changes(self, since=None):
+        version = int(self._client.get(CATALOGUE_VERSION_KEY) or 0)
+
+        entries = []
+        if since is not None and since < version:
+            members = self._client.zrangebyscore(CATALOGUE_CHANGES_KEY,
+                                                 '({}'.format(since), '+inf')
+            for member in members:
+                entry_version, scoped = member.decode().split(':', 1)
+                project, queue = scoped.split('.', 1)
+                entries.append((int(entry_version), project, queue))
+
+        return version, storage_utils.catalogue_changes(since, version,
+                                                        entries)
+
     @utils.raises_conn_error
     @utils.retries_on_connection_error
     def list(self, project):
@@ -163,6 +214,43 @@ class CatalogueController(base.CatalogueBase):
     def insert(self, project, queue, pool):
         self._insert(project, queue, pool)
 
+    @utils.raises_conn_error
+    @utils.retries_on_connection_error
+    def upsert(self, project, queue, pool, keep=()):
+        queue_key = utils.scope_queue_name(queue, project)
+        catalogue_project_key = utils.scope_pool_catalogue(project,
+                                                           CATALOGUE_SUFFIX)
+        catalogue_queue_key = utils.scope_pool_catalogue(queue_key,
+                                                         CATALOGUE_SUFFIX)
+        catalogue = {
+            'p': project,
+            'p_q': queue,
+            'p_p': pool
+        }
+
+        with self._client.pipeline() as pipe:
+            while True:
+                try:
+                    # NOTE: Watching the entry turns the pipeline into a
+                    # compare-and-set, it fails if the entry is changed
+                    # between the check and the write.
+                    pipe.watch(catalogue_queue_key)
+                    current = pipe.hget(catalogue_queue_key, 'p_p')
+                    if current is not None and current.decode() in keep:
+                        return current.decode()
+
+                    pipe.multi()
+                    pipe.zadd(catalogue_project_key, {queue_key: 1})
+                    pipe.hmset(catalogue_queue_key, catalogue)
+                    pipe.hdel(catalogue_queue_key, 'p_m')
+                    pipe.execute()
+                    break
+                except redis.exceptions.WatchError:
+                    continue
+
+        self._record_change(project, queue)
+        return pool
+
     @utils.raises_conn_error
     @utils.retries_on_connection_error
     def delete(self, project, queue):
@@ -187,6 +275,7 @@ class CatalogueController(base.CatalogueBase):
                 LOG.info(msgtmpl,
                          {'prj': project, 'queue': queue})
                 return False
+        self._record_change(project, queue)
         msgtmpl = _('CatalogueController:delete %(prj)s:%(queue)s success')
         LOG.info(msgtmpl,
                  {'prj': project, 'queue': queue})
@@ -202,7 +291,8 @@ class CatalogueController(base.CatalogueBase):
         catalogue_queue_key = utils.scope_pool_catalogue(queue_key,
                                                          CATALOGUE_SUFFIX)
         with self._client.pipeline() as pipe:
-            pipe.hset(catalogue_queue_key, "pl", pool)
+            pipe.hset(catalogue_queue_key, 'p_p', pool)
+            pipe.hdel(catalogue_queue_key, 'p_m')
             try:
                 pipe.execute()
             except redis.exceptions.ResponseError:
@@ -211,6 +301,7 @@ class CatalogueController(base.CatalogueBase):
                 LOG.exception(msgtmpl,
                               {'prj': project, 'queue': queue, 'pool': pool})
                 return False
+        self._record_change(project, queue)
         msgtmpl = _('CatalogueController:_update %(prj)s:%(queue)s'
                     ':%(pool)s')
         LOG.info(msgtmpl,
@@ -223,10 +314,26 @@ class CatalogueController(base.CatalogueBase):
             return False
         self._update(project, queue, pool)
 
+    @utils.raises_conn_error
+    @utils.retries_on_connection_error
+    def migrate(self, project, queue, pool=None):
+        if not self._exists(project, queue):
+            raise errors.QueueNotMapped(queue, project)
+
+        queue_key = utils.scope_queue_name(queue, project)
+        catalogue_queue_key = utils.scope_pool_catalogue(queue_key,
+                                                         CATALOGUE_SUFFIX)
+        if pool is None:
+            self._client.hdel(catalogue_queue_key, 'p_m')
+        else:
+            self._client.hset(catalogue_queue_key, 'p_m', pool)
+        self._record_change(project, queue)
+
     @utils.raises_conn_error
     @utils.retries_on_connection_error
     def drop_all(self):
         allcatalogueobj_key = self._client.keys(pattern='*catalog')
+        self._client.delete(CATALOGUE_VERSION_KEY, CATALOGUE_CHANGES_KEY)
         if len(allcatalogueobj_key) == 0:
             return
         with self._client.pipeline() as pipe:
@@ -242,5 +349,6 @@ def _normalize(entry):
     return {
         'queue': str(entry['p_q']),
         'project': str(entry['p']),
-        'pool': str(entry['p_p'])
+        'pool': str(entry['p_p']),
+        'migrating_to': entry.get('p_m') and str(entry['p_m'])
     }
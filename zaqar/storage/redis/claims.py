@@ -234,7 +234,7 @@ class ClaimController(storage.Claim, scripting.Mixin):
         claimed_msgs = messages.Message.from_redis_bulk(msg_keys,
                                                         self._client)
         now = timeutils.utcnow_ts()
-        basic_messages = [msg.to_basic(now)
+        basic_messages = [msg.to_basic(now, include_client=True)
                           for msg in claimed_msgs if msg]
 
         # claim_meta
@@ -282,7 +282,8 @@ class ClaimController(storage.Claim, scripting.Mixin):
         if claimed_ids:
             claimed_msgs = messages.Message.from_redis_bulk(claimed_ids,
                                                             self._client)
-            claimed_msgs = [msg.to_basic(now) for msg in claimed_msgs]
+            claimed_msgs = [msg.to_basic(now, include_client=True)
+                            for msg in claimed_msgs]
 
             # NOTE(kgriffs): Perist claim records
             with self._client.pipeline() as pipe:
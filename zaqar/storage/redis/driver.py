@@ -195,6 +195,18 @@ class DataDriver(storage.DataDriverBase):
         # TODO(kgriffs): Add metrics re message volume
         return KPI
 
+    def occupancy(self, detailed=False):
+        # NOTE: Every message is stored under its own key, the number of
+        # keys is a cheap approximation of the number of messages. Claimed
+        # and delayed messages are only tracked per queue.
+        occupancy = {
+            'messages': self.connection.dbsize(),
+            'size': self.connection.info('memory')['used_memory'],
+        }
+        if detailed:
+            occupancy.update(claimed=None, delayed=None)
+        return occupancy
+
     def gc(self):
         # TODO(kgriffs): Check time since last run, and if
         # it hasn't been very long, skip. This allows for
@@ -149,7 +149,7 @@ class FlavorsController(base.FlavorsBase):
                 raise errors.FlavorDoesNotExist(name)
 
     @utils.raises_conn_error
-    def delete(self, name, project=None):
+    def _delete(self, name, project=None):
         subset_key = utils.flavor_project_subset_key(project)
         set_key = utils.flavor_set_key()
         hash_key = utils.flavor_name_hash_key(name)
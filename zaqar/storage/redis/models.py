@@ -226,7 +226,7 @@ class Message(MessageEnvelope):
         pipe.hmset(self.id, hmap)
         pipe.expire(self.id, self.ttl)
 
-    def to_basic(self, now, include_created=False):
+    def to_basic(self, now, include_created=False, include_client=False):
         basic_msg = {
             'id': self.id,
             'age': now - self.created,
@@ -241,6 +241,8 @@ class Message(MessageEnvelope):
                 self.created, tz=datetime.UTC).replace(
                     tzinfo=None).strftime('%Y-%m-%dT%H:%M:%SZ')
             basic_msg['created'] = created_iso
+        if include_client:
+            basic_msg['client_uuid'] = self.client_uuid
         if self.checksum:
             basic_msg['checksum'] = self.checksum
         return basic_msg
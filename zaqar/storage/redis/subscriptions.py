@@ -108,7 +108,7 @@ class SubscriptionController(base.Subscription):
 
     @utils.raises_conn_error
     @utils.retries_on_connection_error
-    def create(self, queue, subscriber, ttl, options, project=None):
+    def _create(self, queue, subscriber, ttl, options, project=None):
         subscription_id = uuidutils.generate_uuid()
         subset_key = utils.scope_subscription_ids_set(queue,
                                                       project,
@@ -184,7 +184,7 @@ class SubscriptionController(base.Subscription):
 
     @utils.raises_conn_error
     @utils.retries_on_connection_error
-    def update(self, queue, subscription_id, project=None, **kwargs):
+    def _update(self, queue, subscription_id, project=None, **kwargs):
         names = ('subscriber', 'ttl', 'options')
         key_transform = lambda x: 'u' if x == 'subscriber' else x[0]
         fields = common_utils.fields(kwargs, names,
@@ -231,7 +231,7 @@ class SubscriptionController(base.Subscription):
 
     @utils.raises_conn_error
     @utils.retries_on_connection_error
-    def delete(self, queue, subscription_id, project=None):
+    def _delete(self, queue, subscription_id, project=None):
         subset_key = utils.scope_subscription_ids_set(queue, project,
                                                       SUBSCRIPTION_IDS_SUFFIX)
 
@@ -260,7 +260,7 @@ class SubscriptionController(base.Subscription):
 
     @utils.raises_conn_error
     @utils.retries_on_connection_error
-    def confirm(self, queue, subscription_id, project=None, confirmed=True):
+    def _confirm(self, queue, subscription_id, project=None, confirmed=True):
         # Let's get our subscription by ID. If it does not exist,
         # SubscriptionDoesNotExist error will be raised internally.
         self.get(queue, subscription_id, project=project)
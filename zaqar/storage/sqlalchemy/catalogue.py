@@ -20,6 +20,7 @@ Serves to construct an association between a project + queue -> pool
 name: string -> Pools.name
 project: string
 queue: string
+migrating_to: string -> Pools.name
 """
 
 import oslo_db.exception
@@ -28,6 +29,11 @@ import sqlalchemy as sa
 from zaqar.storage import base
 from zaqar.storage import errors
 from zaqar.storage.sqlalchemy import tables
+from zaqar.storage import utils
+
+# NOTE: Number of changes kept in the journal, workers that lag behind
+# further reload their whole copy of the catalogue.
+CHANGES_KEPT = 1000
 
 
 def _match(project, queue):
@@ -40,6 +46,33 @@ def _match(project, queue):
 
 class CatalogueController(base.CatalogueBase):
 
+    def _record_change(self, project, queue):
+        stmt = sa.sql.insert(tables.CatalogueChanges).values(
+            project=project, queue=queue
+        )
+        version = self.driver.run(stmt).inserted_primary_key[0]
+
+        if version % 100 == 0:
+            stmt = sa.sql.delete(tables.CatalogueChanges).where(
+                tables.CatalogueChanges.c.id <= version - CHANGES_KEPT
+            )
+            self.driver.run(stmt)
+
+    def changes(self, since=None):
+        changes_table = tables.CatalogueChanges
+        stmt = sa.sql.select(sa.func.max(changes_table.c.id))
+        version = self.driver.fetch_one(stmt)[0] or 0
+
+        entries = []
+        if since is not None and since < version:
+            stmt = sa.sql.select(
+                changes_table.c.id, changes_table.c.project,
+                changes_table.c.queue
+            ).where(changes_table.c.id > since).order_by(changes_table.c.id)
+            entries = [tuple(entry) for entry in self.driver.fetch_all(stmt)]
+
+        return version, utils.catalogue_changes(since, version, entries)
+
     def list(self, project):
         stmt = sa.sql.select(tables.Catalogue).where(
             tables.Catalogue.c.project == project
@@ -47,6 +80,21 @@ class CatalogueController(base.CatalogueBase):
         cursor = self.driver.fetch_all(stmt)
         return (_normalize(v) for v in cursor)
 
+    def list_all(self, limit=None):
+        stmt = sa.sql.select(tables.Catalogue)
+        if limit:
+            stmt = stmt.limit(limit)
+        cursor = self.driver.fetch_all(stmt)
+        return (_normalize(v) for v in cursor)
+
+    def migrations(self, pool=None):
+        column = tables.Catalogue.c.migrating_to
+        stmt = sa.sql.select(tables.Catalogue).where(
+            column.isnot(None) if pool is None else column == pool
+        )
+        cursor = self.driver.fetch_all(stmt)
+        return (_normalize(v) for v in cursor)
+
     def get(self, project, queue):
         stmt = sa.sql.select(tables.Catalogue).where(
             _match(project, queue)
@@ -64,6 +112,11 @@ class CatalogueController(base.CatalogueBase):
         except errors.QueueNotMapped:
             return False
 
+    def count(self, pool):
+        stmt = sa.sql.select(sa.func.count()).select_from(
+            tables.Catalogue).where(tables.Catalogue.c.pool == pool)
+        return self.driver.fetch_one(stmt)[0]
+
     def insert(self, project, queue, pool):
         try:
             stmt = sa.sql.insert(tables.Catalogue).values(
@@ -75,18 +128,43 @@ class CatalogueController(base.CatalogueBase):
             self._update(project, queue, pool)
         except oslo_db.exception.DBDuplicateError:
             self._update(project, queue, pool)
+        else:
+            self._record_change(project, queue)
+
+    def upsert(self, project, queue, pool, keep=()):
+        try:
+            stmt = sa.sql.insert(tables.Catalogue).values(
+                project=project, queue=queue, pool=pool
+            )
+            self.driver.run(stmt)
+        except oslo_db.exception.DBDuplicateEntry:
+            pass
+        else:
+            self._record_change(project, queue)
+            return pool
+
+        stmt = sa.sql.update(tables.Catalogue).where(_match(project, queue))
+        if keep:
+            stmt = stmt.where(tables.Catalogue.c.pool.not_in(list(keep)))
+        if self.driver.run(stmt.values(pool=pool, migrating_to=None)).rowcount:
+            self._record_change(project, queue)
+            return pool
+
+        return self.get(project, queue)['pool']
 
     def delete(self, project, queue):
         stmt = sa.sql.delete(tables.Catalogue).where(
             _match(project, queue)
         )
-        self.driver.run(stmt)
+        if self.driver.run(stmt).rowcount:
+            self._record_change(project, queue)
 
     def _update(self, project, queue, pool):
         stmt = sa.sql.update(tables.Catalogue).where(
             _match(project, queue)
-        ).values(pool=pool)
+        ).values(pool=pool, migrating_to=None)
         self.driver.run(stmt)
+        self._record_change(project, queue)
 
     def update(self, project, queue, pool=None):
         if pool is None:
@@ -97,15 +175,27 @@ class CatalogueController(base.CatalogueBase):
 
         self._update(project, queue, pool)
 
+    def migrate(self, project, queue, pool=None):
+        stmt = sa.sql.update(tables.Catalogue).where(
+            _match(project, queue)
+        ).values(migrating_to=pool)
+        if not self.driver.run(stmt).rowcount:
+            raise errors.QueueNotMapped(queue, project)
+
+        self._record_change(project, queue)
+
     def drop_all(self):
         stmt = sa.sql.expression.delete(tables.Catalogue)
         self.driver.run(stmt)
+        stmt = sa.sql.expression.delete(tables.CatalogueChanges)
+        self.driver.run(stmt)
 
 
 def _normalize(entry):
-    name, project, queue = entry
+    name, project, queue, migrating_to = entry
     return {
         'queue': queue,
         'project': project,
-        'pool': name
+        'pool': name,
+        'migrating_to': migrating_to
     }
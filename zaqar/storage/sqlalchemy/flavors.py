@@ -116,7 +116,7 @@ class FlavorsController(base.FlavorsBase):
             raise errors.FlavorDoesNotExist(name)
 
     @utils.raises_conn_error
-    def delete(self, name, project=None):
+    def _delete(self, name, project=None):
         stmt = sa.sql.expression.delete(tables.Flavors).where(
             sa.and_(tables.Flavors.c.name == name,
                     tables.Flavors.c.project == project)
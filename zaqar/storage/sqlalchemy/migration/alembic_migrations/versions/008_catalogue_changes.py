@@ -0,0 +1,42 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Catalogue changes journal
+
+Revision ID: 008
+Revises: 007
+Create Date: 2026-10-19 10:00:00.000000
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '008'
+down_revision = '007'
+
+from alembic import op
+import sqlalchemy as sa
+
+MYSQL_ENGINE = 'InnoDB'
+MYSQL_CHARSET = 'utf8'
+
+
+def upgrade():
+    op.create_table('CatalogueChanges',
+                    sa.Column('id', sa.INTEGER, primary_key=True,
+                              autoincrement=True),
+                    sa.Column('project', sa.String(64)),
+                    sa.Column('queue', sa.String(64), nullable=False))
+
+
+def downgrade():
+    op.drop_table('CatalogueChanges')
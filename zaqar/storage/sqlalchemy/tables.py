@@ -46,4 +46,13 @@ Catalogue = sa.Table('Catalogue', metadata,
                                              ondelete='CASCADE')),
                      sa.Column('project', sa.String(64)),
                      sa.Column('queue', sa.String(64), nullable=False),
+                     sa.Column('migrating_to', sa.String(64)),
                      sa.UniqueConstraint('project', 'queue'))
+
+# NOTE: Journal of the catalogue changes, ids are the catalogue versions.
+CatalogueChanges = sa.Table('CatalogueChanges', metadata,
+                            sa.Column('id', sa.INTEGER, primary_key=True,
+                                      autoincrement=True),
+                            sa.Column('project', sa.String(64)),
+                            sa.Column('queue', sa.String(64),
+                                      nullable=False))
@@ -33,6 +33,7 @@ class ClaimController(storage.Claim):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._client = self.driver.connection
+        self._shards = self.driver.swift_conf.message_container_shards
 
     @decorators.lazy_property(write=False)
     def _queue_ctrl(self):
@@ -151,7 +152,8 @@ class ClaimController(storage.Claim):
                 dead_letter_queue = queue_meta.get("_dead_letter_queue")
                 utils._put_or_create_container(
                     self._client,
-                    utils._message_container(dead_letter_queue, project),
+                    utils._message_object_container(
+                        dead_letter_queue, project, msg['id'], self._shards),
                     msg['id'],
                     content,
                     content_type='application/json',
@@ -165,7 +167,8 @@ class ClaimController(storage.Claim):
             else:
                 try:
                     self._client.put_object(
-                        utils._message_container(queue, project),
+                        utils._message_object_container(
+                            queue, project, msg['id'], self._shards),
                         msg['id'],
                         content,
                         content_type='application/json',
@@ -228,7 +231,8 @@ class ClaimController(storage.Claim):
                     {'body': msg['body'], 'claim_id': None, 'ttl': msg['ttl']})
                 client_id = headers['x-object-meta-clientid']
                 self._client.put_object(
-                    utils._message_container(queue, project),
+                    utils._message_object_container(queue, project, msg_id,
+                                                    self._shards),
                     msg_id,
                     content,
                     content_type='application/json',
@@ -11,10 +11,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
+import contextlib
 import logging
 from osprofiler import profiler
+import threading
+import time
 import urllib
 
+import futurist
 from keystoneauth1.identity import generic
 from keystoneauth1 import session as keystone_session
 from oslo_log import log as oslo_logging
@@ -51,6 +56,25 @@ class DataDriver(storage.DataDriverBase):
     def connection(self):
         return _ClientWrapper(self.swift_conf)
 
+    @decorators.lazy_property(write=False)
+    def executor(self):
+        return futurist.ThreadPoolExecutor(
+            max_workers=self.swift_conf.message_fetch_workers)
+
+    @decorators.lazy_property(write=False)
+    def bulk_delete_limit(self):
+        """Objects deletable in a single bulk delete request.
+
+        0 when the bulk delete middleware isn't advertised by Swift.
+        """
+        try:
+            info = self.connection.get_capabilities()
+        except swiftclient.ClientException:
+            LOG.warning('Unable to get Swift capabilities, bulk delete '
+                        'is disabled.')
+            return 0
+        return info.get('bulk_delete', {}).get('max_deletes_per_request', 0)
+
     def is_alive(self):
         try:
             self.connection.get_capabilities()
@@ -90,17 +114,40 @@ class DataDriver(storage.DataDriverBase):
     def _health(self):
         raise NotImplementedError("No health checks")
 
+    def occupancy(self, detailed=False):
+        # NOTE: Messages are stored as objects, the account keeps count of
+        # the objects of each container. Claims and subscriptions have
+        # containers of their own and are left out.
+        _, containers = self.connection.get_account(
+            prefix='zaqar_message:', full_listing=True)
+        occupancy = {
+            'messages': sum(c['count'] for c in containers),
+            'size': sum(c['bytes'] for c in containers),
+        }
+        if detailed:
+            occupancy.update(claimed=None, delayed=None)
+        return occupancy
+
     def close(self):
-        pass
+        if hasattr(self, '_lazy_executor'):
+            self.executor.shutdown()
+        if hasattr(self, '_lazy_connection'):
+            self.connection.close()
 
 
 class _ClientWrapper:
     """Wrapper around swiftclient.Connection.
 
     This wraps swiftclient.Connection to give the same API, but provide a
-    thread-safe alternative with a different object for every method call. It
-    maintains performance by managing authentication itself, and passing the
-    token afterwards.
+    thread-safe alternative backed by a pool of persistent connections. Each
+    method call checks a connection out of the pool for its duration, so
+    concurrent callers never share one, while subsequent calls reuse the
+    underlying HTTP connection instead of paying a new TCP/TLS handshake.
+
+    All the pooled connections share a single keystone session, which takes
+    care of authentication. The token is handed to a connection every time
+    it is checked out, so a token refreshed by the session is picked up by
+    the whole pool.
     """
 
     def __init__(self, conf):
@@ -108,6 +155,11 @@ class _ClientWrapper:
         self.endpoint = None
         self.parsed_url = urllib.parse.urlparse(conf.uri)
         self.session = None
+        self._auth_lock = threading.Lock()
+        self._pool_lock = threading.Lock()
+        # NOTE: Idle connections are stored as (connection, last_used)
+        # tuples, the most recently used one at the right end.
+        self._idle = collections.deque()
 
     def _init_auth(self):
         auth = generic.Password(
@@ -119,20 +171,101 @@ class _ClientWrapper:
             project_domain_id=self.conf.project_domain_id,
             project_domain_name=self.conf.project_domain_name,
             auth_url=self.conf.auth_url)
-        self.session = keystone_session.Session(auth=auth)
-        self.endpoint = self.session.get_endpoint(
+        session = keystone_session.Session(auth=auth)
+        self.endpoint = session.get_endpoint(
             service_type='object-store',
             interface=self.conf.interface,
             region_name=self.conf.region_name
         )
+        self.session = session
 
-    def __getattr__(self, attr):
+    def _new_client(self):
         if self.session is None:
-            self._init_auth()
+            with self._auth_lock:
+                if self.session is None:
+                    self._init_auth()
         os_options = {
             'object_storage_url': self.endpoint
         }
-        client = swiftclient.Connection(session=self.session,
-                                        insecure=self.conf.insecure,
-                                        os_options=os_options)
-        return getattr(client, attr)
+        return swiftclient.Connection(session=self.session,
+                                      insecure=self.conf.insecure,
+                                      os_options=os_options)
+
+    def _acquire(self):
+        expired = []
+        client = None
+        idle_timeout = self.conf.connection_idle_timeout
+        now = time.monotonic()
+        with self._pool_lock:
+            while self._idle:
+                candidate, last_used = self._idle.pop()
+                if idle_timeout and now - last_used > idle_timeout:
+                    # NOTE: Everything left of an expired connection has
+                    # been idle even longer.
+                    expired.append(candidate)
+                    expired.extend(c for c, _ in self._idle)
+                    self._idle.clear()
+                    break
+                client = candidate
+                break
+
+        for stale in expired:
+            self._close_client(stale)
+
+        if client is None:
+            client = self._new_client()
+        else:
+            # NOTE: Let the shared session refresh the token if needed,
+            # rather than having each connection find out through a 401.
+            client.url = self.endpoint
+            client.token = self.session.get_token()
+        return client
+
+    def _release(self, client):
+        with self._pool_lock:
+            if len(self._idle) < self.conf.connection_pool_size:
+                self._idle.append((client, time.monotonic()))
+                return
+        self._close_client(client)
+
+    @staticmethod
+    def _close_client(client):
+        try:
+            client.close()
+        except Exception:
+            LOG.debug('Failed to close Swift connection', exc_info=True)
+
+    @contextlib.contextmanager
+    def _client(self):
+        client = self._acquire()
+        try:
+            yield client
+        except swiftclient.ClientException:
+            # NOTE: Swift answered, the connection can still be reused.
+            self._release(client)
+            raise
+        except Exception:
+            # NOTE: The connection may be left in an unknown state, don't
+            # give it back to the pool.
+            self._close_client(client)
+            raise
+        else:
+            self._release(client)
+
+    def close(self):
+        with self._pool_lock:
+            idle = [c for c, _ in self._idle]
+            self._idle.clear()
+        for client in idle:
+            self._close_client(client)
+
+    def __getattr__(self, attr):
+        if attr.startswith('_'):
+            raise AttributeError(attr)
+        # NOTE: Fail early on unknown attributes, as swiftclient would.
+        getattr(swiftclient.Connection, attr)
+
+        def call(*args, **kwargs):
+            with self._client() as client:
+                return getattr(client, attr)(*args, **kwargs)
+        return call
@@ -11,7 +11,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import copy
+import collections
 import datetime
 import functools
 import uuid
@@ -61,11 +61,16 @@ class MessageController(storage.Message):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._client = self.driver.connection
+        self._shards = self.driver.swift_conf.message_container_shards
 
     @decorators.lazy_property(write=False)
     def _queue_ctrl(self):
         return self.driver.queue_controller
 
+    def _container(self, queue, project, message_id):
+        return utils._message_object_container(queue, project, message_id,
+                                               self._shards)
+
     def _delete_queue_messages(self, queue, project, pipe):
         """Method to remove all the messages belonging to a queue.
 
@@ -73,24 +78,26 @@ class MessageController(storage.Message):
         The pipe to execute deletion will be passed from the QueueController
         executing the operation.
         """
-        container = utils._message_container(queue, project)
-        remaining = True
-        key = ''
-        while remaining:
-            headers, objects = self._client.get_container(container,
-                                                          limit=1000,
-                                                          marker=key)
-            if not objects:
-                return
-            remaining = len(objects) == 1000
-            key = objects[-1]['name']
-            for o in objects:
+        containers = utils._message_containers(queue, project, self._shards)
+        for container in containers:
+            remaining = True
+            key = ''
+            while remaining:
                 try:
-                    self._client.delete_object(container, o['name'])
+                    headers, objects = self._client.get_container(
+                        container, limit=1000, marker=key)
                 except swiftclient.ClientException as exc:
-                    if exc.http_status == 404:
-                        continue
-                    raise
+                    if exc.http_status != 404:
+                        raise
+                    break
+                if not objects:
+                    break
+                remaining = len(objects) == 1000
+                key = objects[-1]['name']
+                utils._bulk_delete(self._client, container,
+                                   [o['name'] for o in objects],
+                                   self.driver.bulk_delete_limit,
+                                   self.driver.executor)
 
     def _list(self, queue, project=None, marker=None,
               limit=storage.DEFAULT_MESSAGES_PER_PAGE,
@@ -109,30 +116,38 @@ class MessageController(storage.Message):
             raise errors.QueueDoesNotExist(queue, project)
 
         client = self._client
-        container = utils._message_container(queue, project)
+        containers = utils._message_containers(queue, project, self._shards)
         query_string = None
         if sort == -1:
             query_string = 'reverse=on'
 
+        # list 2x the objects because some listing items may have
+        # expired
+        list_objects = functools.partial(utils._list_containers, client,
+                                         containers, limit=limit * 2,
+                                         query_string=query_string,
+                                         executor=self.driver.executor)
         try:
-            _, objects = client.get_container(
-                container,
-                marker=marker,
-                # list 2x the objects because some listing items may have
-                # expired
-                limit=limit * 2,
-                query_string=query_string)
+            objects = list_objects(marker=marker)
         except swiftclient.ClientException as exc:
             if exc.http_status == 404:
                 raise errors.QueueDoesNotExist(queue, project)
             raise
 
+        # NOTE: Claims usually cover several messages of the listing,
+        # look each of them up only once.
+        claims = {}
+
         def is_claimed(msg, headers):
             if include_claimed or msg['claim_id'] is None:
                 return False
-            claim_obj = self.driver.claim_controller._get(
-                queue, msg['claim_id'], project)
-            return claim_obj is not None and claim_obj['ttl'] > 0
+            claim_id = msg['claim_id']
+            if claim_id not in claims:
+                claim_obj = self.driver.claim_controller._get(
+                    queue, claim_id, project)
+                claims[claim_id] = (claim_obj is not None and
+                                    claim_obj['ttl'] > 0)
+            return claims[claim_id]
 
         def is_delayed(msg, headers):
             if include_delayed:
@@ -150,13 +165,15 @@ class MessageController(storage.Message):
             is_claimed,
             is_delayed,
         ]
+
+        def get_object(message_id):
+            return client.get_object(
+                self._container(queue, project, message_id), message_id)
+
         marker = {}
-        get_object = functools.partial(client.get_object, container)
-        list_objects = functools.partial(client.get_container, container,
-                                         limit=limit * 2,
-                                         query_string=query_string)
         yield utils._filter_messages(objects, filters, marker, get_object,
-                                     list_objects, limit=limit)
+                                     list_objects, limit=limit,
+                                     executor=self.driver.executor)
         yield marker and marker['next']
 
     def list(self, queue, project=None, marker=None,
@@ -192,7 +209,7 @@ class MessageController(storage.Message):
     def _find_message(self, queue, message_id, project):
         try:
             return self._client.get_object(
-                utils._message_container(queue, project), message_id)
+                self._container(queue, project, message_id), message_id)
 
         except swiftclient.ClientException as exc:
             if exc.http_status == 404:
@@ -200,19 +217,42 @@ class MessageController(storage.Message):
             else:
                 raise
 
+    def _claim_id_from_message(self, queue, message_id, project=None):
+        try:
+            msg = self._get(queue, message_id, project, check_queue=False)
+        except errors.MessageDoesNotExist:
+            return None, False
+        return msg['claim_id'], True
+
     def bulk_delete(self, queue, message_ids, project=None, claim_ids=None):
-        for message_id in message_ids:
-            try:
-                if claim_ids:
-                    msg = self._get(queue, message_id, project)
-                    if not msg['claim_id']:
-                        raise errors.MessageNotClaimed(message_id)
-                    if msg['claim_id'] not in claim_ids:
-                        raise errors.ClaimDoesNotMatch(msg['claim_id'],
-                                                       queue, project)
-                self._delete(queue, message_id, project)
-            except errors.MessageDoesNotExist:
-                pass
+        message_ids = list(message_ids)
+        if claim_ids:
+            found = list(self.driver.executor.map(
+                lambda message_id: self._claim_id_from_message(
+                    queue, message_id, project),
+                message_ids))
+
+            to_delete = []
+            for message_id, (claim_id, exists) in zip(message_ids, found):
+                if not exists:
+                    continue
+                if not claim_id:
+                    raise errors.MessageNotClaimed(message_id)
+                if claim_id not in claim_ids:
+                    raise errors.ClaimDoesNotMatch(claim_id, queue, project)
+                to_delete.append(message_id)
+        else:
+            # NOTE: Missing objects are ignored by the bulk delete.
+            to_delete = message_ids
+
+        by_container = collections.defaultdict(list)
+        for message_id in to_delete:
+            by_container[self._container(queue, project,
+                                         message_id)].append(message_id)
+        for container, ids in by_container.items():
+            utils._bulk_delete(self._client, container, ids,
+                               self.driver.bulk_delete_limit,
+                               self.driver.executor)
 
     def bulk_get(self, queue, message_ids, project=None):
         if not self._queue_ctrl.exists(queue, project):
@@ -225,10 +265,12 @@ class MessageController(storage.Message):
                 pass
 
     def post(self, queue, messages, client_uuid, project=None):
-        # TODO(flwang): It would be nice if we can create a middleware in Swift
-        # to accept a json list so that Zaqar can create objects in bulk.
-        return [self._create_msg(queue, m, client_uuid, project)
-                for m in messages]
+        # NOTE: Swift's bulk upload (extract-archive) can't set the
+        # X-Delete-After header of each object, so messages are PUT
+        # concurrently instead.
+        return list(self.driver.executor.map(
+            lambda m: self._create_msg(queue, m, client_uuid, project),
+            messages))
 
     def _create_msg(self, queue, msg, client_uuid, project):
         slug = str(uuid.uuid1())
@@ -243,7 +285,7 @@ class MessageController(storage.Message):
         contents = jsonutils.dumps(message)
         utils._put_or_create_container(
             self._client,
-            utils._message_container(queue, project),
+            self._container(queue, project, slug),
             slug,
             contents=contents,
             content_type='application/json',
@@ -276,7 +318,7 @@ class MessageController(storage.Message):
     def _delete(self, queue, message_id, project=None):
         try:
             self._client.delete_object(
-                utils._message_container(queue, project), message_id)
+                self._container(queue, project, message_id), message_id)
         except swiftclient.ClientException as exc:
             if exc.http_status != 404:
                 raise
@@ -295,6 +337,81 @@ class MessageController(storage.Message):
         return messages
 
 
+def _delete_container(driver, container):
+    """Delete a container along with all its objects."""
+    client = driver.connection
+    try:
+        headers, objects = client.get_container(container)
+    except swiftclient.ClientException as exc:
+        if exc.http_status != 404:
+            raise
+    else:
+        utils._bulk_delete(client, container,
+                           [obj['name'] for obj in objects],
+                           driver.bulk_delete_limit, driver.executor)
+        try:
+            client.delete_container(container)
+        except swiftclient.ClientException as exc:
+            if exc.http_status not in (404, 409):
+                raise
+
+
+def _message_stats(driver, containers, now, reverse=False):
+    """Describe the first (or last) message listed across containers."""
+    objects = utils._list_containers(
+        driver.connection, containers, limit=1,
+        query_string='reverse=on' if reverse else None,
+        executor=driver.executor)
+    if not objects:
+        return None
+    obj = objects[0]
+    created = datetime.datetime.fromisoformat(
+        obj['last_modified']).replace(tzinfo=datetime.UTC)
+    return {
+        'id': obj['name'],
+        'age': now - created.timestamp(),
+        'created': created.strftime('%Y-%m-%dT%H:%M:%SZ')}
+
+
+def _messages_stats(driver, name, project):
+    """Get the raw message stats of a queue or a topic.
+
+    Returns the headers of the main message container, the total number of
+    messages across all the containers, and the oldest and newest messages
+    stats if there is any message. Listings are ordered by message ID, the
+    first and last messages listed are considered as the oldest and the
+    newest ones.
+    """
+    client = driver.connection
+    containers = utils._message_containers(
+        name, project, driver.swift_conf.message_container_shards)
+
+    def head(args):
+        index, container = args
+        try:
+            return client.head_container(container)
+        except swiftclient.ClientException as exc:
+            if exc.http_status == 404:
+                if not index:
+                    raise errors.QueueIsEmpty(name, project)
+                return {}
+            raise
+
+    all_headers = list(driver.executor.map(head, enumerate(containers)))
+    # NOTE: Counts come from the containers, messages which expired but
+    # haven't been reaped by Swift yet are included.
+    total = sum(int(headers.get('x-container-object-count', 0))
+                for headers in all_headers)
+
+    now = timeutils.utcnow_ts(True)
+    edges = {}
+    oldest = _message_stats(driver, containers, now)
+    if oldest is not None:
+        newest = _message_stats(driver, containers, now, reverse=True)
+        edges = {'oldest': oldest, 'newest': newest or oldest}
+    return all_headers[0], total, edges
+
+
 class MessageQueueHandler:
     def __init__(self, driver, control_driver):
         self.driver = driver
@@ -302,77 +419,40 @@ class MessageQueueHandler:
         self._queue_ctrl = self.driver.queue_controller
         self._message_ctrl = self.driver.message_controller
         self._claim_ctrl = self.driver.claim_controller
+        self._shards = self.driver.swift_conf.message_container_shards
 
     def create(self, name, metadata=None, project=None):
-        self._client.put_container(utils._message_container(name, project))
+        for container in utils._message_containers(name, project,
+                                                   self._shards):
+            self._client.put_container(container)
 
     def delete(self, name, project=None):
-        for container in [utils._message_container(name, project),
-                          utils._claim_container(name, project)]:
-            try:
-                headers, objects = self._client.get_container(container)
-            except swiftclient.ClientException as exc:
-                if exc.http_status != 404:
-                    raise
-            else:
-                for obj in objects:
-                    try:
-                        self._client.delete_object(container, obj['name'])
-                    except swiftclient.ClientException as exc:
-                        if exc.http_status != 404:
-                            raise
-                try:
-                    self._client.delete_container(container)
-                except swiftclient.ClientException as exc:
-                    if exc.http_status not in (404, 409):
-                        raise
+        containers = utils._message_containers(name, project, self._shards)
+        # NOTE: Delete the main container last, it tells whether the queue
+        # exists.
+        for container in containers[1:] + [
+                containers[0], utils._claim_container(name, project)]:
+            _delete_container(self.driver, container)
 
     def stats(self, name, project=None):
         if not self._queue_ctrl.exists(name, project=project):
             raise errors.QueueDoesNotExist(name, project)
 
-        total = 0
-        claimed = 0
-        container = utils._message_container(name, project)
-
-        try:
-            _, objects = self._client.get_container(container)
-        except swiftclient.ClientException as exc:
-            if exc.http_status == 404:
-                raise errors.QueueIsEmpty(name, project)
-
-        newest = None
-        oldest = None
-        now = timeutils.utcnow_ts(True)
-        for obj in objects:
-            try:
-                headers = self._client.head_object(container, obj['name'])
-            except swiftclient.ClientException as exc:
-                if exc.http_status != 404:
-                    raise
-            else:
-                created = float(headers['x-timestamp'])
-                created_iso = datetime.datetime.fromtimestamp(
-                    created, tz=datetime.UTC).replace(
-                        tzinfo=None).strftime('%Y-%m-%dT%H:%M:%SZ')
-                newest = {
-                    'id': obj['name'],
-                    'age': now - created,
-                    'created': created_iso}
-                if oldest is None:
-                    oldest = copy.deepcopy(newest)
-                total += 1
-                if headers.get('x-object-meta-claimid'):
-                    claimed += 1
+        headers, total, edges = _messages_stats(self.driver, name, project)
+        # NOTE: Counting the claimed messages reads every live claim and
+        # its messages, see `utils._claimed_count`. Bounded by the total
+        # as messages may expire between the two reads.
+        claimed = min(utils._claimed_count(self._client, name, project,
+                                           self._shards,
+                                           self.driver.executor),
+                      total)
 
         msg_stats = {
             'claimed': claimed,
             'free': total - claimed,
             'total': total,
         }
-        if newest is not None:
-            msg_stats['newest'] = newest
-            msg_stats['oldest'] = oldest
+        msg_stats.update(edges)
 
         return {'messages': msg_stats}
 
@@ -395,71 +475,27 @@ class MessageTopicHandler:
         self._client = self.driver.connection
         self._topic_ctrl = self.driver.topic_controller
         self._message_ctrl = self.driver.message_controller
+        self._shards = self.driver.swift_conf.message_container_shards
 
     def create(self, name, metadata=None, project=None):
-        self._client.put_container(utils._message_container(name, project))
+        for container in utils._message_containers(name, project,
+                                                   self._shards):
+            self._client.put_container(container)
 
     def delete(self, name, project=None):
-        for container in [utils._message_container(name, project)]:
-            try:
-                headers, objects = self._client.get_container(container)
-            except swiftclient.ClientException as exc:
-                if exc.http_status != 404:
-                    raise
-            else:
-                for obj in objects:
-                    try:
-                        self._client.delete_object(container, obj['name'])
-                    except swiftclient.ClientException as exc:
-                        if exc.http_status != 404:
-                            raise
-                try:
-                    self._client.delete_container(container)
-                except swiftclient.ClientException as exc:
-                    if exc.http_status not in (404, 409):
-                        raise
+        containers = utils._message_containers(name, project, self._shards)
+        for container in containers[1:] + containers[:1]:
+            _delete_container(self.driver, container)
 
     def stats(self, name, project=None):
         if not self._topic_ctrl.exists(name, project=project):
             raise errors.TopicDoesNotExist(name, project)
 
-        total = 0
-        container = utils._message_container(name, project)
-
-        try:
-            _, objects = self._client.get_container(container)
-        except swiftclient.ClientException as exc:
-            if exc.http_status == 404:
-                raise errors.QueueIsEmpty(name, project)
-
-        newest = None
-        oldest = None
-        now = timeutils.utcnow_ts(True)
-        for obj in objects:
-            try:
-                headers = self._client.head_object(container, obj['name'])
-            except swiftclient.ClientException as exc:
-                if exc.http_status != 404:
-                    raise
-            else:
-                created = float(headers['x-timestamp'])
-                created_iso = datetime.datetime.fromtimestamp(
-                    created, tz=datetime.UTC).replace(
-                        tzinfo=None).strftime('%Y-%m-%dT%H:%M:%SZ')
-                newest = {
-                    'id': obj['name'],
-                    'age': now - created,
-                    'created': created_iso}
-                if oldest is None:
-                    oldest = copy.deepcopy(newest)
-                total += 1
-
+        headers, total, edges = _messages_stats(self.driver, name, project)
         msg_stats = {
             'total': total,
         }
-        if newest is not None:
-            msg_stats['newest'] = newest
-            msg_stats['oldest'] = oldest
+        msg_stats.update(edges)
 
         return {'messages': msg_stats}
 
@@ -75,7 +75,7 @@ class SubscriptionController(storage.Subscription):
             raise
         return utils._subscription_to_json(data, headers)
 
-    def create(self, queue, subscriber, ttl, options, project=None):
+    def _create(self, queue, subscriber, ttl, options, project=None):
         sub_container = utils._subscriber_container(queue, project)
         slug = uuidutils.generate_uuid()
         try:
@@ -101,7 +101,7 @@ class SubscriptionController(storage.Subscription):
             content_type='application/json', headers={'x-delete-after': ttl})
         return slug
 
-    def update(self, queue, subscription_id, project=None, **kwargs):
+    def _update(self, queue, subscription_id, project=None, **kwargs):
         container = utils._subscription_container(queue, project)
         data = self.get(queue, subscription_id, project)
         data.pop('age')
@@ -131,7 +131,7 @@ class SubscriptionController(storage.Subscription):
         container = utils._subscription_container(queue, project)
         return self._client.head_object(container, subscription_id)
 
-    def delete(self, queue, subscription_id, project=None):
+    def _delete(self, queue, subscription_id, project=None):
         try:
             data = self.get(queue, subscription_id, project)
         except errors.SubscriptionDoesNotExist:
@@ -156,5 +156,5 @@ class SubscriptionController(storage.Subscription):
                                                quote_plus(subscriber))
         return self.get(queue, obj, project)
 
-    def confirm(self, queue, subscription_id, project=None, confirmed=True):
+    def _confirm(self, queue, subscription_id, project=None, confirmed=True):
         self.update(queue, subscription_id, project, confirmed=confirmed)
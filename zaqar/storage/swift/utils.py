@@ -11,15 +11,42 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
+import functools
+import heapq
+import itertools
+import operator
+import urllib
+import zlib
+
 from oslo_serialization import jsonutils
 from oslo_utils import timeutils
 import swiftclient
 
 
-def _message_container(queue, project=None):
+def _message_container(queue, project=None, shard=0):
+    if shard:
+        return "zaqar_message:{}:{}:{}".format(queue, project, shard)
     return "zaqar_message:{}:{}".format(queue, project)
 
 
+def _message_containers(queue, project=None, shards=1):
+    """All the containers holding the messages of a queue.
+
+    The first one is the queue's main container, it always exists.
+    """
+    return [_message_container(queue, project, shard)
+            for shard in range(shards)]
+
+
+def _message_object_container(queue, project, message_id, shards=1):
+    """The container holding a given message."""
+    if shards <= 1:
+        return _message_container(queue, project)
+    shard = zlib.crc32(message_id.encode('utf-8')) % shards
+    return _message_container(queue, project, shard)
+
+
 def _claim_container(queue=None, project=None):
     return "zaqar_claim:{}:{}".format(queue, project)
 
@@ -62,6 +89,159 @@ def _put_or_create_container(client, *args, **kwargs):
             raise
 
 
+def _delete_object(client, container, name):
+    try:
+        client.delete_object(container, name)
+    except swiftclient.ClientException as exc:
+        if exc.http_status != 404:
+            raise
+
+
+def _bulk_delete(client, container, names, max_deletes=0, executor=None):
+    """Delete several objects of a container, ignoring missing ones.
+
+    When Swift's bulk delete middleware is available, as told by
+    `max_deletes`, objects are deleted in batches of that size. Otherwise,
+    or if the middleware doesn't answer, they are deleted one by one,
+    concurrently when an executor is given.
+    """
+    names = list(names)
+    if max_deletes:
+        for start in range(0, len(names), max_deletes):
+            batch = names[start:start + max_deletes]
+            if not _bulk_delete_request(client, container, batch):
+                names = names[start:]
+                break
+        else:
+            return
+
+    delete = functools.partial(_delete_object, client, container)
+    if executor is None:
+        for name in names:
+            delete(name)
+    else:
+        # NOTE: Consume the results so that errors are raised.
+        for _ in executor.map(delete, names):
+            pass
+
+
+def _bulk_delete_request(client, container, names):
+    """Delete objects through the bulk delete middleware.
+
+    Returns False if the middleware didn't handle the request.
+    """
+    data = '\n'.join(
+        urllib.parse.quote('/{}/{}'.format(container, name))
+        for name in names)
+    _, body = client.post_account(
+        headers={'Accept': 'application/json',
+                 'Content-Type': 'text/plain'},
+        query_string='bulk-delete',
+        data=data.encode('utf-8'))
+    if not body:
+        # NOTE: Without the middleware, Swift handles this as a regular
+        # account POST and returns no content.
+        return False
+    # NOTE: Missing objects are reported as "Number Not Found", they
+    # don't make the request fail.
+    result = jsonutils.loads(body)
+    status = result['Response Status']
+    if not status.startswith('2'):
+        raise swiftclient.ClientException(
+            'Bulk delete failed: {} {}'.format(status,
+                                               result.get('Errors')),
+            http_status=int(status.split()[0]))
+    return True
+
+
+def _claimed_count(client, queue, project, shards=1, executor=None):
+    """Count the claimed messages of a queue.
+
+    Every page of the claim container is listed, the live claims are
+    read, and only their messages still holding the claim are counted.
+    Claims which expired, and messages which were released, deleted or
+    expired, are thus never counted, even before Swift reaps them.
+
+    This isn't cheap: it costs a listing request per 10,000 claims, a
+    GET per claim and a HEAD per claimed message, spread over the
+    executor when given. Queue stats pay it on every call.
+    """
+    try:
+        _, claims = client.get_container(_claim_container(queue, project),
+                                         full_listing=True)
+    except swiftclient.ClientException as exc:
+        if exc.http_status == 404:
+            return 0
+        raise
+
+    def get_claim(claim):
+        try:
+            _, obj = client.get_object(_claim_container(queue, project),
+                                       claim['name'])
+        except swiftclient.ClientException as exc:
+            if exc.http_status == 404:
+                return claim['name'], []
+            raise
+        return claim['name'], jsonutils.loads(obj)
+
+    def holds_claim(args):
+        message_id, claim_ids = args
+        try:
+            headers = client.head_object(
+                _message_object_container(queue, project, message_id,
+                                          shards),
+                message_id)
+        except swiftclient.ClientException as exc:
+            if exc.http_status == 404:
+                return False
+            raise
+        return headers.get('x-object-meta-claimid') in claim_ids
+
+    map_ = executor.map if executor is not None else map
+    # NOTE: A message claimed again once its previous claim expired is
+    # listed by both claims, it's counted once.
+    claimed = collections.defaultdict(set)
+    for claim_id, message_ids in map_(get_claim, claims):
+        for message_id in message_ids:
+            claimed[message_id].add(claim_id)
+    return sum(map_(holds_claim, claimed.items()))
+
+
+def _list_containers(client, containers, marker=None, limit=None,
+                     query_string=None, executor=None):
+    """List objects of several containers as if they were a single one.
+
+    Listings are merged in name order, honoring the reverse order when
+    asked for through the query string. A missing container raises a 404,
+    unless it is one of the secondary ones.
+    """
+    if len(containers) == 1:
+        _, objects = client.get_container(containers[0], marker=marker,
+                                          limit=limit,
+                                          query_string=query_string)
+        return objects
+
+    def list_container(args):
+        index, container = args
+        try:
+            _, objects = client.get_container(container, marker=marker,
+                                              limit=limit,
+                                              query_string=query_string)
+        except swiftclient.ClientException as exc:
+            if exc.http_status == 404 and index:
+                return []
+            raise
+        return objects
+
+    if executor is None:
+        listings = list(map(list_container, enumerate(containers)))
+    else:
+        listings = list(executor.map(list_container, enumerate(containers)))
+    merged = heapq.merge(*listings, key=operator.itemgetter('name'),
+                         reverse=query_string == 'reverse=on')
+    return list(itertools.islice(merged, limit))
+
+
 def _message_to_json(message_id, msg, headers, now):
     msg = jsonutils.loads(msg)
 
@@ -87,51 +267,79 @@ def _subscription_to_json(sub, headers):
             'confirmed': sub['confirmed']}
 
 
+def _get_object_or_none(get_object, name):
+    try:
+        return get_object(name)
+    except swiftclient.ClientException as exc:
+        if exc.http_status == 404:
+            return None
+        raise
+
+
+def _fetch_objects(messages, get_object, executor=None):
+    """Fetch the objects of a listing, preserving the listing order.
+
+    When an executor is given, all the objects are requested concurrently
+    and yielded as they are consumed. Objects that disappeared in between
+    are yielded as None.
+    """
+    messages = [msg for msg in messages if msg is not None]
+    if executor is None:
+        for msg in messages:
+            yield msg, _get_object_or_none(get_object, msg['name'])
+        return
+
+    futures = [executor.submit(_get_object_or_none, get_object, msg['name'])
+               for msg in messages]
+    try:
+        for msg, future in zip(messages, futures):
+            yield msg, future.result()
+    finally:
+        # NOTE: Don't keep fetching objects nobody is going to look at.
+        for future in futures:
+            future.cancel()
+
+
 def _filter_messages(messages, filters, marker, get_object, list_objects,
-                     limit):
+                     limit, executor=None):
     """Create a filtering iterator over a list of messages.
 
     The function accepts a list of filters to be filtered
     before the message can be included as a part of the reply.
+    Further pages are listed until the limit is reached or the
+    container is exhausted.
     """
     now = timeutils.utcnow_ts(True)
 
-    for msg in messages:
-        if msg is None:
-            continue
-
-        marker['next'] = msg['name']
-        try:
-            headers, obj = get_object(msg['name'])
-        except swiftclient.ClientException as exc:
-            if exc.http_status == 404:
+    while True:
+        for msg, result in _fetch_objects(messages, get_object, executor):
+            marker['next'] = msg['name']
+            if result is None:
                 continue
-            raise
-        obj = jsonutils.loads(obj)
-        for should_skip in filters:
-            if should_skip(obj, headers):
-                break
-        else:
-            limit -= 1
-            yield {
-                'id': marker['next'],
-                'ttl': obj['ttl'],
-                'client_uuid': headers['x-object-meta-clientid'],
-                'body': obj['body'],
-                'age': now - float(headers['x-timestamp']),
-                'claim_id': obj['claim_id'],
-                'claim_count': obj.get('claim_count', 0),
-            }
-            if limit <= 0:
-                break
-    if limit > 0 and marker:
+            headers, obj = result
+            obj = jsonutils.loads(obj)
+            for should_skip in filters:
+                if should_skip(obj, headers):
+                    break
+            else:
+                limit -= 1
+                yield {
+                    'id': marker['next'],
+                    'ttl': obj['ttl'],
+                    'client_uuid': headers['x-object-meta-clientid'],
+                    'body': obj['body'],
+                    'age': now - float(headers['x-timestamp']),
+                    'claim_id': obj['claim_id'],
+                    'claim_count': obj.get('claim_count', 0),
+                }
+                if limit <= 0:
+                    return
+        if not marker:
+            return
         # We haven't reached the limit, let's try to get some more messages
-        _, objects = list_objects(marker=marker['next'])
-        if not objects:
+        messages = list_objects(marker=marker['next'])
+        if not messages:
             return
-        for msg in _filter_messages(objects, filters, marker, get_object,
-                                    list_objects, limit):
-            yield msg
 
 
 class SubscriptionListCursor:
@@ -192,6 +192,59 @@ def keyify(key, iterable):
         yield Keyed(item)
 
 
+def catalogue_changes(since, version, changes):
+    """Checks the changes read from a catalogue journal.
+
+    Entries of the journal are numbered after the catalogue version they
+    led to. A hole in the numbering means some changes were trimmed from the
+    journal, or haven't been committed yet, so they can't be relied upon.
+
+    :param since: The version the caller knows about, or None
+    :type since: int
+    :param version: The current version of the catalogue
+    :type version: int
+    :param changes: Journal entries newer than `since`, as
+        (version, project, queue), ordered by version
+    :type changes: [(int, str, str)]
+    :returns: The (project, queue) changed since `since`, or None if they
+        can't be known.
+    :rtype: [(str, str)]
+    """
+    if since is None or since > version:
+        return None
+
+    expected = since + 1
+    for entry_version, project, queue in changes:
+        if entry_version != expected:
+            return None
+        expected += 1
+
+    if expected <= version:
+        return None
+
+    return [(project or None, queue) for _, project, queue in changes]
+
+
+def flavor_cache_key(flavor, project=None):
+    """Returns the key under which the pooling catalog caches a flavor."""
+    return 'flavor:' + str(project) + '/' + flavor
+
+
+def flavor_pools_cache_key(flavor=None):
+    """Returns the key under which the pooling catalog caches pools."""
+    return 'flavor.pools:' + str(flavor)
+
+
+def subscribers_cache_key(queue, project=None):
+    """Returns the key under which the notifier caches subscribers."""
+    return 'subscribers:' + str(project) + '/' + queue
+
+
+def subscription_health_cache_key(subscription_id):
+    """Returns the key under which the notifier publishes health."""
+    return 'subscription.health:' + str(subscription_id)
+
+
 def can_connect(uri, conf=None):
     """Given a URI, verifies whether it's possible to connect to it.
 
@@ -64,3 +64,62 @@ class TestSelect(testtools.TestCase):
             fixed_gen = lambda x, y: i
             self.assertEqual(objs[i],
                              select.weighted(objs, generator=fixed_gen))
+
+    def test_static_weighted_ignores_headroom(self):
+        objs = [{'weight': 1, 'name': str(i)} for i in range(3)]
+        for i in range(len(objs)):
+            fixed_gen = lambda x, y: i
+            self.assertEqual(objs[i],
+                             select.static_weighted(objs, lambda o: 0,
+                                                    generator=fixed_gen))
+
+    def test_health_weighted_returns_none_if_no_objs(self):
+        self.assertIsNone(select.health_weighted([], lambda o: 1))
+
+    def test_health_weighted_scales_weights_by_headroom(self):
+        objs = [{'weight': 1, 'name': 'slow'}, {'weight': 1, 'name': 'fast'}]
+        headroom = {'slow': 0.25, 'fast': 1}
+        counts = {'slow': 0, 'fast': 0}
+        for i in range(125):
+            fixed_gen = lambda x, y: i
+            obj = select.health_weighted(objs,
+                                         lambda o: headroom[o['name']],
+                                         generator=fixed_gen)
+            counts[obj['name']] += 1
+        self.assertEqual({'slow': 25, 'fast': 100}, counts)
+
+    def test_health_weighted_keeps_a_share_without_headroom(self):
+        objs = [{'weight': 1, 'name': 'down'}, {'weight': 0, 'name': 'off'}]
+        zero_gen = lambda x, y: 0
+        self.assertEqual(objs[0],
+                         select.health_weighted(objs, lambda o: 0,
+                                                generator=zero_gen))
+
+    def test_least_loaded_picks_the_lowest_load_per_weight(self):
+        objs = [{'weight': 1, 'name': 'small'}, {'weight': 4, 'name': 'big'},
+                {'weight': 0, 'name': 'off'}]
+        load = {'small': 0.3, 'big': 0.6, 'off': 0}
+        obj = select.least_loaded(objs, lambda o: 1,
+                                  load=lambda o: load[o['name']])
+        self.assertEqual('big', obj['name'])
+
+    def test_least_loaded_accounts_for_headroom(self):
+        objs = [{'weight': 1, 'name': 'slow'}, {'weight': 1, 'name': 'fast'}]
+        headroom = {'slow': 0.25, 'fast': 1}
+        load = {'slow': 0.2, 'fast': 0.5}
+        obj = select.least_loaded(objs, lambda o: headroom[o['name']],
+                                  load=lambda o: load[o['name']])
+        self.assertEqual('fast', obj['name'])
+
+    def test_least_loaded_breaks_ties_at_random(self):
+        objs = [{'weight': 1, 'name': str(i)} for i in range(3)]
+        for i in range(len(objs)):
+            fixed_gen = lambda x, y: i
+            self.assertEqual(objs[i],
+                             select.least_loaded(objs, lambda o: 1,
+                                                 generator=fixed_gen,
+                                                 load=lambda o: 0))
+
+    def test_least_loaded_returns_none_if_no_objs(self):
+        self.assertIsNone(select.least_loaded([], lambda o: 1,
+                                              load=lambda o: 0))
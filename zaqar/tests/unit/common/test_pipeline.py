@@ -13,6 +13,8 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+from unittest import mock
+
 from zaqar.common import pipeline
 from zaqar.tests import base
 
@@ -93,3 +95,70 @@ class TestPipeLine(base.TestBase):
 
         with ctxt as consumer:
             self.assertIsNone(consumer())
+
+    def test_stages_are_resolved_once(self):
+        stage = mock.Mock(spec=['no_args'])
+        stage.no_args.return_value = True
+        pipe = pipeline.Pipeline([stage])
+
+        consumer = pipe.no_args
+        stage.no_args = mock.Mock(return_value=False)
+
+        self.assertTrue(consumer())
+        self.assertTrue(pipe.no_args())
+
+    def test_attribute_error_is_raised_on_call(self):
+        consumer = pipeline.Pipeline([FirstClass()]).does_not_exist
+        self.assertRaises(AttributeError, consumer)
+
+    def test_timer(self):
+        timer = mock.Mock()
+        pipe = pipeline.Pipeline(self.pipeline._pipeline, timer=timer)
+
+        self.assertTrue(pipe.calls_the_latest())
+
+        self.assertEqual(2, timer.call_count)
+        stages = [call[0][0] for call in timer.call_args_list]
+        self.assertEqual(self.pipeline._pipeline, stages)
+        for call in timer.call_args_list:
+            self.assertEqual('calls_the_latest', call[0][1])
+            self.assertGreaterEqual(call[0][2], 0)
+
+    def test_timer_on_error(self):
+        timer = mock.Mock()
+        pipe = pipeline.Pipeline([SecondClass()], timer=timer)
+
+        self.assertRaises(RuntimeError, pipe.no_args)
+        self.assertEqual(1, timer.call_count)
+
+    def test_post_commit_hooks(self):
+        hook = mock.Mock(spec=['no_args', 'after_no_args'])
+        hook.no_args.return_value = None
+        pipe = pipeline.Pipeline([hook, FirstClass()])
+
+        self.assertTrue(pipe.no_args())
+        hook.after_no_args.assert_called_once_with(True)
+
+    def test_post_commit_hooks_get_call_arguments(self):
+        hook = mock.Mock(spec=['after_with_args_kwargs'])
+        pipe = pipeline.Pipeline([FirstClass(), hook])
+
+        result = pipe.with_args_kwargs('James', lastname='Bond')
+
+        self.assertEqual('James Bond', result)
+        hook.after_with_args_kwargs.assert_called_once_with(
+            'James Bond', 'James', lastname='Bond')
+
+    def test_post_commit_hook_errors_are_not_raised(self):
+        hook = mock.Mock(spec=['after_no_args'])
+        hook.after_no_args.side_effect = RuntimeError
+        pipe = pipeline.Pipeline([FirstClass(), hook])
+
+        self.assertTrue(pipe.no_args())
+
+    def test_post_commit_hooks_skipped_on_error(self):
+        hook = mock.Mock(spec=['after_no_args'])
+        pipe = pipeline.Pipeline([SecondClass(), hook])
+
+        self.assertRaises(RuntimeError, pipe.no_args)
+        self.assertFalse(hook.after_no_args.called)
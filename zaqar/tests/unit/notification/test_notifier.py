@@ -13,17 +13,31 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
+import collections
+import email
+import smtplib
+import threading
+import time
 from unittest import mock
 import uuid
 
 import ddt
+import futurist
 
 from oslo_serialization import jsonutils
 from oslo_utils import encodeutils
+import requests
 
+from zaqar.common import auth
+from zaqar.common import cache as oslo_cache
 from zaqar.common import urls
+from zaqar.notification import health
 from zaqar.notification import notifier
+from zaqar.notification import scheduling
+from zaqar.notification.tasks import mailto
+from zaqar.notification.tasks import trust
 from zaqar.notification.tasks import webhook
+from zaqar.storage import utils
 from zaqar import tests as testing
 
 
@@ -78,10 +92,10 @@ class NotifierTest(testing.TestBase):
         driver = notifier.NotifierDriver(subscription_controller=ctlr,
                                          queue_controller=queue_ctlr)
         headers = {'Content-Type': 'application/json'}
-        with mock.patch('requests.post') as mock_post:
+        with mock.patch('requests.Session.post') as mock_post:
             mock_post.return_value = None
-            driver.post('fake_queue', self.messages, self.client_id,
-                        self.project)
+            driver.notify('fake_queue', self.messages, self.client_id,
+                          self.project)
             driver.executor.shutdown()
             # Let's deserialize "data" from JSON string to dict in each mock
             # call, so we can do dict comparisons. JSON string comparisons
@@ -126,10 +140,10 @@ class NotifierTest(testing.TestBase):
         driver = notifier.NotifierDriver(subscription_controller=ctlr,
                                          queue_controller=queue_ctlr)
         headers = {'Content-Type': 'application/json'}
-        with mock.patch('requests.post') as mock_post:
+        with mock.patch('requests.Session.post') as mock_post:
             mock_post.return_value = None
-            driver.post('fake_queue', self.messages, self.client_id,
-                        self.project)
+            driver.notify('fake_queue', self.messages, self.client_id,
+                          self.project)
             driver.executor.shutdown()
             # Let's deserialize "data" from JSON string to dict in each mock
             # call, so we can do dict comparisons. JSON string comparisons
@@ -171,10 +185,10 @@ class NotifierTest(testing.TestBase):
         driver = notifier.NotifierDriver(subscription_controller=ctlr,
                                          queue_controller=queue_ctlr)
         headers = {'Content-Type': 'application/json'}
-        with mock.patch('requests.post') as mock_post:
+        with mock.patch('requests.Session.post') as mock_post:
             mock_post.return_value = None
-            driver.post('fake_queue', self.messages, self.client_id,
-                        self.project)
+            driver.notify('fake_queue', self.messages, self.client_id,
+                          self.project)
             driver.executor.shutdown()
             # Let's deserialize "data" from JSON string to dict in each mock
             # call, so we can do dict comparisons. JSON string comparisons
@@ -237,7 +251,8 @@ class NotifierTest(testing.TestBase):
         attrs = {'communicate': _communicate, 'returncode': 0}
         mock_process.configure_mock(**attrs)
         mock_popen.return_value = mock_process
-        driver.post('fake_queue', self.messages, self.client_id, self.project)
+        driver.notify('fake_queue', self.messages, self.client_id,
+                      self.project)
         driver.executor.shutdown()
 
         self.assertEqual(4, len(called))
@@ -268,12 +283,67 @@ class NotifierTest(testing.TestBase):
         queue_ctlr.get = mock.Mock(return_value={})
         driver = notifier.NotifierDriver(subscription_controller=ctlr,
                                          queue_controller=queue_ctlr)
-        with mock.patch('requests.post') as mock_post:
-            driver.post('fake_queue', self.messages, self.client_id,
-                        self.project)
+        with mock.patch('requests.Session.post') as mock_post:
+            driver.notify('fake_queue', self.messages, self.client_id,
+                          self.project)
             driver.executor.shutdown()
             self.assertEqual(0, mock_post.call_count)
 
+    def test_open_circuit_is_skipped(self):
+        subscription = [{'id': 'failing', 'subscriber': 'http://trigger_me',
+                         'source': 'fake_queue', 'options': {}},
+                        {'id': 'healthy', 'subscriber': 'http://call_me',
+                         'source': 'fake_queue', 'options': {}}]
+        ctlr = mock.MagicMock()
+        ctlr.list = mock.Mock(return_value=iter([subscription, {}]))
+        queue_ctlr = mock.MagicMock()
+        queue_ctlr.get = mock.Mock(return_value={})
+        driver = notifier.NotifierDriver(subscription_controller=ctlr,
+                                         queue_controller=queue_ctlr,
+                                         subscriber_failure_threshold=1)
+        driver.health.record('failing', False)
+        with mock.patch('requests.Session.post') as mock_post:
+            mock_post.return_value = None
+            driver.notify('fake_queue', self.messages, self.client_id,
+                          self.project)
+            driver.executor.shutdown()
+            self.assertEqual(2, mock_post.call_count)
+            for call in mock_post.call_args_list:
+                self.assertEqual('http://call_me', call[0][0])
+        self.assertEqual(1, driver.subscription_health('failing')['dropped'])
+
+    def test_local_subscribers(self):
+        subscription = [{'subscriber': 'http://localhost:9001/proto1',
+                         'source': 'fake_queue', 'options': {}},
+                        {'subscriber': 'http://localhost:9001/proto2',
+                         'source': 'fake_queue', 'options': {}},
+                        {'subscriber': 'http://trigger_me',
+                         'source': 'fake_queue', 'options': {}}]
+        ctlr = mock.MagicMock()
+        ctlr.list = mock.Mock(return_value=iter([subscription, {}]))
+        queue_ctlr = mock.MagicMock()
+        queue_ctlr.get = mock.Mock(return_value={})
+        driver = notifier.NotifierDriver(subscription_controller=ctlr,
+                                         queue_controller=queue_ctlr)
+        channel = mock.Mock()
+        notifier.channels.register('http://localhost:9001/', channel)
+        self.addCleanup(notifier.channels.unregister,
+                        'http://localhost:9001/')
+        with mock.patch('requests.Session.post') as mock_post:
+            mock_post.return_value = None
+            driver.notify('fake_queue', self.messages, self.client_id,
+                          self.project)
+            driver.executor.shutdown()
+            self.assertEqual(2, mock_post.call_count)
+            for call in mock_post.call_args_list:
+                self.assertEqual('http://trigger_me', call[0][0])
+
+        channel.publish.assert_called_once_with(['proto1', 'proto2'],
+                                                mock.ANY)
+        serialized = channel.publish.call_args[0][1]
+        self.assertEqual(self.notifications,
+                         [jsonutils.loads(data) for data in serialized])
+
     def test_proper_notification_data(self):
         subscription = [{'subscriber': 'http://trigger_me',
                          'source': 'fake_queue',
@@ -284,16 +354,112 @@ class NotifierTest(testing.TestBase):
         queue_ctlr.get = mock.Mock(return_value={})
         driver = notifier.NotifierDriver(subscription_controller=ctlr,
                                          queue_controller=queue_ctlr)
-        with mock.patch('requests.post') as mock_post:
+        with mock.patch('requests.Session.post') as mock_post:
             mock_post.return_value = None
-            driver.post('fake_queue', self.messages, self.client_id,
-                        self.project)
+            driver.notify('fake_queue', self.messages, self.client_id,
+                          self.project)
             driver.executor.shutdown()
             self.assertEqual(2, mock_post.call_count)
             self.assertEqual(self.notifications[1],
                              jsonutils.loads(mock_post.call_args[1]['data']))
 
-    @mock.patch('requests.post')
+    def test_after_post_dispatches(self):
+        driver = notifier.NotifierDriver(
+            subscription_controller=mock.MagicMock(),
+            queue_controller=mock.MagicMock())
+        with mock.patch.object(driver, 'notify') as mock_notify:
+            driver.after_post(['1', '2'], 'fake_queue', self.messages,
+                              self.client_id, self.project)
+            driver.dispatcher.shutdown()
+            mock_notify.assert_called_once_with('fake_queue', self.messages,
+                                                self.client_id,
+                                                project=self.project)
+
+    def test_after_post_without_messages(self):
+        driver = notifier.NotifierDriver(
+            subscription_controller=mock.MagicMock(),
+            queue_controller=mock.MagicMock())
+        with mock.patch.object(driver, 'notify') as mock_notify:
+            driver.after_post([], 'fake_queue', [], self.client_id,
+                              self.project)
+            driver.dispatcher.shutdown()
+            self.assertFalse(mock_notify.called)
+
+    def test_after_post_backlog_full(self):
+        driver = notifier.NotifierDriver(
+            subscription_controller=mock.MagicMock(),
+            queue_controller=mock.MagicMock(),
+            max_notifier_workers=1, max_notifier_backlog=1)
+        release = threading.Event()
+        with mock.patch.object(driver, 'notify',
+                               side_effect=lambda *a, **k: release.wait()):
+            for _ in range(3):
+                driver.after_post(['1'], 'fake_queue', self.messages,
+                                  self.client_id, self.project)
+            release.set()
+            driver.dispatcher.shutdown()
+            self.assertLess(driver.notify.call_count, 3)
+
+    def _cached_driver(self, subscription):
+        oslo_cache.register_config(self.conf)
+        self.config('cache', backend='dogpile.cache.memory', enabled=True)
+        ctlr = mock.MagicMock()
+        ctlr.list = mock.Mock(side_effect=lambda *a, **k: iter(
+            [subscription, {}]))
+        queue_ctlr = mock.MagicMock()
+        queue_ctlr.get = mock.Mock(return_value={})
+        driver = notifier.NotifierDriver(
+            subscription_controller=ctlr, queue_controller=queue_ctlr,
+            cache=oslo_cache.get_cache(self.conf), subscriber_cache_ttl=60)
+        return driver, ctlr
+
+    def test_subscribers_are_cached(self):
+        subscription = [{'subscriber': 'http://trigger_me',
+                         'source': 'fake_queue',
+                         'options': {}}]
+        driver, ctlr = self._cached_driver(subscription)
+        with mock.patch('requests.Session.post') as mock_post:
+            mock_post.return_value = None
+            for _ in range(2):
+                driver.notify('fake_queue', self.messages, self.client_id,
+                              self.project)
+            driver.executor.shutdown()
+            self.assertEqual(4, mock_post.call_count)
+        self.assertEqual(1, ctlr.list.call_count)
+
+    def test_forgotten_subscribers_are_reloaded(self):
+        subscription = [{'subscriber': 'http://trigger_me',
+                         'source': 'fake_queue',
+                         'options': {}}]
+        driver, ctlr = self._cached_driver(subscription)
+        with mock.patch.object(driver, '_execute'):
+            driver.notify('fake_queue', self.messages, self.client_id,
+                          self.project)
+            driver.cache.delete(utils.subscribers_cache_key('fake_queue',
+                                                            self.project))
+            driver.notify('fake_queue', self.messages, self.client_id,
+                          self.project)
+        self.assertEqual(2, ctlr.list.call_count)
+
+    def test_messages_serialized_once(self):
+        subscription = [{'subscriber': 'http://trigger_me',
+                         'source': 'fake_queue',
+                         'options': {}},
+                        {'subscriber': 'http://call_me',
+                         'source': 'fake_queue',
+                         'options': {}}]
+        driver, ctlr = self._cached_driver(subscription)
+        with mock.patch('requests.Session.post') as mock_post, \
+                mock.patch.object(jsonutils, 'dumps',
+                                  wraps=jsonutils.dumps) as mock_dumps:
+            mock_post.return_value = None
+            driver.notify('fake_queue', self.messages, self.client_id,
+                          self.project)
+            driver.executor.shutdown()
+            self.assertEqual(4, mock_post.call_count)
+        self.assertEqual(len(self.messages), mock_dumps.call_count)
+
+    @mock.patch('requests.Session.post')
     def test_send_confirm_notification(self, mock_request):
         self.conf.notification.require_confirmation = True
         subscription = {'id': '5760c9fb3990b42e8b7c20bd',
@@ -319,7 +485,7 @@ class NotifierTest(testing.TestBase):
         self.assertEqual(expect_args.sort(),
                          list(actual_args).sort())
 
-    @mock.patch('requests.post')
+    @mock.patch('requests.Session.post')
     def test_send_confirm_notification_without_signed_url(self, mock_request):
         subscription = [{'subscriber': 'http://trigger_me',
                          'source': 'fake_queue', 'options': {}}]
@@ -454,3 +620,627 @@ class NotifierTest(testing.TestBase):
         expect = [30, 30, 32, 34, 37, 41, 46, 51, 57, 64, 72, 80, 90, 100]
         sec = webhook._Arithmetic_function(30, 100, 5)
         self.assertEqual(expect, sec)
+
+
+class TaskRegistryTest(testing.TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.registry = notifier.TaskRegistry()
+
+    def test_tasks_are_loaded_once(self):
+        task = self.registry.get('http')
+        self.assertIsInstance(task, webhook.WebhookTask)
+        self.assertIs(task, self.registry.get('http'))
+        self.assertIsNot(task, self.registry.get('https'))
+
+    def test_reload(self):
+        task = self.registry.get('http')
+        self.registry.reload()
+        self.assertIsNot(task, self.registry.get('http'))
+
+    def test_unknown_scheme(self):
+        self.assertRaises(RuntimeError, self.registry.get, 'gopher')
+
+
+class DeliveriesTest(testing.TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.executor = futurist.ThreadPoolExecutor(max_workers=4)
+        self.deliveries = notifier.Deliveries(self.executor, limit=1)
+
+    def _blocked(self, hosts):
+        release = threading.Event()
+        running = collections.Counter()
+        peaks = collections.Counter()
+        lock = threading.Lock()
+
+        def deliver(host):
+            with lock:
+                running[host] += 1
+                peaks[host] = max(peaks[host], running[host])
+            release.wait(5)
+            with lock:
+                running[host] -= 1
+
+        for host in hosts:
+            self.deliveries.submit(host, deliver, host)
+        return release, peaks
+
+    def test_limit_per_host(self):
+        release, peaks = self._blocked(['slow'] * 3 + ['fast'])
+
+        stats = self.deliveries.stats()
+        self.assertEqual(2, stats['running'])
+        self.assertEqual(2, stats['pending'])
+
+        release.set()
+        while self.deliveries.stats()['delivered'] < 4:
+            time.sleep(0.01)
+        self.executor.shutdown()
+
+        self.assertEqual(1, peaks['slow'])
+        stats = self.deliveries.stats()
+        self.assertEqual(0, stats['running'])
+        self.assertEqual(0, stats['pending'])
+
+    def test_no_limit_without_host(self):
+        release, peaks = self._blocked([''] * 3)
+
+        self.assertEqual(3, self.deliveries.stats()['running'])
+        release.set()
+        self.executor.shutdown()
+
+    def test_stats(self):
+        self.deliveries.submit('host', lambda: None)
+        self.deliveries.submit('host', mock.Mock(side_effect=ValueError))
+        while self.deliveries.stats()['delivered'] < 2:
+            time.sleep(0.01)
+        self.executor.shutdown()
+
+        stats = self.deliveries.stats()
+        self.assertEqual(1, stats['failed'])
+        self.assertGreater(stats['throughput'], 0)
+        self.assertGreaterEqual(stats['latency']['max'],
+                                stats['latency']['avg'])
+
+
+class WebhookSessionTest(testing.TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.task = webhook.WebhookTask()
+
+    def test_session_is_shared(self):
+        session = self.task._get_session(self.conf)
+        self.assertIs(session, self.task._get_session())
+
+    @mock.patch('requests.adapters.HTTPAdapter.send')
+    def test_timeout(self, mock_send):
+        self.conf.set_override('webhook_timeout', 2.5, group='notification')
+        mock_send.return_value = requests.Response()
+        session = self.task._get_session(self.conf)
+
+        session.post('http://trigger_me', data='{}')
+        self.assertEqual(2.5, mock_send.call_args[1]['timeout'])
+
+        session.post('http://trigger_me', data='{}', timeout=1)
+        self.assertEqual(1, mock_send.call_args[1]['timeout'])
+
+
+class WebhookRetryTest(testing.TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.scheduler = scheduling.Scheduler(
+            futurist.SynchronousExecutor())
+        patcher = mock.patch.object(scheduling, 'get_scheduler',
+                                    return_value=self.scheduler)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_retry_delays(self):
+        policy = {'retries_with_no_delay': 2,
+                  'minimum_delay_retries': 1,
+                  'minimum_delay': 5,
+                  'maximum_delay': 20,
+                  'maximum_delay_retries': 1,
+                  'retry_backoff_function': 'linear'}
+        expected = [0, 0, 5] + list(range(5, 20, 5)) + [20]
+        self.assertEqual(expected, list(webhook._retry_delays(policy)))
+
+    def test_scheduler_runs_due_calls_in_order(self):
+        called = []
+        done = threading.Event()
+
+        def call(name):
+            called.append(name)
+            if len(called) == 3:
+                done.set()
+
+        self.scheduler.schedule(0.2, call, 'last')
+        self.scheduler.schedule(0, call, 'first')
+        self.scheduler.schedule(0.1, call, 'second')
+
+        self.assertTrue(done.wait(5))
+        self.assertEqual(['first', 'second', 'last'], called)
+        self.assertEqual(0, len(self.scheduler))
+
+    def test_retries_stop_on_success(self):
+        task = webhook.WebhookTask()
+        policy = {'retries_with_no_delay': 5,
+                  'minimum_delay_retries': 0,
+                  'maximum_delay_retries': 0}
+        with mock.patch.object(webhook, '_retry_delays',
+                               return_value=iter([0] * 5)), \
+                mock.patch.object(task, '_post_request_success',
+                                  side_effect=[False, True]) as mock_post:
+            task._retry_post({}, policy, 'http://trigger_me', '{}', {})
+
+            for _ in range(50):
+                if mock_post.call_count == 2 and not len(self.scheduler):
+                    break
+                time.sleep(0.01)
+
+        self.assertEqual(2, mock_post.call_count)
+        self.assertEqual(0, len(self.scheduler))
+
+    def test_retries_are_run_by_the_deliveries(self):
+        task = webhook.WebhookTask()
+        deliveries = mock.Mock()
+        with mock.patch.object(webhook, '_retry_delays',
+                               return_value=iter([0])):
+            task._retry_post({}, {}, 'http://trigger_me:8080/x', '{}', {},
+                             deliveries=deliveries)
+
+            for _ in range(50):
+                if deliveries.submit.called:
+                    break
+                time.sleep(0.01)
+
+        deliveries.submit.assert_called_once_with(
+            'trigger_me:8080', task._retry, self.scheduler, mock.ANY,
+            'http://trigger_me:8080/x', '{}', {}, None, deliveries)
+
+
+class SubscriberHealthTest(testing.TestBase):
+
+    def setUp(self):
+        super().setUp()
+        oslo_cache.register_config(self.conf)
+        self.config('cache', backend='dogpile.cache.memory', enabled=True)
+        self.cache = oslo_cache.get_cache(self.conf)
+        self.health = health.SubscriberHealth(self.cache,
+                                              failure_threshold=2,
+                                              open_interval=60)
+
+    def test_unknown_subscription(self):
+        self.assertTrue(self.health.allow('sub'))
+        self.assertIsNone(self.health.get('sub'))
+        self.assertIsNone(health.get_published(self.cache, 'sub'))
+
+    def test_circuit_opens_after_threshold(self):
+        self.health.record('sub', False)
+        self.assertTrue(self.health.allow('sub'))
+        self.health.record('sub', False)
+        self.assertFalse(self.health.allow('sub'))
+        self.assertFalse(self.health.allow('sub'))
+
+        basic = self.health.get('sub')
+        self.assertEqual(health.OPEN, basic['state'])
+        self.assertEqual(2, basic['consecutive_failures'])
+        self.assertEqual(2, basic['dropped'])
+        self.assertEqual(health.OPEN,
+                         health.get_published(self.cache, 'sub')['state'])
+
+    def test_half_open_probe(self):
+        self.health.record('sub', False)
+        self.health.record('sub', False)
+        with mock.patch.object(health.time, 'time',
+                               return_value=time.time() + 61):
+            self.assertTrue(self.health.allow('sub'))
+            # NOTE: A single probe is let through at a time.
+            self.assertFalse(self.health.allow('sub'))
+            self.assertEqual(health.HALF_OPEN, self.health.get('sub')['state'])
+
+            self.health.record('sub', False)
+            self.assertEqual(health.OPEN, self.health.get('sub')['state'])
+            self.assertFalse(self.health.allow('sub'))
+
+    def test_success_closes_circuit(self):
+        self.health.record('sub', False)
+        self.health.record('sub', False)
+        with mock.patch.object(health.time, 'time',
+                               return_value=time.time() + 61):
+            self.assertTrue(self.health.allow('sub'))
+            self.health.record('sub', True, 0.5)
+
+        basic = health.get_published(self.cache, 'sub')
+        self.assertEqual(health.CLOSED, basic['state'])
+        self.assertEqual(0, basic['consecutive_failures'])
+        self.assertEqual(0.5, basic['latency'])
+        self.assertIsNotNone(basic['last_success'])
+        self.assertTrue(self.health.allow('sub'))
+
+    def test_no_threshold(self):
+        subscriber_health = health.SubscriberHealth()
+        for _ in range(10):
+            subscriber_health.record('sub', False)
+        self.assertTrue(subscriber_health.allow('sub'))
+        self.assertEqual(health.CLOSED, subscriber_health.get('sub')['state'])
+
+    def test_subscriptions_are_bounded(self):
+        subscriber_health = health.SubscriberHealth(failure_threshold=1,
+                                                    max_subscriptions=2)
+        subscriber_health.record('sub1', False)
+        subscriber_health.record('sub2', True)
+        # NOTE: Dropping a notification counts as seeing the subscription.
+        self.assertFalse(subscriber_health.allow('sub1'))
+        subscriber_health.record('sub3', True)
+
+        self.assertEqual(2, len(subscriber_health))
+        self.assertIsNone(subscriber_health.get('sub2'))
+        self.assertEqual(health.OPEN, subscriber_health.get('sub1')['state'])
+
+    def test_idle_subscriptions_are_forgotten(self):
+        self.health.record('sub1', False)
+        self.health.record('sub1', False)
+        with mock.patch.object(health.time, 'time',
+                               return_value=time.time() +
+                               health._HEALTH_TTL):
+            self.health.record('sub2', True)
+
+        self.assertEqual(1, len(self.health))
+        self.assertIsNone(self.health.get('sub1'))
+        self.assertTrue(self.health.allow('sub1'))
+
+    def test_webhook_records_deliveries(self):
+        subscription = {'id': 'sub', 'subscriber': 'http://trigger_me',
+                        'source': 'fake_queue', 'options': {}}
+        with mock.patch('requests.Session.post',
+                        side_effect=requests.exceptions.ConnectionError), \
+                mock.patch.object(webhook, '_retry_delays',
+                                  side_effect=lambda policy: iter([])):
+            webhook.WebhookTask().execute(subscription,
+                                          [{'body': {}}, {'body': {}}],
+                                          queue_retry_policy={},
+                                          health=self.health)
+
+        self.assertEqual(health.OPEN, self.health.get('sub')['state'])
+
+    def _retry(self, responses):
+        scheduler = mock.Mock()
+        scheduler.schedule.side_effect = lambda delay, fn, *args: fn(*args)
+        with mock.patch.object(scheduling, 'get_scheduler',
+                               return_value=scheduler), \
+                mock.patch.object(webhook, '_retry_delays',
+                                  return_value=iter([0] * 5)), \
+                mock.patch('requests.Session.post',
+                           side_effect=responses) as mock_post:
+            webhook.WebhookTask()._retry_post(
+                {}, {}, 'http://trigger_me', '{}', {},
+                tracker=self.health.tracker('sub'))
+        return mock_post.call_count
+
+    def test_failed_retries_count_once(self):
+        self.assertEqual(5, self._retry(requests.exceptions.ConnectionError))
+        basic = self.health.get('sub')
+        self.assertEqual(health.CLOSED, basic['state'])
+        self.assertEqual(1, basic['consecutive_failures'])
+
+    def test_successful_retry_counts_as_success(self):
+        self.health.record('sub', False)
+        self.assertEqual(2, self._retry([requests.exceptions.ConnectionError,
+                                         mock.Mock(status_code=200)]))
+        basic = self.health.get('sub')
+        self.assertEqual(0, basic['consecutive_failures'])
+        self.assertIsNotNone(basic['last_success'])
+
+
+class TrustTokenCacheTest(testing.TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.tokens = trust.TokenCache()
+        patcher = mock.patch.object(auth, 'get_trusted_access')
+        self.mock_access = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _access(self, token, expiring=False):
+        access = mock.Mock(auth_token=token)
+        access.will_expire_soon.return_value = expiring
+        return access
+
+    def test_token_is_cached(self):
+        self.mock_access.return_value = self._access('token')
+
+        self.assertEqual('token', self.tokens.get('trust'))
+        self.assertEqual('token', self.tokens.get('trust'))
+        self.mock_access.assert_called_once_with('trust')
+
+    def test_expiring_token_is_refreshed(self):
+        self.mock_access.side_effect = [self._access('old', expiring=True),
+                                        self._access('new')]
+
+        self.assertEqual('old', self.tokens.get('trust'))
+        self.assertEqual('new', self.tokens.get('trust'))
+        self.assertEqual('new', self.tokens.get('trust'))
+        self.assertEqual(2, self.mock_access.call_count)
+
+    def test_single_flight(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def get_access(trust_id):
+            started.set()
+            release.wait(5)
+            return self._access('token')
+
+        self.mock_access.side_effect = get_access
+        executor = futurist.ThreadPoolExecutor(max_workers=5)
+        futures = [executor.submit(self.tokens.get, 'trust')
+                   for _ in range(5)]
+        self.assertTrue(started.wait(5))
+        release.set()
+        executor.shutdown()
+
+        self.assertEqual(['token'] * 5, [f.result() for f in futures])
+        self.mock_access.assert_called_once_with('trust')
+
+    def test_invalidate(self):
+        self.mock_access.side_effect = [self._access('old'),
+                                        self._access('new')]
+
+        self.assertEqual('old', self.tokens.get('trust'))
+        self.tokens.invalidate('trust')
+        self.assertEqual('new', self.tokens.get('trust'))
+
+    def test_expired_tokens_are_swept(self):
+        tokens = trust.TokenCache(sweep_interval=0)
+        expired = self._access('expired')
+        expired.will_expire_soon.side_effect = lambda stale_duration: True
+        valid = self._access('valid')
+        self.mock_access.side_effect = [expired, valid]
+
+        self.assertEqual('expired', tokens.get('trust1'))
+        self.assertEqual('valid', tokens.get('trust2'))
+        self.assertEqual(1, len(tokens))
+        self.assertEqual('valid', tokens.get('trust2'))
+        self.assertEqual(2, self.mock_access.call_count)
+
+    def test_task_invalidates_rejected_token(self):
+        self.mock_access.side_effect = [self._access('old'),
+                                        self._access('new')]
+        subscription = {'subscriber': 'trust+http://trigger_me',
+                        'source': 'fake_queue',
+                        'options': {'trust_id': 'trust'}}
+        with mock.patch.object(trust, 'tokens', self.tokens), \
+                mock.patch('requests.Session.post') as mock_post:
+            mock_post.return_value = mock.Mock(status_code=401)
+            trust.TrustTask().execute(subscription, [{'body': {}}])
+            mock_post.return_value = mock.Mock(status_code=204)
+            trust.TrustTask().execute(subscription, [{'body': {}}])
+
+        self.assertEqual(['old', 'new'],
+                         [c[1]['headers']['X-Auth-Token']
+                          for c in mock_post.call_args_list])
+        self.assertEqual('new', self.tokens.get('trust'))
+
+    def test_task_uses_cache(self):
+        self.mock_access.return_value = self._access('token')
+        subscription = {'subscriber': 'trust+http://trigger_me',
+                        'source': 'fake_queue',
+                        'options': {'trust_id': 'trust'}}
+        with mock.patch.object(trust, 'tokens', self.tokens), \
+                mock.patch('requests.Session.post') as mock_post:
+            mock_post.return_value = None
+            trust.TrustTask().execute(subscription, [{'body': {}}] * 3)
+
+        self.assertEqual(3, mock_post.call_count)
+        self.assertEqual('token',
+                         mock_post.call_args[1]['headers']['X-Auth-Token'])
+        self.mock_access.assert_called_once_with('trust')
+
+
+class SMTPPoolTest(testing.TestBase):
+
+    def setUp(self):
+        super().setUp()
+        patcher = mock.patch('smtplib.SMTP_SSL')
+        self.mock_smtp = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.pool = mailto.SMTPPool('smtp.example.com', 465, 'user', 'pass',
+                                    size=2)
+
+    def test_connection_is_reused(self):
+        self.pool.sendmail('a@example.com', 'b@example.com', 'one')
+        self.pool.sendmail('a@example.com', 'b@example.com', 'two')
+
+        self.mock_smtp.assert_called_once_with('smtp.example.com', 465)
+        sender = self.mock_smtp.return_value
+        sender.login.assert_called_once_with('user', 'pass')
+        self.assertEqual(2, sender.sendmail.call_count)
+
+    def test_disconnected_connection_is_replaced(self):
+        stale, fresh = mock.Mock(), mock.Mock()
+        stale.sendmail.side_effect = [None, smtplib.SMTPServerDisconnected]
+        self.mock_smtp.side_effect = [stale, fresh]
+
+        self.pool.sendmail('a@example.com', 'b@example.com', 'one')
+        self.pool.sendmail('a@example.com', 'b@example.com', 'two')
+
+        stale.close.assert_called_once_with()
+        fresh.sendmail.assert_called_once_with('a@example.com',
+                                               'b@example.com', 'two')
+
+    def test_refused_email_keeps_connection(self):
+        sender = self.mock_smtp.return_value
+        sender.sendmail.side_effect = [
+            smtplib.SMTPRecipientsRefused({}), None]
+
+        self.assertRaises(smtplib.SMTPRecipientsRefused, self.pool.sendmail,
+                          'a@example.com', 'b@example.com', 'one')
+        self.pool.sendmail('a@example.com', 'b@example.com', 'two')
+
+        self.assertEqual(1, self.mock_smtp.call_count)
+        self.assertFalse(sender.close.called)
+
+    def test_failed_login(self):
+        sender = self.mock_smtp.return_value
+        sender.login.side_effect = smtplib.SMTPAuthenticationError(535, '')
+
+        self.assertRaises(smtplib.SMTPAuthenticationError,
+                          self.pool.sendmail, 'a@example.com',
+                          'b@example.com', 'one')
+        sender.close.assert_called_once_with()
+        self.assertEqual([], self.pool._idle)
+
+    def test_failed_reconnection(self):
+        stale, fresh = mock.Mock(), mock.Mock()
+        stale.sendmail.side_effect = [None, smtplib.SMTPServerDisconnected]
+        fresh.login.side_effect = smtplib.SMTPConnectError(421, '')
+        self.mock_smtp.side_effect = [stale, fresh]
+
+        self.pool.sendmail('a@example.com', 'b@example.com', 'one')
+        self.assertRaises(smtplib.SMTPConnectError, self.pool.sendmail,
+                          'a@example.com', 'b@example.com', 'two')
+
+        stale.close.assert_called_once_with()
+        fresh.close.assert_called_once_with()
+        self.assertEqual([], self.pool._idle)
+
+
+class MailtoTaskTest(testing.TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.task = mailto.MailtoTask()
+        self.conf = mock.Mock()
+        self.conf.notification.smtp_mode = 'self_local'
+        self.conf.notification.smtp_pool_size = 1
+        patcher = mock.patch('smtplib.SMTP_SSL')
+        self.mock_smtp = patcher.start()
+        self.addCleanup(patcher.stop)
+        self.subscription = {'subscriber': 'mailto:aaa@example.com',
+                             'source': 'fake_queue',
+                             'options': {'subject': 'Hello',
+                                         'from': 'zaqar@example.com'}}
+        self.messages = [{'body': {'n': i}, 'Message_Type': 'Notification'}
+                         for i in range(3)]
+
+    def _sent(self):
+        sender = self.mock_smtp.return_value
+        return [email.message_from_string(call[0][2])
+                for call in sender.sendmail.call_args_list]
+
+    def test_emails_share_connection(self):
+        self.task.execute(self.subscription, self.messages, conf=self.conf)
+
+        self.assertEqual(1, self.mock_smtp.call_count)
+        self.assertEqual([m['body'] for m in self.messages],
+                         [jsonutils.loads(m.get_payload())['body']
+                          for m in self._sent()])
+
+    def test_digest(self):
+        scheduler = mock.Mock()
+        with mock.patch.object(scheduling, 'get_scheduler',
+                               return_value=scheduler):
+            self.task.execute(self.subscription, self.messages[:2],
+                              conf=self.conf, mailto_digest_window=5)
+            self.task.execute(self.subscription, self.messages[2:],
+                              conf=self.conf, mailto_digest_window=5)
+        self.assertEqual([], self._sent())
+        key = ('aaa@example.com', 'zaqar@example.com', 'Hello')
+        scheduler.schedule.assert_called_once_with(5, self.task._flush,
+                                                   self.conf, key)
+
+        self.task._flush(self.conf, key)
+
+        sent = self._sent()
+        self.assertEqual(1, len(sent))
+        self.assertEqual('aaa@example.com', sent[0]['to'])
+        self.assertEqual('Hello', sent[0]['subject'])
+        self.assertEqual([m['body'] for m in self.messages],
+                         [m['body'] for m in
+                          jsonutils.loads(sent[0].get_payload())])
+        self.assertEqual(1, self.task.stats()['digests'])
+
+    def test_stats(self):
+        sender = self.mock_smtp.return_value
+        sender.sendmail.side_effect = [None, smtplib.SMTPDataError(554, ''),
+                                       None]
+
+        self.task.execute(self.subscription, self.messages, conf=self.conf)
+
+        stats = self.task.stats()
+        self.assertEqual(2, stats['sent'])
+        self.assertEqual(1, stats['failed'])
+        self.assertEqual(0, stats['digests'])
+        self.assertIsNotNone(stats['last_failure'])
+
+
+class WebhookBatchTest(testing.TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.task = webhook.WebhookTask()
+        self.messages = [{'body': {'n': i},
+                          'Message_Type': 'Notification'}
+                         for i in range(5)]
+        self.serialized = [jsonutils.dumps(m) for m in self.messages]
+        patcher = mock.patch('requests.Session.post')
+        self.mock_post = patcher.start()
+        self.mock_post.return_value = None
+        self.addCleanup(patcher.stop)
+
+    def _subscription(self, **options):
+        return {'id': 'sub', 'subscriber': 'http://trigger_me',
+                'source': 'fake_queue', 'options': options}
+
+    def _posted(self):
+        return [jsonutils.loads(call[1]['data'])
+                for call in self.mock_post.call_args_list]
+
+    def test_batches(self):
+        self.task.execute(self._subscription(batch_size=2), self.messages,
+                          serialized=self.serialized)
+
+        self.assertEqual([self.messages[0:2], self.messages[2:4],
+                          self.messages[4:]], self._posted())
+
+    def test_confirmations_are_not_batched(self):
+        self.messages[0]['Message_Type'] = 'SubscriptionConfirmation'
+        self.task.execute(self._subscription(batch_size=10), self.messages)
+
+        posted = self._posted()
+        self.assertEqual(self.messages[0], posted[0])
+        self.assertEqual([self.messages[1:]], posted[1:])
+
+    def test_post_data(self):
+        post_data = jsonutils.dumps({'all': '$zaqar_messages$'})
+        self.task.execute(self._subscription(batch_size=5,
+                                             post_data=post_data),
+                          self.messages, serialized=self.serialized)
+
+        self.assertEqual([{'all': self.messages}], self._posted())
+
+    def test_linger(self):
+        scheduler = mock.Mock()
+        subscription = self._subscription(batch_size=4, batch_linger_ms=100)
+        with mock.patch.object(scheduling, 'get_scheduler',
+                               return_value=scheduler):
+            self.task.execute(subscription, self.messages[:3],
+                              serialized=self.serialized[:3])
+            self.assertFalse(self.mock_post.called)
+            scheduler.schedule.assert_called_once_with(0.1, self.task._flush,
+                                                       'sub')
+
+            self.task.execute(subscription, self.messages[3:],
+                              serialized=self.serialized[3:])
+            self.assertEqual([self.messages[:4]], self._posted())
+
+            self.task._flush('sub')
+            self.assertEqual([self.messages[:4], self.messages[4:]],
+                             self._posted())
+            self.assertEqual(1, scheduler.schedule.call_count)
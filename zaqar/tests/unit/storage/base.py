@@ -34,6 +34,7 @@ from zaqar.common import cache as oslo_cache
 from zaqar import storage
 from zaqar.storage import errors
 from zaqar.storage import pipeline
+from zaqar.storage import utils
 from zaqar import tests as testing
 from zaqar.tests import helpers
 
@@ -1511,6 +1512,28 @@ class SubscriptionControllerTest(ControllerBaseTest):
                           confirmed=True
                           )
 
+    def test_changes_forget_subscribers(self):
+        cache = self.subscription_controller.driver.cache
+        with mock.patch.object(cache, 'delete') as delete:
+            s_id = self.subscription_controller.create(self.source,
+                                                       self.subscriber,
+                                                       self.ttl,
+                                                       self.options,
+                                                       project=self.project)
+            self.subscription_controller.update(self.source, s_id,
+                                                project=self.project,
+                                                ttl=self.ttl * 2)
+            self.subscription_controller.confirm(self.source, s_id,
+                                                 project=self.project,
+                                                 confirmed=True)
+            self.subscription_controller.delete(self.source, s_id,
+                                                project=self.project)
+
+        key = utils.subscribers_cache_key(self.source, self.project)
+        health_key = utils.subscription_health_cache_key(s_id)
+        self.assertEqual([mock.call(key)] * 4 + [mock.call(health_key)],
+                         delete.call_args_list)
+
 
 class PoolsControllerTest(ControllerBaseTest):
     """Pools Controller base tests.
@@ -1606,6 +1629,24 @@ class PoolsControllerTest(ControllerBaseTest):
     def test_delete_nonexistent_is_silent(self):
         self.pools_controller.delete('nonexisting')
 
+    def test_delete_migration_target(self):
+        catalogue_controller = self.driver.catalogue_controller
+        try:
+            catalogue_controller.migrations()
+        except NotImplementedError:
+            self.skipTest('The catalogue can not list the migrations')
+
+        self.addCleanup(catalogue_controller.drop_all)
+        self.pools_controller.update(self.pool1, flavor="")
+        catalogue_controller.insert('p', 'q', self.pool1)
+        catalogue_controller.migrate('p', 'q', self.pool1)
+        self.assertRaises(errors.PoolInUseByMigration,
+                          self.pools_controller.delete, self.pool1)
+
+        catalogue_controller.migrate('p', 'q', None)
+        self.pools_controller.delete(self.pool1)
+        self.assertFalse(self.pools_controller.exists(self.pool1))
+
     def test_drop_all_leads_to_empty_listing(self):
         self.pools_controller.drop_all()
         cursor = self.pools_controller.list()
@@ -1755,6 +1796,42 @@ class CatalogueControllerTest(ControllerBaseTest):
                 self._check_structure(e)
                 self._check_value(e, xqueue=q, xproject=p, xpool=s)
 
+    def test_list_all(self):
+        self.controller.insert(self.project, self.queue, self.pool)
+        self.controller.insert('other', self.queue, self.pool1)
+        try:
+            entries = list(self.controller.list_all())
+        except NotImplementedError:
+            self.skipTest('The catalogue entries can only be listed by '
+                          'project')
+
+        self.assertEqual(2, len(entries))
+        for entry in entries:
+            self._check_structure(entry)
+        self.assertEqual({self.project, 'other'},
+                         {entry['project'] for entry in entries})
+        self.assertEqual(1, len(list(self.controller.list_all(limit=1))))
+
+    def test_migrations(self):
+        self.controller.insert(self.project, self.queue, self.pool)
+        self.controller.insert(self.project, 'other', self.pool)
+        self.controller.migrate(self.project, self.queue, self.pool1)
+        try:
+            entries = list(self.controller.migrations())
+        except NotImplementedError:
+            self.skipTest('The catalogue can not list the migrations')
+
+        self.assertEqual(1, len(entries))
+        self._check_value(entries[0], xqueue=self.queue,
+                          xproject=self.project, xpool=self.pool)
+        self.assertEqual(self.pool1, entries[0]['migrating_to'])
+        self.assertEqual(1, len(list(self.controller.migrations(
+            self.pool1))))
+        self.assertEqual([], list(self.controller.migrations(self.pool)))
+
+        self.controller.migrate(self.project, self.queue, None)
+        self.assertEqual([], list(self.controller.migrations()))
+
     def test_update(self):
         p2 = 'b'
         # NOTE(gengchc2): Remove [group=self.pool_group] in
@@ -1776,6 +1853,77 @@ class CatalogueControllerTest(ControllerBaseTest):
                               'p', 'q', 'a')
         self.assertIn('queue q for project p', str(e))
 
+    def test_migrate(self):
+        p2 = 'b'
+        self.pool_ctrl.create(p2, 100, '127.0.0.1',
+                              options={})
+        self.addCleanup(self.pool_ctrl.delete, p2)
+
+        with helpers.pool_entry(self.controller, self.project,
+                                self.queue, self.pool) as expect:
+            p, q, s = expect
+            self.assertIsNone(self.controller.get(p, q)['migrating_to'])
+
+            self.controller.migrate(p, q, pool=p2)
+            entry = self.controller.get(p, q)
+            self._check_value(entry, xqueue=q, xproject=p, xpool=s)
+            self.assertEqual(p2, entry['migrating_to'])
+
+            self.controller.migrate(p, q)
+            self.assertIsNone(self.controller.get(p, q)['migrating_to'])
+
+            # NOTE: Updating the pool ends the migration.
+            self.controller.migrate(p, q, pool=p2)
+            self.controller.update(p, q, pool=p2)
+            entry = self.controller.get(p, q)
+            self._check_value(entry, xqueue=q, xproject=p, xpool=p2)
+            self.assertIsNone(entry['migrating_to'])
+
+    def test_upsert(self):
+        p2 = 'b'
+        self.pool_ctrl.create(p2, 100, '127.0.0.1',
+                              options={})
+        self.addCleanup(self.pool_ctrl.delete, p2)
+
+        self.assertEqual(self.pool, self.controller.upsert(
+            self.project, self.queue, self.pool, keep=[self.pool]))
+        self.addCleanup(self.controller.delete, self.project, self.queue)
+        entry = self.controller.get(self.project, self.queue)
+        self._check_value(entry, xqueue=self.queue, xproject=self.project,
+                          xpool=self.pool)
+
+        # NOTE: The queue stays in a pool it may be kept in.
+        self.assertEqual(self.pool, self.controller.upsert(
+            self.project, self.queue, self.pool1,
+            keep=[self.pool, self.pool1]))
+        entry = self.controller.get(self.project, self.queue)
+        self.assertEqual(self.pool, entry['pool'])
+
+        self.controller.migrate(self.project, self.queue, pool=self.pool1)
+        self.assertEqual(p2, self.controller.upsert(
+            self.project, self.queue, p2, keep=[p2]))
+        entry = self.controller.get(self.project, self.queue)
+        self.assertEqual(p2, entry['pool'])
+        self.assertIsNone(entry['migrating_to'])
+
+    def test_count(self):
+        try:
+            self.assertEqual(0, self.controller.count(self.pool))
+        except NotImplementedError:
+            self.skipTest('The catalogue does not count queues.')
+
+        with helpers.pool_entry(self.controller, self.project,
+                                self.queue, self.pool):
+            self.controller.insert(self.project, 'other', self.pool1)
+            self.addCleanup(self.controller.delete, self.project, 'other')
+            self.assertEqual(1, self.controller.count(self.pool))
+            self.assertEqual(1, self.controller.count(self.pool1))
+
+    def test_migrate_raises_when_entry_does_not_exist(self):
+        self.assertRaises(errors.QueueNotMapped,
+                          self.controller.migrate,
+                          'p', 'q', 'a')
+
     def test_get(self):
         with helpers.pool_entry(self.controller,
                                 self.project,
@@ -1813,6 +1961,28 @@ class CatalogueControllerTest(ControllerBaseTest):
         self.controller.insert(self.project, q1, 'a')
         self.controller.insert(self.project, q2, 'a')
 
+    def test_changes(self):
+        version, changed = self.controller.changes()
+        self.assertIsNone(changed)
+
+        self.controller.insert(self.project, self.queue, self.pool)
+        new_version, changed = self.controller.changes(version)
+        self.assertGreater(new_version, version)
+        self.assertEqual([(self.project, self.queue)], changed)
+
+        self.controller.update(self.project, self.queue, pool=self.pool1)
+        self.controller.delete(self.project, self.queue)
+        version, changed = self.controller.changes(new_version)
+        self.assertEqual([(self.project, self.queue)] * 2, changed)
+
+        # NOTE: Nothing changed since the last version.
+        self.assertEqual((version, []), self.controller.changes(version))
+
+    def test_changes_unknown_version(self):
+        self.controller.insert(self.project, self.queue, self.pool)
+        version, changed = self.controller.changes(1000000)
+        self.assertIsNone(changed)
+
 
 # NOTE(gengchc2): Unittest for new flavor configure scenario.
 class FlavorsControllerTest1(ControllerBaseTest):
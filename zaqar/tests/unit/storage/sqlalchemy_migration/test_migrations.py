@@ -166,6 +166,20 @@ class ZaqarMigrationsCheckers:
         # currently, 005 is just a placeholder
         pass
 
+    def _check_008(self, engine, data):
+        changes_columns = [
+            'id',
+            'project',
+            'queue',
+        ]
+        self.assertColumnsExist(
+            engine, 'CatalogueChanges', changes_columns)
+        self.assertColumnCount(
+            engine, 'CatalogueChanges', changes_columns)
+
+    def _check_009(self, engine, data):
+        self.assertColumnExists(engine, 'Catalogue', 'migrating_to')
+
 
 class TestMigrationsMySQL(ZaqarMigrationsCheckers,
                           base.BaseWalkMigrationTestCase,
@@ -10,10 +10,19 @@
 # implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+from unittest import mock
+
+import fixtures
+import futurist
+from oslo_serialization import jsonutils
+import swiftclient
+
 from zaqar.common import cache as oslo_cache
+from zaqar.conf import drivers_message_store_swift
 from zaqar.storage import mongodb
 from zaqar.storage.swift import controllers
 from zaqar.storage.swift import driver
+from zaqar.storage.swift import utils
 from zaqar import tests as testing
 from zaqar.tests.unit.storage import base
 
@@ -55,3 +64,298 @@ class SwiftDriverTest(testing.TestBase):
                                          (self.conf, cache))
 
         self.assertTrue(swift_driver.is_alive())
+
+
+class SwiftClientWrapperTest(testing.TestBase):
+    config_file = 'wsgi_swift.conf'
+
+    def setUp(self):
+        super().setUp()
+        self.conf.register_opts(drivers_message_store_swift.ALL_OPTS,
+                                group=drivers_message_store_swift.GROUP_NAME)
+        self.swift_conf = self.conf[drivers_message_store_swift.GROUP_NAME]
+
+        self.session = mock.Mock()
+        self.session.get_token.return_value = 'token'
+        self.session.get_endpoint.return_value = 'http://swift'
+        self.useFixture(fixtures.MockPatch(
+            'keystoneauth1.session.Session', return_value=self.session))
+        self.connection = self.useFixture(fixtures.MockPatch(
+            'swiftclient.Connection',
+            side_effect=lambda **kwargs: mock.Mock())).mock
+        self.wrapper = driver._ClientWrapper(self.swift_conf)
+
+    def test_connection_is_reused(self):
+        self.wrapper.head_container('a')
+        self.wrapper.head_container('b')
+        self.wrapper.put_object('a', 'obj', 'content')
+        self.assertEqual(1, self.connection.call_count)
+        client = self.wrapper._idle[0][0]
+        self.assertEqual(2, client.head_container.call_count)
+        self.assertEqual('token', client.token)
+
+    def test_concurrent_calls_use_distinct_connections(self):
+        def nested(container):
+            # Simulates another thread calling while a connection is
+            # checked out.
+            self.wrapper.head_container(container)
+
+        with self.wrapper._client() as client:
+            client.get_container.side_effect = nested
+            client.get_container('a')
+        self.assertEqual(2, self.connection.call_count)
+        self.assertEqual(2, len(self.wrapper._idle))
+
+    def test_pool_size_bounds_idle_connections(self):
+        self.config(connection_pool_size=1,
+                    group=drivers_message_store_swift.GROUP_NAME)
+        with self.wrapper._client() as outer:
+            with self.wrapper._client() as inner:
+                pass
+        self.assertEqual(1, len(self.wrapper._idle))
+        self.assertIs(inner, self.wrapper._idle[0][0])
+        outer.close.assert_called_once_with()
+
+    def test_idle_connections_expire(self):
+        self.config(connection_idle_timeout=10,
+                    group=drivers_message_store_swift.GROUP_NAME)
+        with mock.patch.object(driver.time, 'monotonic', return_value=0):
+            self.wrapper.head_container('a')
+        stale = self.wrapper._idle[0][0]
+        with mock.patch.object(driver.time, 'monotonic', return_value=11):
+            self.wrapper.head_container('a')
+        stale.close.assert_called_once_with()
+        self.assertEqual(2, self.connection.call_count)
+
+    def test_broken_connection_is_not_reused(self):
+        client = None
+        try:
+            with self.wrapper._client() as client:
+                raise ValueError()
+        except ValueError:
+            pass
+        client.close.assert_called_once_with()
+        self.assertEqual(0, len(self.wrapper._idle))
+
+
+class SwiftOccupancyTest(testing.TestBase):
+
+    def test_only_messages_are_counted(self):
+        swift_driver = mock.Mock()
+        swift_driver.connection.get_account.return_value = ({}, [
+            {'name': 'zaqar_message:a:p', 'count': 3, 'bytes': 300},
+            {'name': 'zaqar_message:a:p:1', 'count': 2, 'bytes': 200},
+        ])
+        self.assertEqual({'messages': 5, 'size': 500, 'claimed': None,
+                          'delayed': None},
+                         driver.DataDriver.occupancy(swift_driver,
+                                                     detailed=True))
+        swift_driver.connection.get_account.assert_called_once_with(
+            prefix='zaqar_message:', full_listing=True)
+
+
+class SwiftUtilsTest(testing.TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.objects = {}
+        for i in range(6):
+            name = 'msg%d' % i
+            self.objects[name] = (
+                {'x-object-meta-clientid': 'client', 'x-timestamp': '0'},
+                jsonutils.dumps({'ttl': 60, 'body': i, 'claim_id': None}))
+        self.executor = futurist.ThreadPoolExecutor(max_workers=4)
+        self.addCleanup(self.executor.shutdown)
+
+    def _get_object(self, name):
+        if name not in self.objects:
+            raise swiftclient.ClientException('Not found', http_status=404)
+        return self.objects[name]
+
+    def _list_objects(self, marker=None):
+        names = sorted(n for n in self.objects if n > marker)
+        return [{'name': n} for n in names[:2]]
+
+    def _filter(self, listing, filters, limit, executor=None):
+        marker = {}
+        messages = list(utils._filter_messages(
+            listing, filters, marker, self._get_object,
+            self._list_objects, limit, executor=executor))
+        return [m['body'] for m in messages], marker
+
+    def test_filter_messages_keeps_listing_order(self):
+        listing = [{'name': 'msg%d' % i} for i in range(6)]
+        bodies, marker = self._filter(listing, [], 6, self.executor)
+        self.assertEqual(list(range(6)), bodies)
+        self.assertEqual('msg5', marker['next'])
+
+    def test_filter_messages_lists_more_pages(self):
+        listing = [{'name': 'msg0'}, {'name': 'msg1'}]
+
+        def is_odd(msg, headers):
+            return msg['body'] % 2
+
+        bodies, marker = self._filter(listing, [is_odd], 3, self.executor)
+        self.assertEqual([0, 2, 4], bodies)
+        self.assertEqual('msg4', marker['next'])
+
+    def test_filter_messages_skips_missing_objects(self):
+        listing = [{'name': 'msg0'}, {'name': 'gone'}, None,
+                   {'name': 'msg1'}]
+        del self.objects['msg2']
+        bodies, marker = self._filter(listing, [], 3)
+        self.assertEqual([0, 1, 3], bodies)
+
+    def test_bulk_delete_uses_middleware(self):
+        client = mock.Mock()
+        client.post_account.return_value = ({}, jsonutils.dump_as_bytes(
+            {'Response Status': '200 OK', 'Errors': []}))
+        names = ['msg%d' % i for i in range(5)]
+        utils._bulk_delete(client, 'c', names, max_deletes=2)
+        self.assertEqual(3, client.post_account.call_count)
+        data = client.post_account.call_args_list[0][1]['data']
+        self.assertEqual(b'/c/msg0\n/c/msg1', data)
+        self.assertFalse(client.delete_object.called)
+
+    def test_bulk_delete_falls_back_without_middleware(self):
+        client = mock.Mock()
+        client.post_account.return_value = ({}, b'')
+        client.delete_object.side_effect = [
+            None, swiftclient.ClientException('Not found', http_status=404)]
+        utils._bulk_delete(client, 'c', ['msg0', 'msg1'], max_deletes=10,
+                           executor=self.executor)
+        self.assertEqual(1, client.post_account.call_count)
+        self.assertEqual(2, client.delete_object.call_count)
+
+    def test_bulk_delete_raises_on_failure(self):
+        client = mock.Mock()
+        client.post_account.return_value = ({}, jsonutils.dump_as_bytes(
+            {'Response Status': '502 Bad Gateway',
+             'Errors': [['/c/msg0', '503 Service Unavailable']]}))
+        exc = self.assertRaises(swiftclient.ClientException,
+                                utils._bulk_delete, client, 'c', ['msg0'],
+                                max_deletes=10)
+        self.assertEqual(502, exc.http_status)
+
+    def test_message_object_container(self):
+        self.assertEqual(
+            'zaqar_message:q:p',
+            utils._message_object_container('q', 'p', 'msg0'))
+        containers = utils._message_containers('q', 'p', 4)
+        self.assertEqual('zaqar_message:q:p', containers[0])
+        self.assertEqual('zaqar_message:q:p:3', containers[3])
+        used = {utils._message_object_container('q', 'p', name, 4)
+                for name in ('msg%d' % i for i in range(20))}
+        self.assertTrue(used.issubset(containers))
+        self.assertGreater(len(used), 1)
+
+    def _claims_client(self, claims, messages):
+        """Fake a client holding claim objects and message claim IDs.
+
+        A claim mapped to None is listed but expired, a message mapped to
+        None doesn't exist anymore.
+        """
+        client = mock.Mock()
+
+        def get_container(container, full_listing=False):
+            # NOTE: A single page holds a claim at most, unless every
+            # page is asked for.
+            listing = [{'name': name} for name in claims]
+            return {}, listing if full_listing else listing[:1]
+
+        client.get_container.side_effect = get_container
+
+        def get_object(container, name):
+            self.assertEqual(utils._claim_container('q', 'p'), container)
+            if claims[name] is None:
+                raise swiftclient.ClientException('Not found',
+                                                  http_status=404)
+            return {}, jsonutils.dumps(claims[name])
+
+        def head_object(container, name):
+            self.assertEqual(
+                utils._message_object_container('q', 'p', name, 4),
+                container)
+            if messages.get(name, '') is None:
+                raise swiftclient.ClientException('Not found',
+                                                  http_status=404)
+            headers = {}
+            if messages.get(name):
+                headers['x-object-meta-claimid'] = messages[name]
+            return headers
+
+        client.get_object.side_effect = get_object
+        client.head_object.side_effect = head_object
+        return client
+
+    def _claimed_count(self, client):
+        return utils._claimed_count(client, 'q', 'p', 4, self.executor)
+
+    def test_claimed_count_without_claims(self):
+        client = mock.Mock()
+        client.get_container.side_effect = swiftclient.ClientException(
+            'Not found', http_status=404)
+        self.assertEqual(0, self._claimed_count(client))
+
+    def test_claimed_count_claim(self):
+        client = self._claims_client({'c1': ['m0', 'm1'], 'c2': ['m2']},
+                                     {'m0': 'c1', 'm1': 'c1', 'm2': 'c2',
+                                      'm3': ''})
+        self.assertEqual(3, self._claimed_count(client))
+
+    def test_claimed_count_delete(self):
+        client = self._claims_client({'c1': ['m0', 'm1']},
+                                     {'m0': 'c1', 'm1': None})
+        self.assertEqual(1, self._claimed_count(client))
+
+    def test_claimed_count_release(self):
+        # NOTE: Messages are released before their claim object is
+        # deleted.
+        client = self._claims_client({'c1': ['m0', 'm1']},
+                                     {'m0': '', 'm1': 'c1'})
+        self.assertEqual(1, self._claimed_count(client))
+
+    def test_claimed_count_expiry(self):
+        # NOTE: c1 expired but isn't reaped yet, m0 was claimed again by
+        # c2 while m1 expired with its claim.
+        client = self._claims_client({'c1': None, 'c2': ['m0', 'm2'],
+                                      'c3': ['m3']},
+                                     {'m0': 'c2', 'm1': 'c1', 'm2': 'c2',
+                                      'm3': None})
+        self.assertEqual(2, self._claimed_count(client))
+
+    def test_claimed_count_reclaimed(self):
+        # NOTE: The claim objects of c1 and c2 both list m0, it only holds
+        # one of them.
+        for claim_id in ('c1', 'c2'):
+            client = self._claims_client({'c1': ['m0'], 'c2': ['m0']},
+                                         {'m0': claim_id})
+            self.assertEqual(1, self._claimed_count(client))
+
+    def test_list_containers_merges_listings(self):
+        listings = {
+            'c0': [{'name': 'a'}, {'name': 'd'}],
+            'c1': [{'name': 'b'}, {'name': 'c'}, {'name': 'e'}],
+        }
+        client = mock.Mock()
+
+        def get_container(container, marker=None, limit=None,
+                          query_string=None):
+            if container not in listings:
+                raise swiftclient.ClientException('Not found',
+                                                  http_status=404)
+            objects = listings[container]
+            if query_string == 'reverse=on':
+                objects = objects[::-1]
+            return {}, objects[:limit]
+
+        client.get_container.side_effect = get_container
+        names = [o['name'] for o in utils._list_containers(
+            client, ['c0', 'c1', 'c2'], limit=4, executor=self.executor)]
+        self.assertEqual(['a', 'b', 'c', 'd'], names)
+        names = [o['name'] for o in utils._list_containers(
+            client, ['c0', 'c1'], limit=2, query_string='reverse=on')]
+        self.assertEqual(['e', 'd'], names)
+        self.assertRaises(swiftclient.ClientException,
+                          utils._list_containers, client, ['c2', 'c0'],
+                          limit=2)
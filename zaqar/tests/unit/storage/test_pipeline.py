@@ -0,0 +1,61 @@
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or
+# implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from unittest import mock
+
+from zaqar.conf import storage
+from zaqar.storage import pipeline
+from zaqar import tests as testing
+
+
+class Stage:
+
+    def post(self, *args, **kwargs):
+        return None
+
+
+class StageTimingsTest(testing.TestBase):
+
+    def test_calls_are_recorded(self):
+        timings = pipeline.StageTimings()
+        timings(Stage(), 'post', 0.5)
+        timings(Stage(), 'post', 1.5)
+        timings(Stage(), 'get', 0.1)
+        self.assertEqual({'Stage': {
+            'post': {'count': 2, 'total': 2.0, 'max': 1.5},
+            'get': {'count': 1, 'total': 0.1, 'max': 0.1}}},
+            timings.stats())
+
+    @mock.patch.object(pipeline, 'LOG')
+    def test_slow_calls_are_logged(self, log):
+        timings = pipeline.StageTimings(threshold=1)
+        timings(Stage(), 'post', 0.5)
+        self.assertFalse(log.warning.called)
+        timings(Stage(), 'post', 1.5)
+        self.assertEqual(1, log.warning.call_count)
+
+        pipeline.StageTimings()(Stage(), 'post', 1000)
+        self.assertEqual(1, log.warning.call_count)
+
+    def test_health_reports_the_timings(self):
+        storage.register_opts(self.conf)
+        self.config(storage.GROUP_NAME, message_pipeline=[])
+        driver = mock.Mock()
+        driver._health.return_value = {'storage_reachable': True}
+        driver.message_controller = Stage()
+        data_driver = pipeline.DataDriver(self.conf, driver, mock.Mock())
+
+        data_driver.message_controller.post('q', [])
+        health = data_driver._health()
+        self.assertTrue(health['storage_reachable'])
+        self.assertEqual(1, health['stages']['Stage']['post']['count'])
@@ -12,12 +12,22 @@
 # License for the specific language governing permissions and limitations under
 # the License.
 
+import threading
+import time
 from unittest import mock
 import uuid
 
+import futurist
+
 from zaqar.common import cache as oslo_cache
+from zaqar.common.storage import select
+from zaqar.conf import drivers_message_store_redis
+from zaqar.conf import pooling_catalog
+from zaqar.conf import storage
+from zaqar.notification import notifier
 from zaqar.storage import errors
 from zaqar.storage import mongodb
+from zaqar.storage import pipeline
 from zaqar.storage import pooling
 from zaqar.storage import utils
 from zaqar import tests as testing
@@ -127,3 +137,901 @@ class PoolCatalogTest(testing.TestBase):
                                     project=self.project)
             register.assert_called_with(self.queue, project=self.project,
                                         flavor=None)
+
+
+class CatalogueSnapshotTest(testing.TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.catalogue_ctrl = mock.Mock()
+        self.catalogue_ctrl.changes.return_value = (1, None)
+        self.catalogue_ctrl.get.side_effect = (
+            lambda project, queue: {'pool': 'pool-' + queue})
+        self.snapshot = pooling.CatalogueSnapshot(self.catalogue_ctrl,
+                                                  refresh_interval=0,
+                                                  max_size=2)
+
+    def test_lookups_are_served_from_memory(self):
+        self.catalogue_ctrl.changes.return_value = (1, [])
+        self.assertEqual('pool-q', self.snapshot.pool_id('q', 'p'))
+        self.assertEqual('pool-q', self.snapshot.pool_id('q', 'p'))
+        self.assertEqual(1, self.catalogue_ctrl.get.call_count)
+        self.catalogue_ctrl.changes.assert_called_with(1)
+
+    def test_changes_invalidate_entries(self):
+        self.catalogue_ctrl.changes.return_value = (1, [])
+        self.snapshot.pool_id('q1', 'p')
+        self.snapshot.pool_id('q2', 'p')
+        self.catalogue_ctrl.changes.return_value = (2, [('p', 'q1')])
+        self.snapshot.refresh()
+        self.assertEqual(1, len(self.snapshot))
+        self.snapshot.pool_id('q2', 'p')
+        self.assertEqual(2, self.catalogue_ctrl.get.call_count)
+
+    def test_unknown_changes_drop_snapshot(self):
+        self.catalogue_ctrl.changes.return_value = (1, [])
+        self.snapshot.pool_id('q', 'p')
+        self.catalogue_ctrl.changes.return_value = (5, None)
+        self.snapshot.refresh()
+        self.assertEqual(1, len(self.snapshot))
+        self.snapshot.refresh()
+        self.assertEqual(0, len(self.snapshot))
+
+        self.snapshot.pool_id('q', 'p')
+        self.catalogue_ctrl.changes.side_effect = Exception('boom')
+        self.snapshot.refresh()
+        self.assertEqual(0, len(self.snapshot))
+
+    def test_holes_are_polled_again(self):
+        self.catalogue_ctrl.changes.return_value = (1, [])
+        self.snapshot.pool_id('q1', 'p')
+        self.snapshot.pool_id('q2', 'p')
+        self.catalogue_ctrl.changes.return_value = (3, None)
+        self.snapshot.refresh()
+        self.assertEqual(2, len(self.snapshot))
+
+        # NOTE: The change missing from the journal showed up meanwhile.
+        self.catalogue_ctrl.changes.return_value = (3, [('p', 'q1')])
+        self.snapshot.refresh()
+        self.catalogue_ctrl.changes.assert_called_with(1)
+        self.assertEqual(1, len(self.snapshot))
+
+    def test_warm(self):
+        self.catalogue_ctrl.list_all.return_value = [
+            {'project': 'p', 'queue': 'q', 'pool': 'a'}]
+        self.snapshot.warm()
+        self.catalogue_ctrl.list_all.assert_called_once_with(limit=2)
+        self.assertEqual('a', self.snapshot.pool_id('q', 'p'))
+        self.assertFalse(self.catalogue_ctrl.get.called)
+
+    def test_warm_stops_on_invalidation(self):
+        def list_all(limit):
+            yield {'project': 'p', 'queue': 'q1', 'pool': 'a'}
+            self.snapshot.forget('q1', 'p')
+            yield {'project': 'p', 'queue': 'q2', 'pool': 'a'}
+
+        self.catalogue_ctrl.list_all.side_effect = list_all
+        self.snapshot.warm()
+        self.assertEqual(0, len(self.snapshot))
+
+    def test_not_mapped_is_not_cached(self):
+        self.catalogue_ctrl.changes.return_value = (1, [])
+        self.catalogue_ctrl.get.side_effect = errors.QueueNotMapped('q', 'p')
+        self.assertRaises(errors.QueueNotMapped,
+                          self.snapshot.pool_id, 'q', 'p')
+        self.assertEqual(0, len(self.snapshot))
+
+    def test_not_mapped_is_remembered(self):
+        self.catalogue_ctrl.changes.return_value = (1, [])
+        self.catalogue_ctrl.get.side_effect = errors.QueueNotMapped('q', 'p')
+        snapshot = pooling.CatalogueSnapshot(self.catalogue_ctrl,
+                                             refresh_interval=0,
+                                             max_size=2, unmapped_ttl=60)
+        for i in range(2):
+            self.assertRaises(errors.QueueNotMapped,
+                              snapshot.pool_id, 'q', 'p')
+        self.assertEqual(1, self.catalogue_ctrl.get.call_count)
+
+        # NOTE: Registering the queue makes it known right away.
+        self.catalogue_ctrl.get.side_effect = None
+        self.catalogue_ctrl.get.return_value = {'pool': 'a'}
+        self.catalogue_ctrl.changes.return_value = (2, [('p', 'q')])
+        self.assertEqual('a', snapshot.pool_id('q', 'p'))
+
+    def test_size_is_bounded(self):
+        self.catalogue_ctrl.changes.return_value = (1, [])
+        for queue in ('q1', 'q2', 'q3'):
+            self.snapshot.pool_id(queue, 'p')
+        self.assertEqual(2, len(self.snapshot))
+
+    def test_refresh_interval(self):
+        self.catalogue_ctrl.changes.reset_mock()
+        snapshot = pooling.CatalogueSnapshot(self.catalogue_ctrl,
+                                             refresh_interval=3600,
+                                             max_size=2)
+        snapshot.pool_id('q', 'p')
+        snapshot.pool_id('q', 'p')
+        # NOTE: Only the initial version was read.
+        self.assertEqual(1, self.catalogue_ctrl.changes.call_count)
+        snapshot.forget('q', 'p')
+        self.assertEqual(0, len(snapshot))
+
+
+class PoolHealthTest(testing.TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.health = pooling.PoolHealth(failure_threshold=2,
+                                         reset_timeout=3600,
+                                         latency_target=0.1)
+
+    def test_unknown_pool_is_healthy(self):
+        self.assertFalse(self.health.is_open('pool'))
+        self.assertEqual(1.0, self.health.headroom('pool'))
+
+    def test_consecutive_failures_open_the_circuit(self):
+        self.health.record('pool', 0.01, False)
+        self.health.record('pool', 0.01, True)
+        self.health.record('pool', 0.01, False)
+        self.assertFalse(self.health.is_open('pool'))
+        self.health.record('pool', 0.01, False)
+        self.assertTrue(self.health.is_open('pool'))
+        self.assertLess(self.health.headroom('pool'), 1.0)
+
+        self.health.record('pool', 0.01, True)
+        self.assertFalse(self.health.is_open('pool'))
+
+    def test_circuit_is_tried_again_after_reset_timeout(self):
+        health = pooling.PoolHealth(failure_threshold=1, reset_timeout=0,
+                                    latency_target=0.1)
+        health.record('pool', 0.01, False)
+        self.assertFalse(health.is_open('pool'))
+
+    def test_slow_pool_has_less_headroom(self):
+        for i in range(50):
+            self.health.record('slow', 1.0, True)
+            self.health.record('fast', 0.01, True)
+        self.assertAlmostEqual(1.0, self.health.headroom('fast'))
+        self.assertAlmostEqual(0.1, self.health.headroom('slow'), places=2)
+
+    def test_probe(self):
+        driver = mock.Mock()
+        driver.is_alive.return_value = False
+        self.health.probe('pool', driver)
+        self.assertFalse(self.health.is_open('pool'))
+
+        driver.is_alive.side_effect = Exception('boom')
+        self.health.probe('pool', driver)
+        self.assertTrue(self.health.is_open('pool'))
+
+    def test_tracked_controller(self):
+        controller = mock.Mock()
+        controller.get.side_effect = errors.QueueDoesNotExist('q', 'p')
+        controller.post.side_effect = errors.ConnectionError()
+        tracked = pooling._TrackedController(controller, 'pool',
+                                             self.health)
+
+        tracked.list('q')
+        self.assertRaises(errors.QueueDoesNotExist, tracked.get, 'q')
+        self.assertFalse(self.health.is_open('pool'))
+        self.assertRaises(errors.ConnectionError, tracked.post, 'q')
+        self.assertRaises(errors.ConnectionError, tracked.post, 'q')
+        self.assertTrue(self.health.is_open('pool'))
+
+    def test_tracked_iterators(self):
+        def pages():
+            yield ['q1']
+            raise errors.ConnectionError()
+
+        controller = mock.Mock()
+        controller.list.side_effect = lambda *args: pages()
+        tracked = pooling._TrackedController(controller, 'pool',
+                                             self.health)
+
+        # NOTE: Nothing is recorded until the iterator is consumed.
+        listing = tracked.list()
+        listing = tracked.list()
+        self.assertNotIn('pool', self.health._stats)
+
+        self.assertEqual(['q1'], next(listing))
+        self.assertEqual(1.0, self.health._stats['pool'].success_rate)
+        self.assertRaises(errors.ConnectionError, next, listing)
+        self.assertEqual(1, self.health._stats['pool'].failures)
+        listing = tracked.list()
+        next(listing)
+        self.assertRaises(errors.ConnectionError, next, listing)
+        self.assertFalse(self.health.is_open('pool'))
+
+        controller.list.side_effect = lambda *args: iter(())
+        self.assertRaises(StopIteration, next, tracked.list())
+        self.assertEqual(0, self.health._stats['pool'].failures)
+
+
+class CatalogSelectPoolTest(testing.TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.catalog = pooling.Catalog(self.conf, None, mock.Mock())
+        self.catalog.get_driver = mock.Mock()
+        self.addCleanup(self.catalog.close)
+        self.pools = [{'name': 'down', 'weight': 100},
+                      {'name': 'up', 'weight': 1}]
+
+    def test_pools_down_are_not_selected(self):
+        for i in range(5):
+            self.catalog._health.record('down', 0.01, False)
+        for i in range(10):
+            self.assertEqual('up', self.catalog._select_pool(self.pools))
+
+    def test_pools_are_selected_if_all_down(self):
+        for pool in self.pools:
+            for i in range(5):
+                self.catalog._health.record(pool['name'], 0.01, False)
+        self.assertIsNotNone(self.catalog._select_pool(self.pools))
+
+    def test_pools_are_not_probed_when_placing(self):
+        prober = mock.Mock()
+        self.catalog._lazy__prober = prober
+        self.catalog._select_pool(self.pools)
+        prober.start.assert_called_once_with()
+        self.assertFalse(self.catalog.get_driver.called)
+
+    def test_pools_with_a_driver_are_probed(self):
+        self.catalog._pools_ctrl.list.return_value = iter(
+            [[{'name': 'down'}, {'name': 'up'}]])
+        driver = mock.Mock()
+        driver.is_alive.side_effect = Exception('boom')
+        self.catalog._drivers = pooling.PoolDrivers(
+            lambda pool_id, *args: driver, 10, 0)
+        self.catalog._drivers.get('down')
+
+        for i in range(5):
+            self.catalog._prober.refresh()
+            self.catalog._pools_ctrl.list.return_value = iter(
+                [[{'name': 'down'}, {'name': 'up'}]])
+        self.assertEqual(5, driver.is_alive.call_count)
+        self.assertTrue(self.catalog._health.is_open('down'))
+        self.assertFalse(self.catalog._health.is_open('up'))
+        self.assertIsNone(self.catalog._drivers.peek('up'))
+
+    def test_selector_is_configurable(self):
+        self.assertIs(select.static_weighted, self.catalog._selector)
+        self.config(pooling_catalog.GROUP_NAME,
+                    pool_selector='health_weighted')
+        del self.catalog._lazy__selector
+        self.assertIs(select.health_weighted, self.catalog._selector)
+
+    def test_least_loaded_pool_is_selected(self):
+        self.config(pooling_catalog.GROUP_NAME, pool_selector='least_loaded')
+        occupancy = pooling.PoolOccupancy(
+            lambda: {'down': (10, 1000), 'up': (0, 0)}, 60)
+        occupancy.refresh()
+        self.catalog._lazy__occupancy = occupancy
+        self.assertEqual('up', self.catalog._select_pool(self.pools))
+
+
+class PoolOccupancyTest(testing.TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.sample = mock.Mock(return_value={'a': (1, 300), 'b': (3, 0)})
+        self.occupancy = pooling.PoolOccupancy(self.sample, 60)
+        self.occupancy.refresh()
+
+    def test_load(self):
+        self.assertEqual(0.25 + 1.0, self.occupancy.load('a'))
+        self.assertEqual(0.75, self.occupancy.load('b'))
+        self.assertEqual(0.0, self.occupancy.load('unknown'))
+
+    def test_partial_counts_are_ignored(self):
+        self.sample.return_value = {'a': (1, 300), 'b': (3, None),
+                                    'c': (None, 100)}
+        self.occupancy.refresh()
+        self.assertEqual(0.0, self.occupancy.load('a'))
+        self.assertEqual(0.0, self.occupancy.load('b'))
+
+        self.sample.return_value = {'a': (1, 300), 'b': (3, None)}
+        self.occupancy.refresh()
+        self.assertEqual(0.25, self.occupancy.load('a'))
+        self.assertEqual(0.75, self.occupancy.load('b'))
+
+    def test_placed_queues_are_counted(self):
+        self.occupancy.placed('a')
+        self.assertEqual(0.4 + 1.0, self.occupancy.load('a'))
+        self.assertEqual(0.6, self.occupancy.load('b'))
+
+    def test_new_pools_are_seeded(self):
+        self.occupancy.placed('new')
+        self.assertEqual(0.2, self.occupancy.load('new'))
+        self.assertEqual(0.2 + 1.0, self.occupancy.load('a'))
+
+        for _ in range(3):
+            self.occupancy.placed('new')
+        self.assertEqual(0.5, self.occupancy.load('new'))
+
+    def test_failed_sample_keeps_the_previous_one(self):
+        self.sample.side_effect = Exception('boom')
+        self.occupancy.refresh()
+        self.assertEqual(0.75, self.occupancy.load('b'))
+
+    def test_background_sampling(self):
+        sampled = threading.Event()
+        self.sample.side_effect = lambda: sampled.set() or {}
+        occupancy = pooling.PoolOccupancy(self.sample, 60)
+        occupancy.start()
+        self.addCleanup(occupancy.stop)
+        self.assertTrue(sampled.wait(5))
+
+    def test_catalog_sample(self):
+        control = mock.Mock()
+        control.pools_controller.list.return_value = iter(
+            [[{'name': 'a'}, {'name': 'b'}, {'name': 'c'}]])
+        control.catalogue_controller.count.side_effect = [
+            2, NotImplementedError, 1]
+        catalog = pooling.Catalog(self.conf, None, control)
+        catalog.get_driver = mock.Mock()
+        drivers = {'a': mock.Mock(), 'b': mock.Mock()}
+        drivers['a'].occupancy.return_value = {'messages': 10}
+        drivers['b'].occupancy.side_effect = errors.ConnectionError()
+        catalog._drivers.peek = drivers.get
+        self.assertEqual({'a': (2, 10), 'b': (None, None), 'c': (1, None)},
+                         catalog._sample_occupancy())
+        self.assertFalse(catalog.get_driver.called)
+
+
+class CatalogRegisterTest(testing.TestBase):
+
+    def setUp(self):
+        super().setUp()
+        oslo_cache.register_config(self.conf)
+        self.config('cache', backend='dogpile.cache.memory', enabled=True)
+        self.cache = oslo_cache.get_cache(self.conf)
+        self.control = mock.Mock()
+        self.control.pools_controller.get_pools_by_flavor.return_value = [
+            {'name': 'a', 'weight': 100, 'flavor': 'gold'}]
+        self.control.flavors_controller.get.return_value = {'name': 'gold'}
+        self.catalogue_ctrl = self.control.catalogue_controller
+        self.catalogue_ctrl.upsert.return_value = 'a'
+        self.catalogue_ctrl.changes.return_value = (1, [])
+        self.catalogue_ctrl.list_all.return_value = []
+        self.catalogue_ctrl.get.side_effect = errors.QueueNotMapped('q', 'p')
+        self.catalog = pooling.Catalog(self.conf, self.cache, self.control)
+        self.catalog.get_driver = mock.Mock()
+        self.addCleanup(self.catalog.close)
+
+    def test_register_upserts(self):
+        self.catalog.register('q', project='p', flavor='gold')
+        self.catalogue_ctrl.upsert.assert_called_once_with('p', 'q', 'a',
+                                                           keep=['a'])
+        self.catalogue_ctrl.exists.assert_not_called()
+        self.catalogue_ctrl.insert.assert_not_called()
+
+    def test_placed_queues_are_counted_once(self):
+        occupancy = pooling.PoolOccupancy(lambda: {'a': (0, 0)}, 60)
+        occupancy.refresh()
+        self.catalog._lazy__occupancy = occupancy
+
+        self.catalog.register('q', project='p', flavor='gold')
+        self.assertEqual(1, occupancy._counts['a'][0])
+
+        # NOTE: Registering the queue again leaves it in its pool.
+        self.catalogue_ctrl.get.side_effect = None
+        self.catalogue_ctrl.get.return_value = {'pool': 'a'}
+        self.catalog.register('q', project='p', flavor='gold')
+        self.catalog.register('q', project='p', flavor='gold')
+        self.assertEqual(1, occupancy._counts['a'][0])
+
+    def test_flavor_pools_are_cached(self):
+        for queue in ('q1', 'q2', 'q3'):
+            self.catalog.register(queue, project='p', flavor='gold')
+
+        pools_ctrl = self.control.pools_controller
+        self.assertEqual(1, pools_ctrl.get_pools_by_flavor.call_count)
+        self.assertEqual(1, self.control.flavors_controller.get.call_count)
+
+        # NOTE: Pools and flavors controllers drop the entries when
+        # they change.
+        self.cache.delete(utils.flavor_pools_cache_key('gold'))
+        self.cache.delete(utils.flavor_cache_key('gold', 'p'))
+        self.catalog.register('q4', project='p', flavor='gold')
+        self.assertEqual(2, pools_ctrl.get_pools_by_flavor.call_count)
+        self.assertEqual(2, self.control.flavors_controller.get.call_count)
+
+    def test_unknown_flavor_is_not_cached(self):
+        self.control.flavors_controller.get.side_effect = (
+            errors.FlavorDoesNotExist('gold'))
+        for i in range(2):
+            self.assertRaises(errors.FlavorDoesNotExist,
+                              self.catalog.register, 'q', 'p', 'gold')
+        self.assertEqual(2, self.control.flavors_controller.get.call_count)
+
+    def test_pools_of_other_flavors_are_not_kept(self):
+        self.control.pools_controller.get_pools_by_flavor.return_value = [
+            {'name': 'a', 'weight': 100, 'flavor': None},
+            {'name': 'b', 'weight': 100, 'flavor': 'gold'}]
+        self.catalog.register('q', project='p')
+        args, kwargs = self.catalogue_ctrl.upsert.call_args
+        self.assertEqual(['a'], kwargs['keep'])
+
+    def test_no_pool_found(self):
+        self.control.pools_controller.get_pools_by_flavor.return_value = []
+        self.assertRaises(errors.NoPoolFound,
+                          self.catalog.register, 'q', 'p')
+        self.catalogue_ctrl.upsert.assert_not_called()
+
+    def test_flavor_without_pools(self):
+        self.control.pools_controller.get_pools_by_flavor.return_value = []
+        self.catalogue_ctrl.upsert.return_value = None
+        self.catalog.register('q', project='p', flavor='gold')
+        self.catalogue_ctrl.upsert.assert_called_once_with('p', 'q', None,
+                                                           keep=[])
+
+
+class CatalogLookupTest(testing.TestBase):
+
+    def setUp(self):
+        super().setUp()
+        oslo_cache.register_config(self.conf)
+        self.config('cache', backend='dogpile.cache.memory', enabled=True)
+        self.control = mock.Mock()
+        self.catalogue_ctrl = self.control.catalogue_controller
+        self.catalogue_ctrl.get.side_effect = errors.QueueNotMapped('q', 'p')
+        self.catalog = pooling.Catalog(self.conf,
+                                       oslo_cache.get_cache(self.conf),
+                                       self.control)
+        self.config(pooling_catalog.GROUP_NAME, catalogue_snapshot=False)
+
+    def test_not_mapped_is_cached(self):
+        for i in range(3):
+            self.assertIsNone(self.catalog.lookup('q', 'p'))
+        self.assertEqual(1, self.catalogue_ctrl.get.call_count)
+
+        self.catalogue_ctrl.get.side_effect = None
+        self.catalogue_ctrl.get.return_value = {'pool': 'a'}
+        self.catalog._forget('q', 'p')
+        self.assertEqual('a', self.catalog._pool_id('q', 'p'))
+
+    def test_not_mapped_cache_can_be_disabled(self):
+        self.config(pooling_catalog.GROUP_NAME, unmapped_queue_cache_ttl=0)
+        for i in range(3):
+            self.assertIsNone(self.catalog.lookup('q', 'p'))
+        self.assertEqual(3, self.catalogue_ctrl.get.call_count)
+
+    @mock.patch.object(utils, 'load_storage_driver')
+    def test_virtual_pool_is_loaded_once(self, load_storage_driver):
+        drivers_message_store_redis.register_opts(self.conf)
+        self.config('drivers', message_store='redis')
+        self.config(pooling_catalog.GROUP_NAME, enable_virtual_pool=True)
+        self.catalog.get_driver = mock.Mock()
+        for i in range(3):
+            self.catalog.get_default_pool(use_listing=False)
+        self.assertEqual(1, load_storage_driver.call_count)
+        self.catalog.get_driver.assert_called_with(
+            None, {'uri': self.conf['drivers:message_store:redis'].uri,
+                   'options': {}})
+        self.assertEqual(3, self.catalog.get_driver.call_count)
+
+        # NOTE: Changing the message store settings reloads it.
+        self.config('drivers:message_store:redis', uri='redis://other')
+        self.catalog.get_default_pool(use_listing=False)
+        self.assertEqual(2, load_storage_driver.call_count)
+
+
+class PoolStatsControllerTest(testing.TestBase):
+
+    def setUp(self):
+        super().setUp()
+        oslo_cache.register_config(self.conf)
+        self.config('cache', backend='dogpile.cache.memory', enabled=True)
+        self.control = mock.Mock()
+        self.control.catalogue_controller.count.return_value = 3
+        self.catalog = pooling.Catalog(self.conf,
+                                       oslo_cache.get_cache(self.conf),
+                                       self.control)
+        self.catalog.get_driver = mock.Mock()
+        self.occupancy = self.catalog.get_driver.return_value.occupancy
+        self.occupancy.return_value = {'messages': 10, 'size': 1024,
+                                       'claimed': 2, 'delayed': None}
+        self.controller = pooling.PoolStatsController(self.catalog)
+
+    def test_get(self):
+        self.assertEqual({'name': 'a', 'queues': 3,
+                          'messages': {'total': 10, 'claimed': 2,
+                                       'delayed': None},
+                          'size': 1024},
+                         self.controller.get('a'))
+        self.occupancy.assert_called_once_with(detailed=True)
+
+    def test_get_raises_if_pool_does_not_exist(self):
+        self.control.pools_controller.get.side_effect = (
+            errors.PoolDoesNotExist('a'))
+        self.assertRaises(errors.PoolDoesNotExist, self.controller.get, 'a')
+
+    def test_stats_are_cached(self):
+        for i in range(3):
+            self.controller.get('a')
+        self.assertEqual(1, self.occupancy.call_count)
+
+        self.config(pooling_catalog.GROUP_NAME, pool_stats_cache_ttl=0)
+        self.controller.get('a')
+        self.assertEqual(2, self.occupancy.call_count)
+
+    def test_unknown_counters(self):
+        self.control.catalogue_controller.count.side_effect = (
+            NotImplementedError)
+        self.occupancy.side_effect = NotImplementedError
+        self.assertEqual({'name': 'a', 'queues': None,
+                          'messages': {'total': None, 'claimed': None,
+                                       'delayed': None},
+                          'size': None},
+                         self.controller.get('a'))
+
+    def test_list(self):
+        stats = self.controller.list(['a', 'b', 'c'])
+        self.assertEqual(['a', 'b', 'c'], [s['name'] for s in stats])
+        self.assertEqual(3, self.occupancy.call_count)
+
+    def test_list_reports_unavailable_pools(self):
+        self.occupancy.side_effect = [errors.ConnectionError(),
+                                      self.occupancy.return_value]
+        self.config(pooling_catalog.GROUP_NAME, pool_stats_cache_ttl=0)
+        self.controller._lazy__executor = futurist.SynchronousExecutor()
+        down, up = self.controller.list(['down', 'up'])
+        self.assertEqual({'name': 'down', 'queues': None,
+                          'messages': {'total': None, 'claimed': None,
+                                       'delayed': None},
+                          'size': None,
+                          'error': 'Pool stats could not be read.'}, down)
+        self.assertEqual(10, up['messages']['total'])
+        self.assertNotIn('error', up)
+
+
+class MigratingControllersTest(testing.TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.source = mock.Mock()
+        self.destination = mock.Mock()
+
+    def _list(self, messages, next_marker):
+        def list_messages(queue, marker=None, limit=10, **kwargs):
+            yield iter(messages[:limit])
+            yield next_marker
+        return list_messages
+
+    def test_post_goes_to_destination(self):
+        controller = pooling._MigratingMessageController(self.source,
+                                                         self.destination)
+        controller.post('q', [{'body': 1}], 'uuid', project='p')
+        self.destination.post.assert_called_once_with(
+            'q', project='p', messages=[{'body': 1}], client_uuid='uuid')
+        self.assertFalse(self.source.post.called)
+
+    def test_list_spans_both_pools(self):
+        controller = pooling._MigratingMessageController(self.source,
+                                                         self.destination)
+        self.source.list.side_effect = self._list([{'id': 's1'}], 's1')
+        self.destination.list.side_effect = self._list(
+            [{'id': 'd1'}, {'id': 'd2'}], 'd2')
+
+        cursor = controller.list('q', project='p', limit=2)
+        self.assertEqual(['s1', 'd1'], [m['id'] for m in next(cursor)])
+        marker = next(cursor)
+        self.assertEqual('migrating:d2', marker)
+
+        cursor = controller.list('q', project='p', marker=marker, limit=2)
+        self.assertEqual(['d1', 'd2'], [m['id'] for m in next(cursor)])
+        self.assertEqual('d2', self.destination.list.call_args[1]['marker'])
+        self.assertEqual(1, self.source.list.call_count)
+
+    def test_get_falls_back_to_destination(self):
+        controller = pooling._MigratingMessageController(self.source,
+                                                         self.destination)
+        self.source.get.side_effect = errors.MessageDoesNotExist('m', 'q',
+                                                                 'p')
+        self.destination.get.return_value = {'id': 'm'}
+        self.assertEqual({'id': 'm'}, controller.get('q', 'm', project='p'))
+
+        controller.delete('q', 'm', project='p', claim='c')
+        self.destination.delete.assert_called_once_with(
+            'q', project='p', message_id='m', claim='c')
+        self.assertFalse(self.source.delete.called)
+
+    def test_bulk_delete_splits_messages(self):
+        controller = pooling._MigratingMessageController(self.source,
+                                                         self.destination)
+        self.source.bulk_get.return_value = iter([{'id': 's1'}])
+        controller.bulk_delete('q', ['s1', 'd1'], project='p')
+        self.source.bulk_delete.assert_called_once_with(
+            'q', project='p', message_ids=['s1'], claim_ids=None)
+        self.destination.bulk_delete.assert_called_once_with(
+            'q', project='p', message_ids=['d1'], claim_ids=None)
+
+    def test_claims_drain_source_first(self):
+        controller = pooling._MigratingClaimController(self.source,
+                                                       self.destination)
+        self.source.create.return_value = ('c1', iter([{'id': 's1'}]))
+        self.assertEqual(('c1', [{'id': 's1'}]),
+                         controller.create('q', {}, project='p'))
+        self.assertFalse(self.destination.create.called)
+
+        self.source.create.return_value = (None, iter([]))
+        self.destination.create.return_value = ('c2', [{'id': 'd1'}])
+        self.assertEqual(('c2', [{'id': 'd1'}]),
+                         controller.create('q', {}, project='p'))
+
+    def test_stats_are_merged(self):
+        controller = pooling._MigratingQueueController(self.source,
+                                                       self.destination)
+        self.source.stats.return_value = {'messages': {
+            'claimed': 1, 'free': 2, 'total': 3,
+            'oldest': {'age': 30}, 'newest': {'age': 20}}}
+        self.destination.stats.return_value = {'messages': {
+            'claimed': 0, 'free': 1, 'total': 1,
+            'oldest': {'age': 40}, 'newest': {'age': 1}}}
+        self.assertEqual({'messages': {
+            'claimed': 1, 'free': 3, 'total': 4,
+            'oldest': {'age': 40}, 'newest': {'age': 1}}},
+            controller.stats('q', project='p'))
+
+
+class QueueMigrationControllerTest(testing.TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.catalog = pooling.Catalog(self.conf, None, mock.Mock())
+        self.catalogue_ctrl = self.catalog._catalogue_ctrl
+        self.catalogue_ctrl.changes.return_value = (1, [])
+        self.catalogue_ctrl.get.return_value = {'pool': 'a',
+                                                'migrating_to': None}
+        self.drivers = {'a': mock.Mock(), 'b': mock.Mock()}
+        self.catalog.get_driver = lambda pool: self.drivers[pool]
+        self.source = self.drivers['a']._storage
+        self.destination = self.drivers['b']._storage
+        self.source.queue_controller.get_metadata.return_value = {'a': 1}
+        self.metadata = {}
+        self.destination.queue_controller.get_metadata.side_effect = (
+            lambda queue, project=None: self.metadata)
+        self.destination.queue_controller.set_metadata.side_effect = (
+            lambda queue, metadata, project=None: setattr(
+                self, 'metadata', metadata))
+        self._subscriptions([])
+        self.controller = pooling.QueueMigrationController(self.catalog)
+
+    def _messages(self, *messages):
+        def list_messages(queue, project=None, limit=10, **kwargs):
+            yield iter(messages)
+            yield 'marker'
+        return list_messages
+
+    def _subscriptions(self, subscriptions):
+        def list_subscriptions(queue, project=None, marker=None):
+            yield iter([] if marker else subscriptions)
+            yield 'marker'
+        self.source.subscription_controller.list.side_effect = (
+            list_subscriptions)
+
+    def test_start(self):
+        self._subscriptions([{'id': 's', 'subscriber': 'http://x',
+                              'ttl': 100, 'age': 10, 'options': {},
+                              'confirmed': True}])
+        controller = self.destination.subscription_controller
+        controller.create.return_value = 'n'
+
+        self.assertEqual('a', self.controller.start('q', 'b', project='p'))
+        self.destination.queue_controller.create.assert_called_once_with(
+            'q', metadata={'a': 1}, project='p')
+        controller.create.assert_called_once_with('q', 'http://x', 90, {},
+                                                  project='p')
+        controller.confirm.assert_called_once_with('q', 'n', project='p',
+                                                   confirmed=True)
+        self.catalogue_ctrl.migrate.assert_called_once_with('p', 'q', 'b')
+
+    def test_start_to_same_pool(self):
+        self.assertRaises(errors.QueueAlreadyInPool,
+                          self.controller.start, 'q', 'a', project='p')
+
+        self.catalogue_ctrl.get.return_value = {'pool': 'a',
+                                                'migrating_to': 'c'}
+        self.assertRaises(errors.QueueIsMigrating,
+                          self.controller.start, 'q', 'b', project='p')
+        self.assertFalse(self.catalogue_ctrl.migrate.called)
+
+    def test_start_again(self):
+        self._subscriptions([{'id': 's', 'subscriber': 'http://x',
+                              'ttl': 100, 'age': 10, 'options': {}}])
+        self.catalogue_ctrl.get.return_value = {'pool': 'a',
+                                                'migrating_to': 'b'}
+
+        self.assertEqual('a', self.controller.start('q', 'b', project='p'))
+        controller = self.destination.subscription_controller
+        self.assertFalse(controller.create.called)
+        self.assertFalse(self.catalogue_ctrl.migrate.called)
+        self.assertTrue(self.destination.queue_controller.create.called)
+
+    def test_move(self):
+        self.source.claim_controller.create.return_value = (
+            'c', iter([{'id': 'm1', 'body': 1, 'ttl': 100, 'age': 40,
+                        'client_uuid': 'u1'}]))
+        self.assertEqual(1, self.controller.move('q', 'a', 'b', 'p'))
+        self.destination.message_controller.post.assert_called_once_with(
+            'q', [{'body': 1, 'ttl': 60}], 'u1', project='p')
+        self.source.message_controller.bulk_delete.assert_called_once_with(
+            'q', ['m1'], project='p', claim_ids=['c'])
+        self.assertEqual({}, self.metadata)
+
+        self.source.claim_controller.create.return_value = (None, iter([]))
+        self.assertEqual(0, self.controller.move('q', 'a', 'b', 'p'))
+
+    def test_move_records_copied_messages(self):
+        self.source.claim_controller.create.return_value = (
+            'c', iter([{'id': 'm1', 'body': 1, 'ttl': 100, 'age': 0,
+                        'client_uuid': 'u1'}]))
+        self.source.message_controller.bulk_delete.side_effect = (
+            errors.ConnectionError())
+        self.assertRaises(errors.ConnectionError,
+                          self.controller.move, 'q', 'a', 'b', 'p')
+        key = pooling.QueueMigrationController.COPIED_KEY
+        self.assertEqual(['m1'], self.metadata[key])
+
+        # NOTE: Once claimed again, the message is only deleted.
+        self.source.claim_controller.create.return_value = (
+            'c2', iter([{'id': 'm1', 'body': 1, 'ttl': 100, 'age': 0,
+                         'client_uuid': 'u1'},
+                        {'id': 'm2', 'body': 2, 'ttl': 100, 'age': 0,
+                         'client_uuid': 'u1'}]))
+        self.source.message_controller.bulk_delete.side_effect = None
+        self.assertEqual(2, self.controller.move('q', 'a', 'b', 'p'))
+        post = self.destination.message_controller.post
+        self.assertEqual(2, post.call_count)
+        post.assert_called_with('q', [{'body': 2, 'ttl': 100}], 'u1',
+                                project='p')
+        self.source.message_controller.bulk_delete.assert_called_with(
+            'q', ['m1', 'm2'], project='p', claim_ids=['c2'])
+        self.assertNotIn(key, self.metadata)
+
+    def test_move_keeps_clients_and_order(self):
+        self.source.claim_controller.create.return_value = (
+            'c', iter([{'id': 'm%d' % i, 'body': i, 'ttl': 100, 'age': 0,
+                        'client_uuid': client}
+                       for i, client in enumerate('aabba')]))
+        self.assertEqual(5, self.controller.move('q', 'a', 'b', 'p'))
+        posts = [(c[0][1], c[0][2]) for c in
+                 self.destination.message_controller.post.call_args_list]
+        self.assertEqual([([{'body': 0, 'ttl': 100},
+                            {'body': 1, 'ttl': 100}], 'a'),
+                          ([{'body': 2, 'ttl': 100},
+                            {'body': 3, 'ttl': 100}], 'b'),
+                          ([{'body': 4, 'ttl': 100}], 'a')], posts)
+
+    def test_finish_waits_for_source_to_be_empty(self):
+        self.catalogue_ctrl.get.return_value = {'pool': 'a',
+                                                'migrating_to': 'b'}
+        self.source.queue_controller.stats.return_value = {
+            'messages': {'total': 2}}
+        self.source.message_controller.list.side_effect = self._messages(
+            {'id': 'm1'})
+        self.assertFalse(self.controller.finish('q', project='p'))
+        self.assertEqual(2, self.controller.get('q', 'p')['remaining'])
+        self.source.message_controller.list.assert_called_with(
+            'q', project='p', limit=1, echo=True, include_claimed=True,
+            include_delayed=True)
+
+        # NOTE: Expired messages may still be counted by the stats.
+        self.source.message_controller.list.side_effect = self._messages()
+        self.assertTrue(self.controller.finish('q', project='p'))
+        self.catalogue_ctrl.update.assert_called_once_with('p', 'q', 'b')
+        self.assertEqual({'a': 1}, self.metadata)
+
+    def test_list(self):
+        self.catalogue_ctrl.migrations.return_value = iter([])
+        self.assertEqual([], list(self.controller.list('b')))
+        self.catalogue_ctrl.migrations.assert_called_once_with('b')
+
+    def test_routing_during_migration(self):
+        self.catalogue_ctrl.get.return_value = {'pool': 'a',
+                                                'migrating_to': 'b'}
+        controller = self.catalog.get_message_controller('q', 'p')
+        self.assertIsInstance(controller,
+                              pooling._MigratingMessageController)
+        controller = self.catalog.get_subscription_controller('q', 'p')
+        controller.list('q')
+        destination = self.drivers['b'].subscription_controller
+        destination.list.assert_called_once_with('q')
+
+
+class PoolDriversTest(testing.TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.factory = mock.Mock(side_effect=lambda pool_id: mock.Mock(
+            name=pool_id))
+        self.drivers = pooling.PoolDrivers(self.factory, max_size=2,
+                                           idle_timeout=0)
+        self.drivers.CLOSE_DELAY = 0
+
+    def test_drivers_are_cached(self):
+        driver = self.drivers.get('a')
+        self.assertIs(driver, self.drivers.get('a'))
+        self.assertEqual(1, self.factory.call_count)
+
+    def test_least_recently_used_driver_is_closed(self):
+        a = self.drivers.get('a')
+        b = self.drivers.get('b')
+        self.drivers.get('a')
+        self.drivers.get('c')
+        self.assertEqual(2, len(self.drivers))
+        b.close.assert_called_once_with()
+        self.assertFalse(a.close.called)
+        self.assertEqual({'open': 2, 'closing': 0, 'created': 3,
+                          'evicted': 1}, self.drivers.stats())
+
+    def test_evicted_drivers_are_closed_later(self):
+        self.drivers.CLOSE_DELAY = 3600
+        a = self.drivers.get('a')
+        self.drivers.get('b')
+        self.drivers.get('c')
+        self.assertFalse(a.close.called)
+        self.assertEqual(1, self.drivers.stats()['closing'])
+
+        self.drivers.close()
+        a.close.assert_called_once_with()
+        self.assertEqual(0, len(self.drivers))
+
+    def test_evicted_drivers_stop_notifying(self):
+        storage.register_opts(self.conf)
+        self.config(storage.GROUP_NAME,
+                    message_pipeline=['zaqar.notification.notifier'])
+        drivers = pooling.PoolDrivers(
+            lambda pool_id: pipeline.DataDriver(self.conf, mock.Mock(),
+                                                mock.Mock()),
+            max_size=1, idle_timeout=0)
+        drivers.CLOSE_DELAY = 0
+        stages = drivers.get('a').message_controller.stages
+        driver = [stage for stage in stages
+                  if isinstance(stage, notifier.NotifierDriver)][0]
+        driver.dispatcher.submit(time.sleep, 0).result()
+        driver.executor.submit(time.sleep, 0).result()
+
+        drivers.get('b')
+        self.assertFalse(driver.dispatcher.alive)
+        self.assertFalse(driver.executor.alive)
+
+    def test_idle_drivers_are_closed(self):
+        drivers = pooling.PoolDrivers(self.factory, max_size=2,
+                                      idle_timeout=0.01)
+        drivers.CLOSE_DELAY = 0
+        a = drivers.get('a')
+        time.sleep(0.02)
+        drivers.get('b')
+        a.close.assert_called_once_with()
+        self.assertEqual(1, len(drivers))
+
+    def test_failed_creation_is_retried(self):
+        self.factory.side_effect = [errors.ConnectionError(), mock.Mock()]
+        self.assertRaises(errors.ConnectionError, self.drivers.get, 'a')
+        self.assertIsNotNone(self.drivers.get('a'))
+
+    def test_single_flight(self):
+        started = threading.Event()
+        release = threading.Event()
+
+        def factory(pool_id):
+            started.set()
+            release.wait()
+            return mock.Mock()
+
+        self.factory.side_effect = factory
+        results = []
+        threads = [threading.Thread(
+            target=lambda: results.append(self.drivers.get('a')))
+            for i in range(3)]
+        for thread in threads:
+            thread.start()
+        started.wait()
+        release.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(1, self.factory.call_count)
+        self.assertEqual(1, len({id(driver) for driver in results}))
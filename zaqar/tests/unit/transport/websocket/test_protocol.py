@@ -16,12 +16,15 @@
 from unittest import mock
 
 import ddt
+import msgpack
 from oslo_serialization import jsonutils
 from oslo_utils import uuidutils
 
 import zaqar
+from zaqar import tests as testing
 from zaqar.tests.unit.transport.websocket import base
 from zaqar.tests.unit.transport.websocket import utils as test_utils
+from zaqar.transport.websocket import factory
 
 
 @ddt.ddt
@@ -106,3 +109,43 @@ class TestMessagingProtocol(base.TestBase):
             delattr(self.transport, '_lazy_factory')
             self.transport.factory()
             self.assertEqual('ws://[1::4]:9000', mock_pf.mock_calls[0][1][0])
+
+
+class TestNotificationFactory(testing.TestBase):
+
+    def setUp(self):
+        super().setUp()
+        self.message_factory = mock.Mock(_protos={})
+        self.message_factory._loop.call_soon_threadsafe.side_effect = (
+            lambda fn, *args: fn(*args))
+        self.factory = factory.NotificationFactory(self.message_factory)
+
+    def _protocol(self, proto_id, in_binary):
+        proto = mock.Mock(notify_in_binary=in_binary)
+        self.message_factory._protos[proto_id] = proto
+        return proto
+
+    def test_publish(self):
+        text_protos = [self._protocol('text%d' % i, False) for i in range(2)]
+        binary_protos = [self._protocol('bin%d' % i, True) for i in range(2)]
+        notifications = [{'body': {'n': i}, 'queue_name': 'kitkat'}
+                         for i in range(2)]
+        serialized = [jsonutils.dumps(n) for n in notifications]
+
+        with mock.patch.object(factory.msgpack, 'packb',
+                               wraps=msgpack.packb) as mock_packb:
+            self.factory.publish(['text0', 'text1', 'bin0', 'bin1', 'gone'],
+                                 serialized)
+
+        # NOTE: Notifications are packed once for every binary protocol.
+        self.assertEqual(2, mock_packb.call_count)
+        for proto in text_protos:
+            self.assertEqual(notifications,
+                             [jsonutils.loads(call[0][0])
+                              for call in proto.sendMessage.call_args_list])
+            self.assertFalse(proto.sendMessage.call_args[0][1])
+        for proto in binary_protos:
+            self.assertEqual(notifications,
+                             [msgpack.unpackb(call[0][0])
+                              for call in proto.sendMessage.call_args_list])
+            self.assertTrue(proto.sendMessage.call_args[0][1])
@@ -321,7 +321,7 @@ class SubscriptionTest(base.V2Base):
             subscriber['id'], project=self.project_id)
 
         # Send a message in text format
-        webhook_notification_send_mock = mock.patch('requests.post')
+        webhook_notification_send_mock = mock.patch('requests.Session.post')
         self.addCleanup(webhook_notification_send_mock.stop)
         webhook_notification_sender = webhook_notification_send_mock.start()
 
@@ -13,12 +13,15 @@
 # the License.
 
 import contextlib
+from unittest import mock
 
 import ddt
 import falcon
 from oslo_serialization import jsonutils
 from oslo_utils import uuidutils
 
+from zaqar.storage import errors
+from zaqar.storage import pooling
 from zaqar import tests as testing
 from zaqar.tests.unit.transport.wsgi import base
 
@@ -219,6 +222,35 @@ class TestPoolsMongoDB(base.V2Base):
         self.assertIn('options', pool)
         self.assertEqual({}, pool['options'])
 
+    def test_stats_works(self):
+        result = self.simulate_get(self.pool + '/stats')
+        self.assertEqual(falcon.HTTP_200, self.srmock.status)
+        stats = jsonutils.loads(result[0])
+        self.assertEqual(self.pool.rsplit('/', 1)[1], stats['name'])
+        self.assertEqual(0, stats['queues'])
+        self.assertEqual({'total', 'claimed', 'delayed'},
+                         set(stats['messages']))
+        self.assertIn('size', stats)
+
+    def test_stats_of_nonexisting_raises_404(self):
+        self.simulate_get(self.url_prefix + '/pools/nonexisting/stats')
+        self.assertEqual(falcon.HTTP_404, self.srmock.status)
+
+    def test_stats_of_unavailable_pool_raises_503(self):
+        with mock.patch.object(pooling.PoolStatsController, '_stats',
+                               side_effect=errors.ConnectionError()):
+            self.simulate_get(self.pool + '/stats')
+        self.assertEqual(falcon.HTTP_503, self.srmock.status)
+
+    def test_listing_with_stats(self):
+        result = self.simulate_get(self.url_prefix + '/pools',
+                                   query_string='stats=true')
+        self.assertEqual(falcon.HTTP_200, self.srmock.status)
+        results = jsonutils.loads(result[0])
+        for pool in results['pools']:
+            self.assertEqual(pool['name'], pool['stats']['name'])
+        self.assertIn('stats=True', results['links'][0]['href'])
+
     def test_patch_raises_if_missing_fields(self):
         self.simulate_patch(self.pool,
                             body=jsonutils.dumps({'location': 1}))
@@ -21,6 +21,7 @@ from oslo_serialization import jsonutils
 from oslo_utils import uuidutils
 
 from zaqar.common import auth
+from zaqar.notification import health
 from zaqar.notification import notifier
 from zaqar.storage import errors as storage_errors
 from zaqar import tests as testing
@@ -171,6 +172,15 @@ class TestSubscriptionsMongoDB(base.V2Base):
         resp_doc = jsonutils.loads(resp[0])
         self.assertIn('must be a dict', resp_doc['description'])
 
+    @ddt.data('{"batch_size": 0}', '{"batch_size": 101}',
+              '{"batch_size": "10"}', '{"batch_linger_ms": -1}',
+              '{"batch_linger_ms": 60001}', '{"batch_linger_ms": true}')
+    def test_create_invalid_batching_400(self, options):
+        resp = self._create_subscription(options=options)
+        self.assertEqual(falcon.HTTP_400, self.srmock.status)
+        resp_doc = jsonutils.loads(resp[0])
+        self.assertIn('must be an integer between', resp_doc['description'])
+
     def test_create_invalid_ttl(self):
         resp = self._create_subscription(ttl='"invalid"')
         self.assertEqual(falcon.HTTP_400, self.srmock.status)
@@ -301,6 +311,31 @@ class TestSubscriptionsMongoDB(base.V2Base):
         self.assertEqual(sid, resp_doc['id'])
         self.assertEqual(subscriber, resp_doc['subscriber'])
 
+    def test_get_reports_health(self):
+        self._create_subscription()
+        resp = self.simulate_get(self.subscription_path,
+                                 headers=self.headers)
+        sid = jsonutils.loads(resp[0])['subscriptions'][0]['id']
+        path = self.subscription_path + '/' + sid
+
+        resp = self.simulate_get(path, headers=self.headers)
+        self.assertEqual(falcon.HTTP_200, self.srmock.status)
+        self.assertIsNone(jsonutils.loads(resp[0])['health'])
+
+        subscriber_health = health.SubscriberHealth(self.boot.cache,
+                                                    failure_threshold=1)
+        subscriber_health.record(sid, False, 0.5)
+        resp = self.simulate_get(path, headers=self.headers)
+        self.assertEqual(falcon.HTTP_200, self.srmock.status)
+        resp_health = jsonutils.loads(resp[0])['health']
+        self.assertEqual(health.OPEN, resp_health['state'])
+        self.assertEqual(1, resp_health['consecutive_failures'])
+        self.assertEqual(0.5, resp_health['latency'])
+
+        self.simulate_delete(path, headers=self.headers)
+        self.assertEqual(falcon.HTTP_204, self.srmock.status)
+        self.assertIsNone(health.get_published(self.boot.cache, sid))
+
     def test_get_nonexisting_raise_404(self):
         self.simulate_get(self.subscription_path + '/fake',
                           headers=self.headers)
@@ -34,16 +34,21 @@ def register_rules(enforcer):
     enforcer.register_defaults(policies.list_rules())
 
 
-def enforce(rule):
+def check(rule, request):
+    """Enforces a rule for a request, e.g. depending on its parameters."""
     # Late import to prevent cycles
     from zaqar.transport.wsgi import errors
 
+    ctx = request.env['zaqar.context']
+    ENFORCER.enforce(rule, {}, ctx.to_dict(), do_raise=True,
+                     exc=errors.HTTPForbidden)
+
+
+def enforce(rule):
     def decorator(func):
         @functools.wraps(func)
         def handler(*args, **kwargs):
-            ctx = args[1].env['zaqar.context']
-            ENFORCER.enforce(rule, {}, ctx.to_dict(), do_raise=True,
-                             exc=errors.HTTPForbidden)
+            check(rule, args[1])
 
             return func(*args, **kwargs)
         return handler
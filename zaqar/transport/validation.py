@@ -31,6 +31,8 @@ MIN_CLAIM_TTL = 60
 MIN_CLAIM_GRACE = 60
 MIN_DELAY_TTL = 0
 MIN_SUBSCRIPTION_TTL = 60
+MAX_SUBSCRIPTION_BATCH_SIZE = 100
+MAX_SUBSCRIPTION_BATCH_LINGER = 60000
 _PURGBLE_RESOURCE_TYPES = {'messages', 'subscriptions'}
 # NOTE(kgriffs): Don't use \w because it isn't guaranteed to match
 # only ASCII characters.
@@ -212,6 +214,26 @@ class Validator:
                 msg = _('invalid minimum_delay and maximum_delay.')
                 raise ValidationFailed(msg)
 
+    def _validate_batching(self, options):
+        if not options:
+            return
+
+        batch_size = options.get('batch_size')
+        if batch_size is not None:
+            if (not isinstance(batch_size, int) or
+                    isinstance(batch_size, bool) or
+                    not 1 <= batch_size <= MAX_SUBSCRIPTION_BATCH_SIZE):
+                msg = _('batch_size must be an integer between 1 and {0}.')
+                raise ValidationFailed(msg, MAX_SUBSCRIPTION_BATCH_SIZE)
+
+        linger = options.get('batch_linger_ms')
+        if linger is not None:
+            if (not isinstance(linger, int) or isinstance(linger, bool) or
+                    not 0 <= linger <= MAX_SUBSCRIPTION_BATCH_LINGER):
+                msg = _('batch_linger_ms must be an integer between 0 '
+                        'and {0}.')
+                raise ValidationFailed(msg, MAX_SUBSCRIPTION_BATCH_LINGER)
+
     def queue_patching(self, request, changes):
         washed_changes = []
         content_types = {
@@ -581,6 +603,7 @@ class Validator:
             raise ValidationFailed(msg)
 
         self._validate_retry_policy(options)
+        self._validate_batching(options)
 
         ttl = subscription.get('ttl')
         if ttl:
@@ -22,6 +22,7 @@ from oslo_utils import netutils
 from zaqar.common import decorators
 from zaqar.conf import drivers_transport_websocket
 from zaqar.i18n import _
+from zaqar.notification import notifier
 from zaqar.transport import base
 from zaqar.transport.middleware import auth
 from zaqar.transport.websocket import factory
@@ -36,6 +37,7 @@ class Driver(base.DriverBase):
         super().__init__(conf, None, None, None)
         self._api = api
         self._cache = cache
+        self._subscription_url = None
 
         self._conf.register_opts(drivers_transport_websocket.ALL_OPTS,
                                  group=drivers_transport_websocket.GROUP_NAME)
@@ -92,10 +94,15 @@ class Driver(base.DriverBase):
                 host = self._ws_conf.notification_bind
             else:
                 host = socket.gethostname()
-            self.notification_factory.set_subscription_url(
-                'http://{}:{}/'.format(netutils.escape_ipv6(host), port))
+            url = 'http://{}:{}/'.format(netutils.escape_ipv6(host), port)
+            self.notification_factory.set_subscription_url(url)
             self._api.set_subscription_factory(self.notification_factory)
 
+            # NOTE: Subscribers of this server get the notifications of the
+            # notifier running in this process without the loopback.
+            notifier.channels.register(url, self.notification_factory)
+            self._subscription_url = url
+
         task = asyncio.Task(coro_notification)
         task.add_done_callback(got_server)
 
@@ -106,4 +113,6 @@ class Driver(base.DriverBase):
         except KeyboardInterrupt:
             pass
         finally:
+            if self._subscription_url is not None:
+                notifier.channels.unregister(self._subscription_url)
             loop.close()
@@ -64,13 +64,42 @@ class NotificationFactory:
         return '{}{}'.format(self._subscription_url, protocol.proto_id)
 
     def send_data(self, data, proto_id):
-        instance = self.message_factory._protos.get(proto_id)
-        if instance:
+        self._send([proto_id], [data])
+
+    def publish(self, proto_ids, serialized):
+        """Sends notifications to the protocols of this process.
+
+        This is the in-memory channel the notifier uses when it runs in
+        the same process. It is called from the notifier workers, so the
+        notifications are sent from the event loop.
+
+        :param proto_ids: IDs of the protocols to notify.
+        :param serialized: Notifications, serialized in JSON.
+        """
+        self.message_factory._loop.call_soon_threadsafe(
+            self._send, proto_ids, [data.encode('utf-8')
+                                    for data in serialized])
+
+    def _send(self, proto_ids, payloads):
+        # NOTE: Notifications are encoded once per format, whatever the
+        # amount of protocols getting them.
+        binary = None
+        for proto_id in proto_ids:
+            instance = self.message_factory._protos.get(proto_id)
+            if not instance:
+                continue
+
             # NOTE(Eva-i): incoming data is encoded in JSON, let's convert it
             # to MsgPack, if notification should be encoded in binary format.
             if instance.notify_in_binary:
-                data = msgpack.packb(jsonutils.loads(data))
-            instance.sendMessage(data, instance.notify_in_binary)
+                if binary is None:
+                    binary = [msgpack.packb(jsonutils.loads(data))
+                              for data in payloads]
+                data = binary
+            else:
+                data = payloads
+            for payload in data:
+                instance.sendMessage(payload, instance.notify_in_binary)
 
     def __call__(self):
         return self.protocol(self)
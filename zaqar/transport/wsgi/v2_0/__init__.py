@@ -116,7 +116,8 @@ def public_endpoints(driver, conf):
 
         ('/queues/{queue_name}/subscriptions/{subscription_id}',
          subscriptions.ItemResource(driver._validate,
-                                    subscription_controller)),
+                                    subscription_controller,
+                                    driver._cache)),
 
         ('/queues/{queue_name}/subscriptions/{subscription_id}/confirm',
          subscriptions.ConfirmResource(driver._validate,
@@ -157,7 +158,8 @@ def public_endpoints(driver, conf):
 
         ('/topics/{topic_name}/subscriptions/{subscription_id}',
          subscriptions.ItemResource(driver._validate,
-                                    subscription_controller)),
+                                    subscription_controller,
+                                    driver._cache)),
 
         ('/topics/{topic_name}/subscriptions/{subscription_id}/confirm',
          subscriptions.ConfirmResource(driver._validate,
@@ -182,9 +184,15 @@ def private_endpoints(driver, conf):
 
         catalogue.extend([
             ('/pools',
-             pools.Listing(pools_controller, validate)),
+             pools.Listing(pools_controller, validate,
+                           driver._storage.pool_stats_controller)),
             ('/pools/{pool}',
              pools.Resource(pools_controller)),
+            ('/pools/{pool}/migrations',
+             pools.Migrations(driver._storage.migration_controller,
+                              conf)),
+            ('/pools/{pool}/stats',
+             pools.Stats(driver._storage.pool_stats_controller)),
             ('/flavors',
              flavors.Listing(flavors_controller, pools_controller,
                              validate)),
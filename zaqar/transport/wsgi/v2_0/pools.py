@@ -37,12 +37,14 @@ registered, there is an optional field:
 """
 
 import falcon
+import futurist
 import jsonschema
 from oslo_log import log
 
 from zaqar.common.api.schemas import pools as schema
 from zaqar.common import decorators
 from zaqar.common import utils as common_utils
+from zaqar.conf import pooling_catalog
 from zaqar.i18n import _
 from zaqar.storage import errors
 from zaqar.storage import utils as storage_utils
@@ -61,9 +63,11 @@ class Listing:
     :param pools_controller: means to interact with storage
     """
 
-    def __init__(self, pools_controller, validate):
+    def __init__(self, pools_controller, validate,
+                 pool_stats_controller=None):
         self._ctrl = pools_controller
         self._validate = validate
+        self._stats_ctrl = pool_stats_controller
 
     @decorators.TransportLog("Pools collection")
     @acl.enforce("pools:get_all")
@@ -82,6 +86,10 @@ class Listing:
                 ]
             }
 
+        With `stats=true`, each pool also gets the `stats` reported by
+        the stats of a pool. The counts of the pools whose stats couldn't
+        be read are null, and their stats have an `error` field.
+
         :returns: HTTP | 200
         """
 
@@ -91,6 +99,12 @@ class Listing:
         request.get_param('marker', store=store)
         request.get_param_as_int('limit', store=store)
         request.get_param_as_bool('detailed', store=store)
+        with_stats = request.get_param_as_bool('stats') or False
+        if with_stats:
+            if self._stats_ctrl is None:
+                raise wsgi_errors.HTTPBadRequestAPI(
+                    _('Pool stats are not available.'))
+            acl.check("pools:get_stats", request)
 
         try:
             self._validate.pool_listing(**store)
@@ -109,6 +123,13 @@ class Listing:
             for entry in pools:
                 entry['href'] = request.path + '/' + entry['name']
 
+            if with_stats:
+                names = [entry['name'] for entry in pools]
+                for entry, stats in zip(pools,
+                                        self._stats_ctrl.list(names)):
+                    entry['stats'] = stats
+                store['stats'] = True
+
             results['links'] = [
                 {
                     'rel': 'next',
@@ -210,6 +231,9 @@ class Resource:
     def on_delete(self, request, response, project_id, pool):
         """Deregisters a pool.
 
+        Pools used by a flavor or that a queue is migrating to can't be
+        deleted.
+
         :returns: HTTP | [204, 403]
         """
 
@@ -224,6 +248,10 @@ class Resource:
             description = description.format(flavor=ex.flavor)
             LOG.exception(description)
             raise falcon.HTTPForbidden(title=title, description=description)
+        except errors.PoolInUseByMigration as ex:
+            LOG.debug(ex)
+            raise falcon.HTTPForbidden(title=_('Unable to delete'),
+                                       description=str(ex))
 
         response.status = falcon.HTTP_204
 
@@ -275,3 +303,167 @@ class Resource:
 
         resp_data['href'] = request.path
         response.text = transport_utils.to_json(resp_data)
+
+
+class Stats:
+    """A handler for the stats of a pool.
+
+    :param pool_stats_controller: means to read the stats of the pools
+    """
+
+    def __init__(self, pool_stats_controller):
+        self._ctrl = pool_stats_controller
+
+    @decorators.TransportLog("Pools stats")
+    @acl.enforce("pools:get_stats")
+    def on_get(self, request, response, project_id, pool):
+        """Reports the queues and messages held by this pool:
+
+        ::
+
+            {"name": "", "queues": 0,
+             "messages": {"total": 0, "claimed": 0, "delayed": 0},
+             "size": 0}
+
+        Counts are read from the counters kept by the storage of the
+        pool, those it doesn't keep are null. They may be a little stale,
+        since they're cached for `pool_stats_cache_ttl` seconds.
+
+        :returns: HTTP | [200, 404, 503]
+        """
+
+        LOG.debug('GET pool stats - name: %s', pool)
+
+        try:
+            data = self._ctrl.get(pool)
+        except errors.PoolDoesNotExist as ex:
+            LOG.debug(ex)
+            raise wsgi_errors.HTTPNotFound(str(ex))
+        except Exception:
+            description = _('Pool stats could not be read.')
+            LOG.exception(description)
+            raise wsgi_errors.HTTPServiceUnavailable(description)
+
+        response.text = transport_utils.to_json(data)
+
+
+class Migrations:
+    """A handler for the migrations of queues to a pool.
+
+    :param migration_controller: means to migrate queues between pools
+    :param conf: Configuration from which to read the migration options
+    """
+
+    def __init__(self, migration_controller, conf):
+        self._ctrl = migration_controller
+        conf.register_opts(pooling_catalog.ALL_OPTS,
+                           group=pooling_catalog.GROUP_NAME)
+        self._conf = conf[pooling_catalog.GROUP_NAME]
+        self._validator = jsonschema.Draft4Validator(schema.migrate)
+
+        # NOTE: Migrations are recorded in the catalogue, resume those
+        # interrupted when the API workers were stopped. Every worker
+        # resumes them, moves are safe to run concurrently.
+        self._executor.submit(self._resume)
+
+    @decorators.lazy_property(write=False)
+    def _executor(self):
+        return futurist.ThreadPoolExecutor(max_workers=1)
+
+    def _resume(self):
+        try:
+            migrations = list(self._ctrl.list())
+        except NotImplementedError:
+            return
+        except Exception:
+            LOG.exception('Failed to list the migrations to resume')
+            return
+
+        for migration in migrations:
+            LOG.info('Resuming the migration of queue %(queue)s of '
+                     'project %(project)s to pool %(migrating_to)s',
+                     migration)
+            self._run(migration['queue'], migration['migrating_to'],
+                      migration['project'])
+
+    def _run(self, queue, pool, project):
+        try:
+            self._ctrl.run(queue, pool, project=project,
+                           batch_size=self._conf.migration_batch_size,
+                           interval=self._conf.migration_interval)
+        except errors.QueueAlreadyInPool:
+            # NOTE: Another worker completed the migration meanwhile.
+            pass
+        except Exception:
+            LOG.exception('Failed to migrate queue %(queue)s of project '
+                          '%(project)s to pool %(pool)s',
+                          {'queue': queue, 'project': project,
+                           'pool': pool})
+
+    @decorators.TransportLog("Pools migrations")
+    @acl.enforce("pools:migrate")
+    def on_post(self, request, response, project_id, pool):
+        """Starts migrating a queue to this pool.
+
+        Expects the following input:
+
+        ::
+
+            {"queue": "", "project": ""}
+
+        The messages of the queue are moved in the background, the
+        progress of the migration is reported by GET requests.
+
+        :returns: HTTP | [202, 400, 404, 409]
+        """
+
+        LOG.debug('POST pool migration - name: %s', pool)
+        data = wsgi_utils.load(request)
+        wsgi_utils.validate(self._validator, data)
+        queue, project = data['queue'], data.get('project')
+
+        try:
+            self._ctrl.start(queue, pool, project=project)
+        except (errors.QueueNotMapped, errors.PoolDoesNotExist) as ex:
+            LOG.debug(ex)
+            raise wsgi_errors.HTTPNotFound(str(ex))
+        except errors.NotPermitted as ex:
+            LOG.debug(ex)
+            raise wsgi_errors.HTTPConflict(str(ex))
+
+        self._executor.submit(self._run, queue, pool, project)
+
+        response.status = falcon.HTTP_202
+        response.location = request.path + falcon.to_query_str(
+            {'queue': queue, 'project': project})
+
+    @decorators.TransportLog("Pools migrations")
+    @acl.enforce("pools:get_migration")
+    def on_get(self, request, response, project_id, pool):
+        """Reports the progress of the migration of a queue to this pool:
+
+        ::
+
+            {"queue": "", "project": "", "pool": "", "migrating_to": "",
+             "remaining": 0}
+
+        `migrating_to` is null once the migration is done.
+
+        :returns: HTTP | [200, 400, 404]
+        """
+
+        queue = request.get_param('queue', required=True)
+        project = request.get_param('project')
+        LOG.debug('GET pool migration - name: %s, queue: %s', pool, queue)
+
+        try:
+            data = self._ctrl.get(queue, project=project)
+        except errors.QueueNotMapped as ex:
+            LOG.debug(ex)
+            raise wsgi_errors.HTTPNotFound(str(ex))
+
+        if pool not in (data['pool'], data['migrating_to']):
+            raise wsgi_errors.HTTPNotFound(
+                'Queue {} is not migrating to pool {}'.format(queue, pool))
+
+        response.text = transport_utils.to_json(data)
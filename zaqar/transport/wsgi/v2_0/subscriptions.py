@@ -18,10 +18,10 @@ import falcon
 from oslo_log import log as logging
 from oslo_utils import netutils
 from oslo_utils import timeutils
-from stevedore import driver
 
 from zaqar.common import decorators
 from zaqar.i18n import _
+from zaqar.notification import health
 from zaqar.notification import notifier
 from zaqar.storage import errors as storage_errors
 from zaqar.transport import acl
@@ -36,11 +36,12 @@ LOG = logging.getLogger(__name__)
 
 class ItemResource:
 
-    __slots__ = ('_validate', '_subscription_controller')
+    __slots__ = ('_validate', '_subscription_controller', '_cache')
 
-    def __init__(self, validate, subscription_controller):
+    def __init__(self, validate, subscription_controller, cache=None):
         self._validate = validate
         self._subscription_controller = subscription_controller
+        self._cache = cache
 
     @decorators.TransportLog("Subscriptions item")
     @acl.enforce("subscription:get")
@@ -59,6 +60,15 @@ class ItemResource:
             LOG.exception(description)
             raise wsgi_errors.HTTPServiceUnavailable(description)
 
+        # NOTE: Let the owner see why notifications may be dropped.
+        if self._cache is not None:
+            try:
+                resp_dict['health'] = health.get_published(self._cache,
+                                                           subscription_id)
+            except Exception:
+                LOG.exception('Failed to read the health of subscription '
+                              '%s', subscription_id)
+
         resp.text = utils.to_json(resp_dict)
         # status defaults to 200
 
@@ -187,11 +197,10 @@ class CollectionResource:
             options = document.get('options', {})
             url = netutils.urlsplit(subscriber)
             ttl = document.get('ttl', self._default_subscription_ttl)
-            mgr = driver.DriverManager('zaqar.notification.tasks', url.scheme,
-                                       invoke_on_load=True)
+            task = notifier.registry.get(url.scheme)
             req_data = req.headers.copy()
             req_data.update(req.env)
-            mgr.driver.register(subscriber, options, ttl, project_id, req_data)
+            task.register(subscriber, options, ttl, project_id, req_data)
 
             created = self._subscription_controller.create(queue_name,
                                                            subscriber,